@@ -0,0 +1,206 @@
+###
+# IMPORTS AND CONFIGURATION
+#
+# Cache of Genie answers to repeated questions. Entries are keyed by space,
+# normalized question text and the caller's permission scope, so one user is
+# never served an answer computed with another user's data access. An entry
+# is fresh for ANSWER_CACHE_TTL_SECONDS; after that it is still served for up
+# to ANSWER_CACHE_STALE_SECONDS while a fresh answer is fetched in the
+# background (stale-while-revalidate).
+###
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+from cache_maintenance import ManagedCache
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_DIR = os.environ.get("ANSWER_CACHE_DIR", "./answer_cache")
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "900"))
+ANSWER_CACHE_STALE_SECONDS = int(os.environ.get("ANSWER_CACHE_STALE_SECONDS", "86400"))
+ANSWER_CACHE_SIZE_LIMIT_MB = int(os.environ.get("ANSWER_CACHE_SIZE_LIMIT_MB", "1024"))
+ANSWER_CACHE_REFRESH_WORKERS = int(os.environ.get("ANSWER_CACHE_REFRESH_WORKERS", "4"))
+# A refresh that has not finished after this long no longer blocks a new one.
+ANSWER_CACHE_REFRESH_LOCK_SECONDS = int(os.environ.get("ANSWER_CACHE_REFRESH_LOCK_SECONDS", "600"))
+
+ANSWER_STAT_NAMES = ("hits", "stale_hits", "misses", "refreshes", "refresh_errors", "saved_ms", "evictions")
+
+# The value genie_query returns: (conversation_id, response, query_text, description).
+Answer = Tuple[Optional[str], Any, Optional[str], Optional[str]]
+
+
+###
+# FUNCTION: normalize_question
+#
+# Case-folds the question, normalizes Unicode and whitespace, and drops
+# trailing punctuation, so "Top 10 customers?" and "top 10  customers"
+# share an entry.
+###
+def normalize_question(question: str) -> str:
+    text = unicodedata.normalize("NFKC", question or "").casefold()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?!.")
+
+
+###
+# FUNCTION: permission_scope
+#
+# Identifies whose data access an answer was computed with: the signed-in
+# user's email when the auth proxy provides one, otherwise a hash of the
+# user's token. Returns None when neither is known, which disables caching.
+###
+def permission_scope(email: Optional[str], token: Optional[str]) -> Optional[str]:
+    if email:
+        return f"user:{email.lower()}"
+    if token:
+        return f"token:{hashlib.sha256(token.encode()).hexdigest()}"
+    return None
+
+
+###
+# CachedAnswer CLASS
+#
+# An answer read from the cache, with its age and whether it is stale.
+###
+@dataclass
+class CachedAnswer:
+    answer: Answer
+    fetched_at: float
+    fetch_seconds: float
+    stale: bool
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.fetched_at
+
+
+###
+# AnswerCache CLASS
+#
+# Stores answers in a ManagedCache shared by all processes. Reads happen in
+# whichever process handles the question; background refreshes run on a
+# thread pool and so must be started from the long-lived server process.
+###
+class AnswerCache:
+    def __init__(self, directory: str = ANSWER_CACHE_DIR, ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS,
+                 stale_seconds: int = ANSWER_CACHE_STALE_SECONDS, size_limit_mb: int = ANSWER_CACHE_SIZE_LIMIT_MB,
+                 refresh_workers: int = ANSWER_CACHE_REFRESH_WORKERS):
+        self.cache = ManagedCache(directory, default_expire=ttl_seconds + stale_seconds, size_limit=size_limit_mb * 2**20)
+        self.ttl_seconds = ttl_seconds
+        self.refresh_workers = refresh_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(space_id: str, question: str, scope: str) -> str:
+        raw = "\x1f".join((space_id or "", scope, normalize_question(question)))
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    ###
+    # METHOD: is_cacheable
+    #
+    # Only completed query answers are cached (for multi-part answers, ones
+    # with at least one table). Text replies cannot be told apart from error
+    # messages, and failed calls have no conversation ID.
+    ###
+    @staticmethod
+    def is_cacheable(answer: Answer) -> bool:
+        conversation_id, response = answer[0], answer[1]
+        results = [part[0] for part in response] if isinstance(response, list) else [response]
+        return bool(conversation_id) and any(isinstance(r, pd.DataFrame) and not r.empty for r in results)
+
+    ###
+    # METHOD: get
+    #
+    # Returns the cached answer, marked stale once past the TTL, or None on a
+    # miss. Hits add the original fetch time to the "time saved" counter.
+    ###
+    def get(self, space_id: str, question: str, scope: Optional[str]) -> Optional[CachedAnswer]:
+        if not scope:
+            return None
+        entry = self.cache.get(self.key(space_id, question, scope))
+        if entry is None:
+            self.cache.record("misses")
+            return None
+        cached = CachedAnswer(answer=entry["answer"], fetched_at=entry["fetched_at"],
+                              fetch_seconds=entry["fetch_seconds"], stale=False)
+        cached.stale = cached.age_seconds > self.ttl_seconds
+        self.cache.record("stale_hits" if cached.stale else "hits")
+        self.cache.record("saved_ms", int(cached.fetch_seconds * 1000))
+        return cached
+
+    ###
+    # METHOD: put
+    #
+    # Stores an answer if it is cacheable. `fetch_seconds` is how long it took
+    # to get from Genie and is what a later hit saves.
+    ###
+    def put(self, space_id: str, question: str, scope: Optional[str], answer: Answer, fetch_seconds: float) -> bool:
+        if not scope or not self.is_cacheable(answer):
+            return False
+        entry = {"answer": answer, "fetched_at": time.time(), "fetch_seconds": fetch_seconds}
+        self.cache.set(self.key(space_id, question, scope), entry)
+        return True
+
+    ###
+    # METHOD: refresh_async
+    #
+    # Fetches a fresh answer in the background with `fetch` (a callable
+    # returning an Answer) and stores it. Only one refresh per entry runs at a
+    # time across all processes; returns False if one is already running.
+    ###
+    def refresh_async(self, space_id: str, question: str, scope: Optional[str], fetch: Callable[[], Answer]) -> bool:
+        if not scope:
+            return False
+        lock_key = f"__refreshing__:{self.key(space_id, question, scope)}"
+        if not self.cache.meta.add(lock_key, True, expire=ANSWER_CACHE_REFRESH_LOCK_SECONDS):
+            return False
+        self._get_executor().submit(self._refresh, space_id, question, scope, fetch, lock_key)
+        return True
+
+    def _refresh(self, space_id: str, question: str, scope: str, fetch: Callable[[], Answer], lock_key: str) -> None:
+        start = time.monotonic()
+        try:
+            answer = fetch()
+            if self.put(space_id, question, scope, answer, time.monotonic() - start):
+                self.cache.record("refreshes")
+                logger.info(f"Refreshed cached answer in {time.monotonic() - start:.1f}s")
+            else:
+                self.cache.record("refresh_errors")
+                logger.warning("Answer refresh returned no cacheable result; keeping the stale answer")
+        except Exception as e:
+            self.cache.record("refresh_errors")
+            logger.error(f"Answer refresh failed: {e}")
+        finally:
+            self.cache.meta.delete(lock_key)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.refresh_workers, thread_name_prefix="answer-refresh")
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    ###
+    # METHOD: stats
+    #
+    # Returns the counters plus the overall hit rate and seconds saved.
+    ###
+    def stats(self) -> Dict[str, Any]:
+        result = self.cache.stats(ANSWER_STAT_NAMES)
+        served = result["hits"] + result["stale_hits"]
+        lookups = served + result["misses"]
+        result["hit_rate"] = served / lookups if lookups else 0.0
+        result["seconds_saved"] = result["saved_ms"] / 1000
+        return result
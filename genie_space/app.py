@@ -4,27 +4,39 @@
 # This section imports all necessary libraries for the Dash application,
 # including Dash itself, Dash Bootstrap Components for styling, pandas for
 # data manipulation, and other utilities for handling environment variables,
-# API calls, and logging.
+# API calls, and logging. The Databricks SDK is not imported here: it takes
+# about as long to import as everything else together, so it is loaded on
+# first use, or ahead of time by `warm_up` in the serving process.
 ###
 import dash
-from dash import html, dcc, Input, Output, State, callback, ALL, MATCH, callback_context, no_update, clientside_callback, dash_table, DiskcacheManager
+from dash import html, dcc, Input, Output, State, callback, ALL, MATCH, callback_context, no_update, clientside_callback, DiskcacheManager, Patch, set_props
 import dash_bootstrap_components as dbc
+import dash_ag_grid as dag
 import json
 import pandas as pd
 import os
 import uuid
-import sqlparse
+import time
+import threading
 import logging
-from flask import request
-from io import StringIO
+import hmac
+from flask import Response, abort, request, send_file
 from dotenv import load_dotenv
-from databricks.sdk import WorkspaceClient
-from databricks.sdk.service.serving import ChatMessage, ChatMessageRole
-from databricks.sdk.config import Config
-from databricks.sdk.errors import DatabricksError
-from genie_room import genie_query, GenieClient
-from flask_caching import Cache
-import diskcache
+from genie_room import genie_query, get_genie_client, add_throttle_listener, genie_circuit_open, cancel_genie_message
+from genie_scheduler import GenieScheduler, QueueTimeout, PRIORITY_INTERACTIVE, PRIORITY_INSIGHT, PRIORITY_PREFETCH
+from table_store import TableStore
+from table_export import EXPORT_FORMATS, TableExporter
+from full_export import FULL_EXPORT_MIMETYPE, DONE, FAILED, FullExporter
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as METRICS, Family
+from resilience import BREAKER_STATES, databricks_error_type, get_resilience
+from cache_maintenance import ManagedCache, CacheCuller, CALLBACK_CACHE_SIZE_LIMIT_MB, CALLBACK_CACHE_TTL_SECONDS
+from row_model import RowModel, column_defs, GRID_BLOCK_SIZE
+from conversation_store import ConversationStore
+from answer_cache import AnswerCache, permission_scope
+from spaces_catalog import SpacesCatalog
+from table_summary import table_for_prompt, INSIGHT_TABLE_TOKEN_BUDGET
+from insight_cache import InsightCache
+from insights import INSIGHTS_STREAMING, InsightTiming, describe_insight_error, insights_circuit_open, query_insights, stream_insights
 
 # Load environment variables from a .env file for configuration.
 load_dotenv()
@@ -33,6 +45,32 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Overall time budget for one Genie question, passed down to the poll loop.
+GENIE_QUERY_TIMEOUT_SECONDS = int(os.environ.get("GENIE_QUERY_TIMEOUT_SECONDS", "300"))
+
+# Minimum time between pushes of streamed insight text to the browser; the
+# insight callback is polled at the same interval.
+INSIGHT_STREAM_PUSH_SECONDS = float(os.environ.get("INSIGHT_STREAM_PUSH_SECONDS", "0.5"))
+
+# /metrics shows space IDs, queues and breaker states of every user, so it is
+# only served to a scraper sending METRICS_TOKEN in an X-Metrics-Token header
+# or to the signed-in users listed (comma-separated) in METRICS_ALLOWED_USERS.
+# With neither set, the route does not exist.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_ALLOWED_USERS = {user.strip().lower() for user in os.environ.get("METRICS_ALLOWED_USERS", "").split(",") if user.strip()}
+
+# Shown when a result table has expired or been evicted from the table store.
+TABLE_EXPIRED_MESSAGE = "This table is no longer available on the server (it expired or was evicted to free space). Ask the question again to reload it."
+INSIGHTS_BUSY_MESSAGE = "The analysis service is busy right now. Please try again in a minute."
+# Clicks that abandon the current chat and cancel its background jobs.
+CANCEL_INPUTS = [Input("new-chat-button", "n_clicks"),
+                 Input("sidebar-new-chat-button", "n_clicks"),
+                 Input("change-space-button", "n_clicks")]
+# Questions being answered are registered in the callback cache under this
+# prefix plus the client ID, so they can be cancelled on Genie's side.
+INFLIGHT_PREFIX = "inflight:"
+INSIGHTS_UNAVAILABLE_MESSAGE = "The analysis service is temporarily unavailable. Please try again in a minute."
+
 ###
 # SERVER-SIDE CACHE
 #
@@ -51,14 +89,152 @@ logger = logging.getLogger(__name__)
 # for Bootstrap theming and a title for the browser tab.
 ###
 
-# Initialize diskcache for long callbacks
-# This will store background callback results in a 'cache' directory
-cache_disk = diskcache.Cache("./cache")
-long_callback_manager = DiskcacheManager(cache_disk)
+###
+# BackgroundCallbackManager CLASS
+#
+# Dash's DiskcacheManager, tolerating background-callback processes that exit
+# while a poll looks at them. A forkserver reaps them as soon as they exit,
+# so one can disappear between Dash's check that it exists and its next look
+# at the process. And a job that stores its result and exits just after the
+# poll found no result would be taken for a cancelled one, dropping the
+# answer; it is reported as still running instead, so the next poll
+# collects the result.
+###
+class BackgroundCallbackManager(DiskcacheManager):
+    def __init__(self, cache, **kwargs):
+        super().__init__(cache, **kwargs)
+        self._polled = threading.local()
+
+    def get_result(self, key, job):
+        result = super().get_result(key, job)
+        self._polled.pending_key = key if result is self.UNDEFINED else None
+        return result
+
+    def job_running(self, job):
+        import psutil
+        try:
+            running = super().job_running(job)
+        except psutil.NoSuchProcess:
+            running = False
+        pending_key, self._polled.pending_key = getattr(self._polled, "pending_key", None), None
+        return running or (pending_key is not None and self.result_ready(pending_key))
+
+    def terminate_job(self, job):
+        import psutil
+        try:
+            super().terminate_job(job)
+        except psutil.NoSuchProcess:
+            pass
 
-# Initialize a separate diskcache for DataFrames to be shared across processes
-# This will be used instead of the in-memory DATAFRAME_CACHE dictionary
-df_cache_for_long_callbacks = diskcache.Cache("./dataframe_cache")
+
+# Initialize diskcache for long callbacks
+# This will store background callback results in a 'cache' directory. Results
+# that are never collected (e.g. the browser was closed) expire after a TTL,
+# and the directory is culled back under its size limit.
+cache_disk = ManagedCache("./cache", default_expire=CALLBACK_CACHE_TTL_SECONDS,
+                          size_limit=CALLBACK_CACHE_SIZE_LIMIT_MB * 2**20, eviction_policy="least-recently-stored")
+long_callback_manager = BackgroundCallbackManager(cache_disk)
+
+# Initialize a separate store for DataFrames to be shared across processes.
+# Tables are kept as compressed Arrow IPC files so dtypes survive the round
+# trip and reads are memory-mapped instead of re-parsing CSV text.
+df_cache_for_long_callbacks = TableStore("./dataframe_cache")
+# Streams stored tables as CSV, Parquet or Excel downloads and keeps the
+# finished files for repeat and range requests (see `download_table`).
+table_exporter = TableExporter(df_cache_for_long_callbacks)
+full_exporter = FullExporter()
+
+# Serves result-table rows to the grids on demand (paging, sorting and
+# filtering happen server-side against the table store).
+result_row_model = RowModel(df_cache_for_long_callbacks)
+
+# Generated insights, keyed by a hash of the table text, prompt and endpoint
+# and shared by all processes.
+insight_cache = InsightCache()
+
+# Answers to repeated questions on a new conversation, per space and user.
+# Stale answers are served immediately and refreshed in the server process.
+answer_cache = AnswerCache()
+
+# Per-user catalogs of Genie spaces for the agent-selection dropdown.
+spaces_catalog = SpacesCatalog()
+
+# Admission control for Genie questions and insights, shared by all
+# processes: concurrency limits per user, per space and overall, a token
+# bucket for new Genie questions (emptied when Genie answers 429), and a
+# priority queue that puts interactive questions ahead of insights and
+# background refreshes.
+genie_scheduler = GenieScheduler()
+add_throttle_listener(genie_scheduler.throttle)
+
+# Culls expired and over-limit entries from the disk caches on a background
+# thread of the server process (started by `init_server_process`).
+cache_culler = CacheCuller()
+cache_culler.add("callback", cache_disk)
+cache_culler.add("table", df_cache_for_long_callbacks.cache)
+cache_culler.add("answer", answer_cache.cache)
+cache_culler.add("insight", insight_cache.cache)
+cache_culler.add("spaces", spaces_catalog.cache)
+cache_culler.add("export", table_exporter.cache)
+cache_culler.add("full_export", full_exporter.cache)
+
+###
+# FUNCTION: collect_service_metrics
+#
+# Metrics read at scrape time (see the /metrics route): disk cache sizes and
+# counters, the scheduler's queues, circuit breakers and the retry budget,
+# and full-export jobs.
+###
+def collect_service_metrics():
+    caches = [(name, cache.stats()) for name, cache in cache_culler.caches]
+    yield Family("app_cache_entries", "gauge", "Entries in each disk cache.",
+                 [({"cache": name}, stats["entries"]) for name, stats in caches])
+    yield Family("app_cache_bytes", "gauge", "Bytes on disk of each disk cache.",
+                 [({"cache": name}, stats["bytes"]) for name, stats in caches])
+    yield Family("app_cache_events", "counter", "Hits, misses and evictions of each disk cache.",
+                 [({"cache": name, "event": event}, stats[event]) for name, stats in caches for event in ("hits", "misses", "evictions")])
+    answers = answer_cache.stats()
+    yield Family("answer_cache_events", "counter", "Stale hits and refreshes of the answer cache.",
+                 [({"event": event}, answers[event]) for event in ("stale_hits", "refreshes", "refresh_errors")])
+    yield Family("answer_cache_seconds_saved", "counter", "Genie time saved by serving cached answers.",
+                 [({}, answers["seconds_saved"])])
+
+    scheduler = genie_scheduler.stats()
+    yield Family("genie_scheduler_queued", "gauge", "Work waiting for admission, by priority.",
+                 [({"priority": priority}, count) for priority, count in scheduler["queued"].items()])
+    yield Family("genie_scheduler_running", "gauge", "Admitted work, by priority.",
+                 [({"priority": priority}, count) for priority, count in scheduler["running"].items()])
+    yield Family("genie_scheduler_rate_tokens", "gauge", "Tokens left in the Genie rate bucket.", [({}, scheduler["tokens"])])
+    yield Family("genie_scheduler_throttled_seconds", "gauge", "Seconds until new questions may start after a 429.",
+                 [({}, scheduler["throttled_for"])])
+    yield Family("genie_scheduler_wait_seconds", "gauge", "Admission wait over the recent admissions.",
+                 [({"stat": stat}, scheduler[f"wait_{stat}"]) for stat in ("mean", "p95", "max")])
+
+    resilience = get_resilience().stats()
+    breakers = resilience["breakers"].items()
+    yield Family("circuit_breaker_state", "gauge", "1 for the current state of each circuit breaker.",
+                 [({"endpoint": name, "state": state}, int(breaker["state"] == state))
+                  for name, breaker in breakers for state in BREAKER_STATES])
+    yield Family("circuit_breaker_rejected", "counter", "Calls rejected by an open circuit breaker.",
+                 [({"endpoint": name}, breaker["rejected"]) for name, breaker in breakers])
+    yield Family("circuit_breaker_transitions", "counter", "State changes of each circuit breaker.",
+                 [({"endpoint": name, "transition": transition}, count)
+                  for name, breaker in breakers for transition, count in breaker["transitions"].items()])
+    budget = resilience["retry_budget"]
+    yield Family("retry_budget_tokens", "gauge", "Retries currently allowed by the shared retry budget.", [({}, budget["tokens"])])
+    yield Family("genie_retry_budget_retries", "counter", "Retries allowed and denied by the retry budget.",
+                 [({"outcome": "allowed"}, budget["retries"]), ({"outcome": "denied"}, budget["retries_denied"])])
+
+    exports = full_exporter.stats()
+    yield Family("full_export_jobs", "counter", "Full-result export jobs by outcome.",
+                 [({"outcome": outcome}, exports[outcome]) for outcome in ("jobs", "completed", "failed")])
+    yield Family("full_export_rows", "counter", "Rows written by completed full-result exports.", [({}, exports["rows"])])
+
+METRICS.add_collector(collect_service_metrics)
+
+# Chat sessions and their rendered messages are kept server-side; the browser
+# only holds a client ID and the ID and title of each session.
+conversation_store = ConversationStore()
 
 app = dash.Dash(
     __name__,
@@ -66,24 +242,72 @@ app = dash.Dash(
     title="BI Agent",
     background_callback_manager=long_callback_manager
 )
+# The WSGI application served by gunicorn in production (see gunicorn.conf.py).
+server = app.server
+
+###
+# HELPER: get_workspace_client
+#
+# Returns the WorkspaceClient used for insights, created once per process on
+# first use. It uses environment variables DATABRICKS_HOST and
+# DATABRICKS_TOKEN by default. Returns None (and tries again next time) if
+# it cannot be created.
+###
+_workspace_client = None
+_workspace_client_lock = threading.Lock()
+
+
+def get_workspace_client():
+    global _workspace_client
+    with _workspace_client_lock:
+        if _workspace_client is None:
+            from databricks.sdk import WorkspaceClient
+            try:
+                _workspace_client = WorkspaceClient()
+                logger.info("Databricks WorkspaceClient initialized.")
+            except Exception as e:
+                logger.error(f"Failed to initialize Databricks WorkspaceClient: {e}")
+        return _workspace_client
+
+###
+# FUNCTION: warm_up
+#
+# Imports the modules app.py loads lazily and creates the WorkspaceClient.
+# The serving process calls it before taking requests, so the background-
+# callback processes forked from it start with everything loaded. Processes
+# that only import the app skip this cost.
+###
+def warm_up():
+    start = time.monotonic()
+    import databricks.sdk.errors  # noqa: F401
+    import databricks.sdk.service.serving  # noqa: F401
+    get_workspace_client()
+    logger.info(f"Warmed up in {time.monotonic() - start:.2f}s")
 
-# Initialize Flask-Caching
-# For production, consider using a more robust backend like Redis.
-# Example: {'CACHE_TYPE': 'redis', 'CACHE_REDIS_URL': os.environ.get('REDIS_URL', 'redis://localhost:6379/0')}
-cache = Cache(app.server, config={
-    'CACHE_TYPE': 'SimpleCache', # Use SimpleCache for in-memory caching
-    'CACHE_DEFAULT_TIMEOUT': 300 # Cache items expire after 300 seconds (5 minutes)
-})
-
-# Initialize WorkspaceClient globally
-# This ensures the client is created once and reused across requests.
-# It uses environment variables DATABRICKS_HOST and DATABRICKS_TOKEN by default.
-try:
-    global_workspace_client = WorkspaceClient()
-    logger.info("Databricks WorkspaceClient initialized globally.")
-except Exception as e:
-    logger.error(f"Failed to initialize Databricks WorkspaceClient globally: {e}")
-    global_workspace_client = None
+###
+# FUNCTION: init_server_process
+#
+# Sets up a process that serves requests (the development server below, or
+# each gunicorn worker): starts the cache culler and warms up. Importing the
+# app starts no threads, so that it can be preloaded into a forkserver.
+#
+# Dash starts each background callback in a new process. Forked from a
+# server that handles requests on several threads, that process inherits
+# SQLite's and diskcache's locks in whatever state another thread left them,
+# and can hang or read a database while another process writes to it. With
+# `forkserver_preload` (the module that serves the app), background
+# callbacks are instead forked from a single-threaded forkserver process that
+# has the SDK and that module loaded.
+###
+def init_server_process(forkserver_preload=None):
+    if forkserver_preload:
+        import multiprocess
+        import multiprocess.forkserver
+        multiprocess.set_start_method("forkserver", force=True)
+        multiprocess.set_forkserver_preload(["databricks.sdk", forkserver_preload])
+        multiprocess.forkserver.ensure_running()
+    cache_culler.start()
+    warm_up()
 
 ###
 # APPLICATION LAYOUT DEFINITION
@@ -204,10 +428,18 @@ app.layout = html.Div([
         html.Div(id='dummy-output'),
         dcc.Store(id="chat-trigger", data={"trigger": False, "message": ""}),
         dcc.Store(id="chat-history-store", data=[], storage_type='session'),
+        dcc.Store(id="client-id-store", data=None, storage_type='session'),
         dcc.Store(id="query-running-store", data=False),
         dcc.Store(id="session-store", data={"current_session": None}, storage_type='session'),
         html.Div(id='dummy-insight-scroll'),
-        dcc.Download(id="download-dataframe-csv"),
+        html.Div(id='dummy-answer-refresh'),
+        html.Div(id='dummy-cancel'),
+        dcc.Store(id="answer-refresh-store", data=None),
+        dcc.Store(id="export-url-store", data=None),
+        html.Div(id='dummy-download'),
+        dbc.Toast(TABLE_EXPIRED_MESSAGE, id="table-expired-toast", header="Export unavailable", icon="warning",
+                  is_open=False, dismissable=True, duration=8000,
+                  style={"position": "fixed", "bottom": 90, "right": 20, "zIndex": 1100}),
         
         # Modal dialog for generating insights from a table.
         dbc.Modal([
@@ -233,54 +465,134 @@ app.layout = html.Div([
 # like formatting SQL code or calling a Large Language Model (LLM).
 ###
 
-@cache.memoize() # Cache the results of this function
-def call_llm_for_insights(df_csv, prompt=None): # df is now passed as CSV string for caching
+def call_llm_for_insights(df_csv, prompt=None, user=None):
      """
      Sends a DataFrame (as CSV string) and a prompt to a Databricks Serving Endpoint to generate
-     data insights using an LLM. This function now uses the streaming API.
+     data insights using an LLM, waiting for the complete answer. Answers are cached in the
+     shared insight cache.
 
      Args:
-         df_csv (str): The data table as a CSV string to be analyzed.
+         df_csv (str): The data table as a CSV string (or its profile, see table_for_prompt) to be analyzed.
          prompt (str, optional): A custom prompt for the LLM. A default is used if not provided.
+         user (str, optional): Who asked, for the scheduler's per-user limit.
 
      Returns:
          str: The complete text response generated by the LLM.
      """
-     formatting_instruction = "\n\nIMPORTANT: Do not use markdown headers (e.g., '#', '##'). Instead, use bolding for titles (e.g., '**Key Insights**')."
-     default_prompt = (
-         "You are a professional data analyst. Given the following table data, provide deep, actionable analysis for\n"
-         "1. Key insights and trends.\n"
-         "2. Notable patterns\n"
-         "3. Business implications.\n"
-         "Be thorough, professional, and concise."
-     )
-
-     final_prompt = (prompt or default_prompt) + formatting_instruction
-     full_prompt = f"{final_prompt}\n\nTable data:\n{df_csv}"
+     endpoint = os.getenv("SERVING_ENDPOINT_NAME")
+     cached = insight_cache.get(df_csv, prompt, endpoint)
+     if cached is not None:
+         logger.info("Served insights from the insight cache")
+         return cached
+     # Fail fast instead of queueing while the endpoint's breaker is open.
+     if insights_circuit_open():
+         return INSIGHTS_UNAVAILABLE_MESSAGE
 
      try:
-        # Use the globally initialized WorkspaceClient
-        if global_workspace_client:
-            response = global_workspace_client.serving_endpoints.query(
-                os.getenv("SERVING_ENDPOINT_NAME"),
-                messages=[ChatMessage(content=full_prompt, role=ChatMessageRole.USER)],
-            )
-            return response.choices[0].message.content
+        workspace_client = get_workspace_client()
+        if workspace_client:
+            timing = InsightTiming()
+            # Insights queue behind interactive questions but do not use
+            # Genie's rate limit.
+            with genie_scheduler.admit(user, priority=PRIORITY_INSIGHT, rate_limited=False):
+                insights = query_insights(workspace_client, df_csv, prompt, timing)
+            logger.info(f"Generated insights in {timing.total_time:.1f}s ({timing.characters} chars)")
+            if insights:
+                insight_cache.put(df_csv, prompt, endpoint, insights)
+            return insights
         else:
             return "Error: WorkspaceClient not initialized."
 
-     except DatabricksError as dbe:
-         logger.error(f"Databricks API Error generating insights: {dbe}")
-         # Provide a more user-friendly message for specific, common errors
-         if "PERMISSION_DENIED" in str(dbe):
-             return "Error: You do not have permission to access the analysis model. Please contact support."
-         # Attempt to log the raw response body if available in the DatabricksError
-         if hasattr(dbe, 'body') and dbe.body:
-             logger.error(f"DatabricksError response body: {dbe.body}")
-         return f"Error communicating with the analysis service: {dbe.message}"
+     except QueueTimeout:
+         return INSIGHTS_BUSY_MESSAGE
      except Exception as e:
-         logger.error(f"An unexpected error occurred while generating insights: {str(e)}")
-         return f"An unexpected error occurred while generating insights: {str(e)}"
+         return describe_insight_error(e)
+
+def stream_llm_insights(df_csv, prompt=None, user=None):
+     """
+     Streams insights for a DataFrame (as CSV string) from the serving endpoint, pushing the
+     text received so far into the "insight-stream" placeholder of the chat as tokens arrive.
+     Cached answers are returned at once; complete streamed answers are added to the cache.
+
+     Args:
+         df_csv (str): The data table as a CSV string (or its profile, see table_for_prompt) to be analyzed.
+         prompt (str, optional): A custom prompt for the LLM. A default is used if not provided.
+         user (str, optional): Who asked, for the scheduler's per-user limit.
+
+     Returns:
+         str: The complete text response generated by the LLM.
+     """
+     endpoint = os.getenv("SERVING_ENDPOINT_NAME")
+     cached = insight_cache.get(df_csv, prompt, endpoint)
+     if cached is not None:
+         logger.info("Served insights from the insight cache")
+         return cached
+     # Fail fast instead of queueing while the endpoint's breaker is open.
+     if insights_circuit_open():
+         return INSIGHTS_UNAVAILABLE_MESSAGE
+
+     workspace_client = get_workspace_client()
+     if not workspace_client:
+         return "Error: WorkspaceClient not initialized."
+
+     timing = InsightTiming()
+     chunks = []
+     last_push = 0.0
+     try:
+         with genie_scheduler.admit(user, priority=PRIORITY_INSIGHT, rate_limited=False):
+             for text in stream_insights(workspace_client, df_csv, prompt, timing):
+                 chunks.append(text)
+                 # The browser polls background callbacks, so pushing more often
+                 # than it polls only adds cache writes.
+                 if time.monotonic() - last_push >= INSIGHT_STREAM_PUSH_SECONDS:
+                     set_props("insight-stream", {"children": [
+                         html.Div(html.Div(className="model-avatar"), className="model-info"),
+                         html.Div(dcc.Markdown("".join(chunks)), className="message-content")
+                     ]})
+                     last_push = time.monotonic()
+     except QueueTimeout:
+         return INSIGHTS_BUSY_MESSAGE
+     except Exception as e:
+         if not chunks:
+             return describe_insight_error(e)
+         logger.error(f"Insight stream interrupted after {timing.characters} chars: {e}")
+         chunks.append("\n\n*The analysis was interrupted before it finished.*")
+
+     ttft = f"{timing.time_to_first_token:.1f}s" if timing.time_to_first_token is not None else "n/a"
+     total = f"{timing.total_time:.1f}s" if timing.total_time is not None else "n/a"
+     logger.info(f"Streamed insights: first token after {ttft}, total {total} ({timing.characters} chars)")
+     insights = "".join(chunks)
+     # Interrupted streams have no finish time and are not cached.
+     if timing.finished is not None and insights:
+         insight_cache.put(df_csv, prompt, endpoint, insights)
+     return insights
+
+###
+# HELPERS: Chat Sessions
+#
+# The `chat-history-store` only lists sessions as {"session_id", "title"};
+# messages and the Genie conversation ID live in the conversation store.
+###
+def session_list(chat_history):
+    # Ignore entries written by older versions that stored whole message trees.
+    return [s for s in (chat_history or []) if isinstance(s, dict) and "title" in s]
+
+
+def render_chat_list(chat_history, active_session_id):
+    return [
+        html.Div(session["title"], className=f"chat-item{' active' if session['session_id'] == active_session_id else ''}",
+                 id={"type": "chat-item", "index": session["session_id"]})
+        for session in session_list(chat_history)
+    ]
+
+
+def persist_bot_message(client_id, session_data, message, conversation_id=None):
+    session_id = (session_data or {}).get("current_session")
+    if not client_id or session_id is None:
+        return
+    conversation_store.append_messages(client_id, session_id, [message])
+    if conversation_id:
+        conversation_store.set_conversation_id(client_id, session_id, conversation_id)
 
 ###
 # CALLBACKS
@@ -298,6 +610,8 @@ def call_llm_for_insights(df_csv, prompt=None): # df is now passed as CSV string
 # suggestion button or the text input. It updates the chat display with the
 # user's message and a "Thinking..." indicator, then triggers the next callback
 # in the chain to fetch the actual response. It also manages chat history and session state.
+# Both messages are appended with a Patch, so the existing conversation is
+# never sent to the server or back.
 ###
 @app.callback(
     [Output("chat-messages", "children", allow_duplicate=True),
@@ -307,7 +621,8 @@ def call_llm_for_insights(df_csv, prompt=None): # df is now passed as CSV string
      Output("query-running-store", "data", allow_duplicate=True),
      Output("chat-list", "children", allow_duplicate=True),
      Output("chat-history-store", "data", allow_duplicate=True),
-     Output("session-store", "data", allow_duplicate=True)],
+     Output("session-store", "data", allow_duplicate=True),
+     Output("client-id-store", "data", allow_duplicate=True)],
     [Input("suggestion-1", "n_clicks"),
      Input("suggestion-2", "n_clicks"),
      Input("suggestion-3", "n_clicks"),
@@ -319,19 +634,17 @@ def call_llm_for_insights(df_csv, prompt=None): # df is now passed as CSV string
      State("suggestion-3-text", "children"),
      State("suggestion-4-text", "children"),
      State("chat-input-fixed", "value"),
-     State("chat-messages", "children"),
-     State("welcome-container", "className"),
-     State("chat-list", "children"),
      State("chat-history-store", "data"),
-     State("session-store", "data")],
+     State("session-store", "data"),
+     State("client-id-store", "data")],
     prevent_initial_call=True
 )
 def handle_all_inputs(s1_clicks, s2_clicks, s3_clicks, s4_clicks, send_clicks, submit_clicks,
-                     s1_text, s2_text, s3_text, s4_text, input_value, current_messages,
-                     welcome_class, current_chat_list, chat_history, session_data):
+                     s1_text, s2_text, s3_text, s4_text, input_value,
+                     chat_history, session_data, client_id):
     ctx = callback_context
     if not ctx.triggered:
-        return [no_update] * 8
+        return [no_update] * 9
 
     trigger_id = ctx.triggered[0]["prop_id"].split(".")[0]
     suggestion_map = {
@@ -341,83 +654,136 @@ def handle_all_inputs(s1_clicks, s2_clicks, s3_clicks, s4_clicks, send_clicks, s
     user_input = suggestion_map.get(trigger_id, input_value)
 
     if not user_input:
-        return [no_update] * 8
+        return [no_update] * 9
 
     user_message = html.Div([
         html.Div(user_input, className="message-text"),
         html.Div(html.Div(id="user-avatar-initials", className="user-avatar-chat"), className="user-info")
     ], className="user-message message")
 
-    updated_messages = (current_messages or []) + [user_message]
-
     thinking_indicator = html.Div(
-        html.Div([html.Span(className="spinner"), html.Span("Thinking...")], className="thinking-indicator"),
+        html.Div([html.Span(className="spinner"), html.Span("Thinking...", id="query-status")], className="thinking-indicator"),
         className="bot-message message"
     )
-    updated_messages.append(thinking_indicator)
+    updated_messages = Patch()
+    updated_messages.extend([user_message, thinking_indicator])
 
-    chat_history = chat_history or []
-    # Check if this is the start of a new session
-    if session_data.get("current_session") is None:
-        current_session_index = 0
-        session_data = {"current_session": 0}
-        # Create and insert the new session at the beginning of the history
-        new_session = {
-            "session_id": current_session_index,
-            "queries": [user_input],
-            "messages": updated_messages,
-            "conversation_id": None
-        }
-        chat_history.insert(0, new_session)
-    else:
-        # Update an existing session
-        current_session_index = session_data["current_session"]
-        if current_session_index < len(chat_history):
-            chat_history[current_session_index]["messages"] = updated_messages
-            chat_history[current_session_index]["queries"].append(user_input)
-        else:
-            # Fallback for an invalid session index - treat as new
-            current_session_index = 0
-            session_data = {"current_session": 0}
-            new_session = {
-                "session_id": current_session_index,
-                "queries": [user_input],
-                "messages": updated_messages,
-                "conversation_id": None
-            }
-            chat_history.insert(0, new_session)
+    client_id = client_id or str(uuid.uuid4())
+    chat_history = session_list(chat_history)
+    session_id = (session_data or {}).get("current_session")
+    # Start a new session unless the current one is still listed
+    if session_id is None or not any(s["session_id"] == session_id for s in chat_history):
+        session_id = conversation_store.create_session(client_id, user_input)
+        session_data = {"current_session": session_id}
+        chat_history.insert(0, {"session_id": session_id, "title": user_input})
+    conversation_store.append_messages(client_id, session_id, [user_message])
 
-    updated_chat_list = [
-        html.Div(session["queries"][0], className=f"chat-item{' active' if i == current_session_index else ''}", id={"type": "chat-item", "index": i})
-        for i, session in enumerate(chat_history)
-    ]
+    updated_chat_list = render_chat_list(chat_history, session_id)
 
     return (updated_messages, "", "welcome-container hidden",
             {"trigger": True, "message": user_input}, True,
-            updated_chat_list, chat_history, session_data)
+            updated_chat_list, chat_history, session_data, client_id)
+
+###
+# HELPER: Render a Response Part
+#
+# Builds the chat content for one part of a Genie answer: text as Markdown,
+# a single value as text, or a table as a grid whose rows are served on
+# demand. Tables are written to the table store in the background; the
+# returned future (None for other parts) must be waited on before the
+# background callback returns. Tables whose Genie query is known also get an
+# "Export full result" button.
+###
+def render_response_part(response, description, owner, space_id=None):
+    table_write = None
+
+    # Case 1: The response is a string.
+    if isinstance(response, str):
+        processed_response = response.replace('[', '\\[').replace(']', '\\]')
+        content = dcc.Markdown(processed_response, className="message-text-bot")
+
+    # Case 2: The response is a non-empty pandas DataFrame.
+    elif isinstance(response, pd.DataFrame) and not response.empty:
+        df_response = response  # Use the DataFrame directly
+
+        # Case 2a: The DataFrame contains only a single value.
+        if df_response.shape == (1, 1):
+            content = dcc.Markdown(str(df_response.iloc[0, 0]))
+
+        # Case 2b: The DataFrame is a full table.
+        else:
+            table_uuid = str(uuid.uuid4())
+            # Write the DataFrame to the table store in the background while
+            # the table component is built.
+            table_write = df_cache_for_long_callbacks.put_async(table_uuid, df_response, owner=owner)
+
+            # The grid only receives column definitions; rows are served
+            # block by block by `serve_grid_rows` as the user scrolls.
+            data_grid = dag.AgGrid(
+                id={"type": "result-grid", "index": table_uuid},
+                columnDefs=column_defs(df_response),
+                defaultColDef={"sortable": True, "resizable": True, "width": 200, "filterParams": {"buttons": ["reset"], "debounceMs": 300}},
+                rowModelType="infinite",
+                dashGridOptions={"cacheBlockSize": GRID_BLOCK_SIZE, "maxBlocksInCache": 10, "rowBuffer": 0, "rowHeight": 40, "headerHeight": 40, "tooltipShowDelay": 300},
+                className="ag-theme-alpine",
+                style={'height': '300px', 'width': '95%'}
+            )
+
+            export_button = html.Button("Export as CSV", id={"type": "export-button", "index": table_uuid}, className="insight-button", style={'marginRight': '8px'})
+            export_menu = dbc.DropdownMenu(
+                [dbc.DropdownMenuItem(label, id={"type": "export-format-button", "index": table_uuid, "format": fmt})
+                 for fmt, label in (("csv.gz", "CSV (gzip)"), ("parquet", "Parquet"), ("xlsx", "Excel"))],
+                label="More formats", size="sm", color="light", style={'marginRight': '16px'}
+            )
+            insight_button = html.Button("Analyze with AI", id={"type": "insight-button", "index": table_uuid}, className="insight-button")
+            buttons = [export_button, export_menu]
+            attachment = df_response.attrs.get("genie_attachment")
+            if attachment and space_id:
+                full_exporter.register(table_uuid, space_id, attachment)
+                buttons.append(html.Button("Export full result", id={"type": "full-export-button", "index": table_uuid},
+                                           className="insight-button", style={'marginRight': '16px'}))
+            buttons.append(insight_button)
+
+            content_elements = []
+            if description:
+                content_elements.append(dcc.Markdown(description, style={'marginBottom': '15px'}))
+            content_elements.append(html.Div(data_grid, style={'marginBottom': '10px'}))
+            content_elements.append(html.Div(buttons, style={'display': 'flex'}))
+            content = html.Div(content_elements)
+
+    # Case 3: The response is something else (e.g., empty DataFrame), so show no results.
+    else:
+        content = dcc.Markdown("Your request returned no results. This may happen if the data doesn’t exist or if you don’t have permission to view it.", className="message-text-bot")
+
+    return content, table_write
 
 ###
 # CALLBACK: Fetch Backend Response (Converted to long_callback)
 #
 # Triggered by the `handle_all_inputs` callback, this function sends the user's
 # query to the `genie_query` backend. It processes the response, which can be
-# text or a DataFrame. If a DataFrame is returned, it's stored in the server-side
-# cache and displayed as a DataTable. The final response replaces the
-# "Thinking..." indicator in the chat.
+# text, a DataFrame or several of them (see render_response_part). Tables are
+# stored in the server-side table store and displayed in grids whose rows are
+# served on demand. The final response replaces the "Thinking..." indicator
+# (the last message) in the chat through a Patch. The first question of a conversation is answered
+# from the answer cache when possible; a stale cached answer is shown right
+# away and `answer-refresh-store` asks the server to refresh it. Questions
+# sent to Genie wait for the scheduler; while queued, the indicator shows the
+# question's position in the queue.
 ###
 @app.callback(
     [Output("chat-messages", "children", allow_duplicate=True),
-     Output("chat-history-store", "data", allow_duplicate=True),
      Output("chat-trigger", "data", allow_duplicate=True),
      Output("query-running-store", "data", allow_duplicate=True),
-     Output("conversation-id-store", "data", allow_duplicate=True)],
+     Output("conversation-id-store", "data", allow_duplicate=True),
+     Output("answer-refresh-store", "data")],
     Input("chat-trigger", "data"),
-    [State("chat-messages", "children"),
-     State("chat-history-store", "data"),
-     State("selected-space-id", "data"),
+    [State("selected-space-id", "data"),
      State("conversation-id-store", "data"),
      State("user-token-store", "data"),
-     State("session-store", "data")],
+     State("session-store", "data"),
+     State("client-id-store", "data"),
+     State("username-store", "data")],
     prevent_initial_call=True,
     background=True,
     # Define outputs to be updated while the callback is running
@@ -425,11 +791,11 @@ def handle_all_inputs(s1_clicks, s2_clicks, s3_clicks, s4_clicks, send_clicks, s
         (Output("chat-input-fixed", "disabled"), True, False),
         (Output("mic-button", "disabled"), True, False),
         (Output("send-button-fixed", "disabled"), True, False),
-        (Output("new-chat-button", "disabled"), True, False),
-        (Output("sidebar-new-chat-button", "disabled"), True, False),
     ],
+    # "New chat" and "Change agent" abandon the answer, so they stop the job.
+    cancel=CANCEL_INPUTS,
 )
-def get_model_response(trigger_data, current_messages, chat_history, selected_space_id, conversation_id, user_token, session_data):
+def get_model_response(trigger_data, selected_space_id, conversation_id, user_token, session_data, client_id, username):
     # This callback can now be long-running without blocking the main Dash thread.
     # The `running` argument will manage the disabled state of buttons.
 
@@ -441,79 +807,107 @@ def get_model_response(trigger_data, current_messages, chat_history, selected_sp
         return no_update, no_update, no_update, no_update, no_update
 
     new_conv_id = conversation_id
+    refresh_request = no_update
     try:
-        # Use the user_token passed as a State
-        new_conv_id, response, query_text, description = genie_query(user_input, user_token, selected_space_id, conversation_id)
-
-        content = None
-
-        # Case 1: The response is a string.
-        if isinstance(response, str):
-            processed_response = response.replace('[', '\\[').replace(']', '\\]')
-            content = dcc.Markdown(processed_response, className="message-text-bot")
-        
-        # Case 2: The response is a non-empty pandas DataFrame.
-        elif isinstance(response, pd.DataFrame) and not response.empty:
-            df_response = response  # Use the DataFrame directly
-            
-            # Case 2a: The DataFrame contains only a single value.
-            if df_response.shape == (1, 1):
-                content = dcc.Markdown(str(df_response.iloc[0, 0]))
-            
-            # Case 2b: The DataFrame is a full table.
-            else:
-                table_uuid = str(uuid.uuid4())
-                # Store the DataFrame as a CSV string in the diskcache
-                df_csv_string = df_response.to_csv(index=False)
-                df_cache_for_long_callbacks.set(table_uuid, df_csv_string) # Use the new df_cache
-
-                table_data = df_response.to_dict('records')
-                table_columns = [{"name": col, "id": col} for col in df_response.columns]
-                tooltip_data = [{col: {'value': str(row[col]), 'type': 'markdown'} for col in df_response.columns} for row in table_data]
-                
-                data_table = dash_table.DataTable(
-                    id=f"table-{len(chat_history)}", data=table_data, columns=table_columns,
-                    sort_action="native", filter_action="native",
-                    style_table={'maxHeight': '300px', 'overflowY': 'auto', 'overflowX': 'auto', 'width': '95%'},
-                    style_data={'textAlign': 'left', 'padding': '5px', 'height': '40px', 'maxHeight': '40px', 'lineHeight': '14px', 'overflow': 'hidden', 'textOverflow': 'ellipsis', 'whiteSpace': 'nowrap', 'verticalAlign': 'top'},
-                    style_header={'fontWeight': 'bold', 'textAlign': 'center', 'backgroundColor': '#f8f8f8', 'height': '40px', 'maxHeight': '40px', 'lineHeight': '14px', 'overflow': 'hidden', 'textOverflow': 'ellipsis', 'whiteSpace': 'nowrap', 'verticalAlign': 'top'},
-                    style_data_conditional=[{'if': {'column_id': col}, 'width': '200px', 'maxWidth': '200px'} for col in df_response.columns],
-                    style_header_conditional=[{'if': {'column_id': col}, 'width': '200px', 'maxWidth': '200px'} for col in df_response.columns],
-                    tooltip_data=tooltip_data, tooltip_duration=None, fill_width=False
-                )
-                
-                export_button = html.Button("Export as CSV", id={"type": "export-button", "index": table_uuid}, className="insight-button", style={'marginRight': '16px'})
-                insight_button = html.Button("Analyze with AI", id={"type": "insight-button", "index": table_uuid}, className="insight-button")
-                
-                content_elements = []
-                if description:
-                    content_elements.append(dcc.Markdown(description, style={'marginBottom': '15px'}))
-                content_elements.append(html.Div(data_table, style={'marginBottom': '10px'}))
-                content_elements.append(html.Div([export_button, insight_button], style={'display': 'flex'}))
-                content = html.Div(content_elements)
-        
-        # Case 3: The response is something else (e.g., empty DataFrame), so show no results.
+        # Follow-up questions depend on the conversation, so only the first
+        # question of a conversation is looked up in the answer cache.
+        scope = permission_scope((username or {}).get("email"), user_token)
+        cached = answer_cache.get(selected_space_id, user_input, scope) if not conversation_id else None
+        # While Genie's circuit breaker is open, any cached answer to the
+        # question (even for a follow-up) beats an error.
+        degraded = genie_circuit_open()
+        if degraded and cached is None and conversation_id:
+            cached = answer_cache.get(selected_space_id, user_input, scope)
+        if cached is not None:
+            # Only the answer is reused: the Genie conversation it came from
+            # belongs to another session, so a follow-up starts a new one.
+            _, response, query_text, description = cached.answer
+            stats = answer_cache.stats()
+            logger.info(f"Answered from cache ({'stale' if cached.stale else 'fresh'}, {cached.age_seconds:.0f}s old), "
+                        f"saving ~{cached.fetch_seconds:.1f}s; hit rate {stats['hit_rate']:.0%}, "
+                        f"{stats['seconds_saved']:.0f}s saved in total")
+            if cached.stale and not degraded:
+                refresh_request = {"space_id": selected_space_id, "question": user_input}
+        elif degraded:
+            # Fails within milliseconds without queueing.
+            answer = genie_query(user_input, user_token, selected_space_id, conversation_id)
+            new_conv_id, response, query_text, description = answer
+        else:
+            # Use the user_token passed as a State
+            start = time.monotonic()
+            deadline = start + GENIE_QUERY_TIMEOUT_SECONDS
+            def register(sent_conv_id, message_id):
+                cache_disk.set(f"{INFLIGHT_PREFIX}{client_id}", {
+                    "space_id": selected_space_id, "conversation_id": sent_conv_id, "message_id": message_id
+                }, expire=GENIE_QUERY_TIMEOUT_SECONDS)
+
+            with genie_scheduler.admit(scope or client_id, selected_space_id, PRIORITY_INTERACTIVE,
+                                       on_wait=show_queue_position, deadline=deadline):
+                set_props("query-status", {"children": "Thinking..."})
+                try:
+                    answer = genie_query(user_input, user_token, selected_space_id, conversation_id,
+                                         deadline=deadline, on_message=register)
+                finally:
+                    cache_disk.delete(f"{INFLIGHT_PREFIX}{client_id}")
+            new_conv_id, response, query_text, description = answer
+            if not conversation_id:
+                answer_cache.put(selected_space_id, user_input, scope, answer, time.monotonic() - start)
+
+        # A message can hold several parts (e.g. text, then a table, then
+        # another table); they are rendered in order.
+        parts = response if isinstance(response, list) else [(response, query_text, description)]
+        # Tables count against the quota of the signed-in user (or of this
+        # browser session when no user header is present).
+        owner = (username or {}).get("email") or client_id
+        rendered = [render_response_part(part, part_description, owner, selected_space_id) for part, _, part_description in parts]
+        if len(rendered) == 1:
+            content = rendered[0][0]
         else:
-            content = dcc.Markdown("Your request returned no results. This may happen if the data doesn’t exist or if you don’t have permission to view it.", className="message-text-bot")
+            content = html.Div([html.Div(part_content, style={'marginBottom': '20px'}) for part_content, _ in rendered])
+        # Dash kills the background process once its result is read, so the
+        # tables must be on disk before returning.
+        for _, table_write in rendered:
+            if table_write is not None:
+                table_write.result()
+
+        if cached is not None:
+            if degraded:
+                note = f"Genie is unavailable right now; this is a cached answer from {cached.age_seconds / 60:.0f} min ago."
+            else:
+                note = (f"Cached answer from {cached.age_seconds / 60:.0f} min ago"
+                        + ("; a fresh answer is being fetched for next time." if cached.stale else "."))
+            content = html.Div([
+                content,
+                html.Div(note,
+                         style={'fontSize': '12px', 'color': '#6c757d', 'marginTop': '6px'})
+            ])
 
         bot_response = html.Div([
             html.Div(html.Div(className="model-avatar"), className="model-info"),
             html.Div(content, className="message-content")
         ], className="bot-message message")
         
-        updated_messages = current_messages[:-1] + [bot_response]
-        if chat_history and session_data and session_data.get("current_session") is not None:
-            current_session_index = session_data["current_session"]
-            chat_history_list = list(chat_history) if isinstance(chat_history, tuple) else chat_history
-            if 0 <= current_session_index < len(chat_history_list):
-                chat_history_list[current_session_index]["messages"] = updated_messages
-                if new_conv_id:
-                    chat_history_list[current_session_index]["conversation_id"] = new_conv_id
-                chat_history = chat_history_list
+        updated_messages = Patch()
+        updated_messages[-1] = bot_response
+        persist_bot_message(client_id, session_data, bot_response, new_conv_id)
             
-        return updated_messages, chat_history, {"trigger": False, "message": ""}, False, new_conv_id
+        return updated_messages, {"trigger": False, "message": ""}, False, new_conv_id, refresh_request
+
+    except QueueTimeout as qt:
+        logger.warning(f"Question not admitted in time: {qt}")
+        error_msg = "The assistant is busy right now and your question could not be started. Please try again in a minute."
+        error_response = html.Div([
+            html.Div(html.Div(className="model-avatar"), className="model-info"),
+            html.Div(html.Div(error_msg, className="message-text-bot"), className="message-content")
+        ], className="bot-message message")
 
-    except DatabricksError as dbe:
+        updated_messages = Patch()
+        updated_messages[-1] = error_response
+        persist_bot_message(client_id, session_data, error_response, new_conv_id)
+
+        return updated_messages, {"trigger": False, "message": ""}, False, new_conv_id, refresh_request
+
+    except databricks_error_type() as dbe:
         logger.error(f"Databricks API Error in get_model_response: {dbe}")
         error_msg = f"A service error occurred. Please try again later. (Details: {dbe.message})"
         error_response = html.Div([
@@ -521,17 +915,11 @@ def get_model_response(trigger_data, current_messages, chat_history, selected_sp
             html.Div(html.Div(error_msg, className="message-text-bot"), className="message-content")
         ], className="bot-message message")
         
-        updated_messages = current_messages[:-1] + [error_response]
-        if chat_history and session_data and session_data.get("current_session") is not None:
-            current_session_index = session_data["current_session"]
-            chat_history_list = list(chat_history) if isinstance(chat_history, tuple) else chat_history
-            if 0 <= current_session_index < len(chat_history_list):
-                chat_history_list[current_session_index]["messages"] = updated_messages
-                if new_conv_id:
-                    chat_history_list[current_session_index]["conversation_id"] = new_conv_id
-                chat_history = chat_history_list
-
-        return updated_messages, chat_history, {"trigger": False, "message": ""}, False, new_conv_id
+        updated_messages = Patch()
+        updated_messages[-1] = error_response
+        persist_bot_message(client_id, session_data, error_response, new_conv_id)
+
+        return updated_messages, {"trigger": False, "message": ""}, False, new_conv_id, refresh_request
 
     except Exception as e:
         logger.error(f"Error in get_model_response: {e}")
@@ -541,55 +929,324 @@ def get_model_response(trigger_data, current_messages, chat_history, selected_sp
             html.Div(html.Div(error_msg, className="message-text-bot"), className="message-content")
         ], className="bot-message message")
         
-        updated_messages = current_messages[:-1] + [error_response]
-        if chat_history and session_data and session_data.get("current_session") is not None:
-            current_session_index = session_data["current_session"]
-            chat_history_list = list(chat_history) if isinstance(chat_history, tuple) else chat_history
-            if 0 <= current_session_index < len(chat_history_list):
-                chat_history_list[current_session_index]["messages"] = updated_messages
-                if new_conv_id:
-                    chat_history_list[current_session_index]["conversation_id"] = new_conv_id
-                chat_history = chat_history_list
+        updated_messages = Patch()
+        updated_messages[-1] = error_response
+        persist_bot_message(client_id, session_data, error_response, new_conv_id)
 
-        return updated_messages, chat_history, {"trigger": False, "message": ""}, False, new_conv_id
+        return updated_messages, {"trigger": False, "message": ""}, False, new_conv_id, refresh_request
 
 ###
-# CALLBACK: Export DataFrame to CSV
+# FUNCTION: show_queue_position
 #
-# This callback handles the "Export as CSV" button click. It retrieves the
-# corresponding DataFrame from the server-side cache using its UUID and
-# sends it to the user's browser for download.
+# Shows a queued question's position in its thinking indicator.
+###
+def show_queue_position(position):
+    set_props("query-status", {"children": f"Waiting in queue (position {position})..."})
+
+###
+# CALLBACK: Cancel In-Flight Question
+#
+# "New chat" and "Change agent" kill the background job answering the
+# current question (see CANCEL_INPUTS), which stops its polling and frees
+# its scheduler slot. This callback then cancels the question's work on
+# Genie's side, using the message the job registered once it was sent.
 ###
 @app.callback(
-    Output("download-dataframe-csv", "data"),
+    Output("dummy-cancel", "children"),
+    CANCEL_INPUTS,
+    [State("client-id-store", "data"),
+     State("user-token-store", "data")],
+    prevent_initial_call=True
+)
+def cancel_inflight_question(n_clicks1, n_clicks2, n_clicks3, client_id, user_token):
+    inflight = cache_disk.pop(f"{INFLIGHT_PREFIX}{client_id}") if client_id else None
+    if not inflight:
+        return no_update
+    try:
+        cancelled = cancel_genie_message(user_token, inflight["space_id"], inflight["conversation_id"], inflight["message_id"])
+        logger.info(f"Cancelled Genie message {inflight['message_id']} ({cancelled} statement(s) stopped)")
+    except Exception as e:
+        logger.warning(f"Could not cancel Genie message {inflight['message_id']}: {e}")
+    return no_update
+
+###
+# CALLBACK: Revalidate a Stale Cached Answer
+#
+# Runs in the server process (not as a background callback, whose process is
+# stopped once it returns) and hands the refresh of a stale answer to the
+# answer cache's thread pool, so it outlives this request.
+###
+@app.callback(
+    Output("dummy-answer-refresh", "children"),
+    Input("answer-refresh-store", "data"),
+    [State("user-token-store", "data"),
+     State("username-store", "data")],
+    prevent_initial_call=True
+)
+def revalidate_cached_answer(refresh_request, user_token, username):
+    if not refresh_request:
+        return no_update
+    space_id = refresh_request["space_id"]
+    question = refresh_request["question"]
+    scope = permission_scope((username or {}).get("email"), user_token)
+
+    def fetch():
+        deadline = time.monotonic() + GENIE_QUERY_TIMEOUT_SECONDS
+        with genie_scheduler.admit(scope, space_id, PRIORITY_PREFETCH, deadline=deadline):
+            return genie_query(question, user_token, space_id, deadline=deadline)
+
+    if answer_cache.refresh_async(space_id, question, scope, fetch):
+        logger.info(f"Refreshing stale cached answer for space {space_id}")
+    return no_update
+
+###
+# CALLBACK: Serve Result Grid Rows
+#
+# Answers the infinite row model of a result grid. Each request carries the
+# visible row window plus the grid's sort and filter models; only that window
+# is read from the server-side table and sent back to the browser.
+###
+@app.callback(
+    Output({"type": "result-grid", "index": MATCH}, "getRowsResponse"),
+    Input({"type": "result-grid", "index": MATCH}, "getRowsRequest"),
+    prevent_initial_call=True
+)
+def serve_grid_rows(rows_request):
+    if not rows_request:
+        return no_update
+    table_uuid = callback_context.triggered_id["index"]
+    rows = result_row_model.get_rows(table_uuid, rows_request)
+    return rows if rows is not None else {"rowData": [], "rowCount": 0}
+
+###
+# ROUTE: Download a Result Table
+#
+# Streams a stored table in the requested format (see table_export) in
+# chunks, so large downloads neither pass through a callback response nor
+# load the table into memory. Finished exports are cached and served with
+# `send_file`, which handles HTTP range and conditional requests; a range
+# request for a table that has not been exported yet waits for the file.
+###
+@app.server.route("/export/<table_uuid>")
+def download_table(table_uuid):
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        abort(400)
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"exported_data_{table_uuid[:8]}{extension}"
+
+    path = table_exporter.cached_path(table_uuid, fmt)
+    if path is None and request.range is not None:
+        path = table_exporter.build(table_uuid, fmt)
+    if path is not None:
+        return send_file(path, mimetype=mimetype, as_attachment=True, download_name=filename, conditional=True, max_age=0)
+
+    chunks = table_exporter.stream(table_uuid, fmt)
+    if chunks is None:
+        logger.info(f"Export requested for evicted table {table_uuid}")
+        abort(404)
+    return Response(chunks, mimetype=mimetype, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+###
+# CALLBACK: Export a Result Table
+#
+# Handles the "Export as CSV" button and the "More formats" menu of a table.
+# If the table is still in the table store, the URL of its download route is
+# handed to the browser (see below); if it has expired or been evicted, a
+# notice is shown instead.
+###
+@app.callback(
+    Output("export-url-store", "data"),
     Output("processed-export-clicks", "data"),
+    Output("table-expired-toast", "is_open"),
     Input({"type": "export-button", "index": ALL}, "n_clicks"),
+    Input({"type": "export-format-button", "index": ALL, "format": ALL}, "n_clicks"),
     State("processed-export-clicks", "data"),
     prevent_initial_call=True,
 )
-def export_csv(n_clicks_list, processed_clicks):
+def export_table(n_clicks_list, format_clicks_list, processed_clicks):
     ctx = dash.callback_context
     if not ctx.triggered:
-        return dash.no_update, no_update
+        return dash.no_update, no_update, no_update
 
     triggered_input = ctx.triggered[0]
     button_id_dict = json.loads(triggered_input["prop_id"].split(".")[0])
     table_uuid = button_id_dict["index"]
+    fmt = button_id_dict.get("format", "csv")
+    click_key = f"{table_uuid}:{fmt}"
     n_clicks = triggered_input["value"]
 
-    if not n_clicks or processed_clicks.get(table_uuid) == n_clicks:
-        return dash.no_update, no_update
+    if not n_clicks or processed_clicks.get(click_key) == n_clicks:
+        return dash.no_update, no_update, no_update
 
-    # Retrieve the DataFrame as a CSV string from the diskcache
-    df_csv_string = df_cache_for_long_callbacks.get(table_uuid)
-    if df_csv_string is None:
-        return dash.no_update, no_update
+    processed_clicks[click_key] = n_clicks
+    if table_uuid not in df_cache_for_long_callbacks:
+        logger.info(f"Export requested for evicted table {table_uuid}")
+        return dash.no_update, processed_clicks, True
 
-    # Reconstruct the DataFrame from the CSV string
-    df = pd.read_csv(StringIO(df_csv_string))
-    
-    processed_clicks[table_uuid] = n_clicks
-    return dcc.send_data_frame(df.to_csv, f"exported_data_{table_uuid[:8]}.csv", index=False), processed_clicks
+    # The click count makes every click's URL distinct, so repeated
+    # downloads of the same table still trigger the browser callback.
+    return f"/export/{table_uuid}?format={fmt}&click={n_clicks}", processed_clicks, False
+
+###
+# CALLBACK: Start a Download
+#
+# Runs in the browser: opens the download URL through a temporary link, so
+# the file is streamed straight from the server instead of being embedded in
+# a callback response.
+###
+app.clientside_callback(
+    """
+    function(url) {
+        if (!url) {
+            return window.dash_clientside.no_update;
+        }
+        const link = document.createElement('a');
+        link.href = url;
+        link.download = '';
+        document.body.appendChild(link);
+        link.click();
+        link.remove();
+        return '';
+    }
+    """,
+    Output('dummy-download', 'children'),
+    Input('export-url-store', 'data'),
+    prevent_initial_call=True
+)
+
+###
+# ROUTE: Prometheus Metrics
+#
+# Renders every metric in the Prometheus text format. Samples recorded by
+# any process (including background callbacks) are included. Access is
+# limited by METRICS_TOKEN and METRICS_ALLOWED_USERS (see the top of the file).
+###
+@app.server.route("/metrics")
+def prometheus_metrics():
+    if not METRICS_TOKEN and not METRICS_ALLOWED_USERS:
+        abort(404)
+    token = request.headers.get("X-Metrics-Token", "")
+    user = request.headers.get("X-Forwarded-Preferred-Username", "").lower()
+    if not (METRICS_TOKEN and hmac.compare_digest(token, METRICS_TOKEN)) and user not in METRICS_ALLOWED_USERS:
+        abort(403)
+    return Response(METRICS.render(), content_type=METRICS_CONTENT_TYPE)
+
+###
+# ROUTE: Download a Full-Result Export
+#
+# Serves the gzip-compressed CSV written by a finished full-result export.
+###
+@app.server.route("/export-full/<job_id>")
+def download_full_export(job_id):
+    path = full_exporter.file_path(job_id)
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype=FULL_EXPORT_MIMETYPE, as_attachment=True,
+                     download_name=f"full_result_{job_id[:8]}.csv.gz", conditional=True, max_age=0)
+
+###
+# HELPER: full_export_status
+#
+# Returns the progress message of a full-result export and whether polling
+# should stop.
+###
+def full_export_status(job_id):
+    state = full_exporter.status(job_id)
+    if state is None:
+        return "This export has expired. Please start it again.", True
+    if state["status"] == DONE:
+        return html.Span([
+            f"Full result exported: {state['rows']:,} rows ({state['bytes'] / 2**20:.1f} MB). ",
+            html.A("Download CSV (gzip)", href=f"/export-full/{job_id}", download="")
+        ]), True
+    if state["status"] == FAILED:
+        return f"The full export failed after {state['rows']:,} rows: {state['error']}", True
+    if state["rows"] == 0:
+        return "Exporting the full result...", False
+    total = state.get("total_rows")
+    if total:
+        return f"Exporting the full result... {state['rows']:,} of {total:,} rows ({state['rows'] / total:.0%})", False
+    return f"Exporting the full result... {state['rows']:,} rows", False
+
+###
+# CALLBACK: Start a Full-Result Export
+#
+# Handles the "Export full result" button of a table. The table's Genie query
+# is run again on the full exporter's thread pool in this (server) process,
+# admitted by the scheduler at prefetch priority so that it never holds up
+# interactive questions. A message reporting the export's progress is added
+# to the chat.
+###
+@app.callback(
+    [Output("chat-messages", "children", allow_duplicate=True),
+     Output("processed-export-clicks", "data", allow_duplicate=True)],
+    Input({"type": "full-export-button", "index": ALL}, "n_clicks"),
+    [State("processed-export-clicks", "data"),
+     State("user-token-store", "data"),
+     State("username-store", "data"),
+     State("client-id-store", "data"),
+     State("session-store", "data")],
+    prevent_initial_call=True
+)
+def start_full_export(n_clicks_list, processed_clicks, user_token, username, client_id, session_data):
+    ctx = dash.callback_context
+    if not ctx.triggered:
+        return no_update, no_update
+
+    triggered_input = ctx.triggered[0]
+    table_uuid = json.loads(triggered_input["prop_id"].split(".")[0])["index"]
+    click_key = f"{table_uuid}:full"
+    n_clicks = triggered_input["value"]
+    if not n_clicks or processed_clicks.get(click_key) == n_clicks:
+        return no_update, no_update
+    processed_clicks[click_key] = n_clicks
+
+    scope = permission_scope((username or {}).get("email"), user_token)
+
+    def open_stream(source):
+        client = get_genie_client(host=os.environ.get("DATABRICKS_HOST"), space_id=source["space_id"], token=user_token)
+        # Only running the query is admitted; paging through its result
+        # does not call the Genie API.
+        with genie_scheduler.admit(scope, source["space_id"], PRIORITY_PREFETCH):
+            return client.execute_query_stream(source["conversation_id"], source["message_id"], source["attachment_id"])
+
+    job_id = full_exporter.start(table_uuid, open_stream)
+    if job_id is None:
+        status = html.Div("The query behind this table is no longer available, so its full result cannot be exported.",
+                          className="message-text-bot")
+    else:
+        logger.info(f"Started full export {job_id} of table {table_uuid}")
+        status = html.Div([
+            html.Div(full_export_status(job_id)[0], id={"type": "full-export-status", "index": job_id}),
+            dcc.Interval(id={"type": "full-export-poll", "index": job_id}, interval=1000)
+        ], className="message-text-bot")
+
+    export_message = html.Div([
+        html.Div(html.Div(className="model-avatar"), className="model-info"),
+        html.Div(status, className="message-content")
+    ], className="bot-message message")
+    persist_bot_message(client_id, session_data, export_message)
+
+    updated_messages = Patch()
+    updated_messages.append(export_message)
+    return updated_messages, processed_clicks
+
+###
+# CALLBACK: Report Full-Export Progress
+#
+# Polls the state of a full-result export and shows its progress, then the
+# download link once it has finished (which also stops the polling).
+###
+@app.callback(
+    [Output({"type": "full-export-status", "index": MATCH}, "children"),
+     Output({"type": "full-export-poll", "index": MATCH}, "disabled")],
+    Input({"type": "full-export-poll", "index": MATCH}, "n_intervals"),
+    State({"type": "full-export-poll", "index": MATCH}, "id"),
+    prevent_initial_call=True
+)
+def update_full_export_status(_, poll_id):
+    return full_export_status(poll_id["index"])
 
 ###
 # CALLBACK: Toggle Sidebar Visibility
@@ -624,8 +1281,8 @@ def toggle_sidebar(n_clicks, current_sidebar_class, current_left_component_class
 # CALLBACK: Display Selected Chat History
 #
 # When a user clicks on a past conversation in the sidebar's chat list, this
-# callback retrieves the corresponding message history from the `chat-history-store`
-# and displays it in the main chat window.
+# callback loads the corresponding messages from the server-side conversation
+# store and displays them in the main chat window.
 ###
 @app.callback(
     [Output("chat-messages", "children", allow_duplicate=True),
@@ -634,40 +1291,37 @@ def toggle_sidebar(n_clicks, current_sidebar_class, current_left_component_class
      Output("session-store", "data", allow_duplicate=True),
      Output("conversation-id-store", "data", allow_duplicate=True)],
     Input({"type": "chat-item", "index": ALL}, "n_clicks"),
-    [State("chat-history-store", "data"),
-     State("chat-list", "children"),
-     State("session-store", "data")],
+    [State("chat-list", "children"),
+     State("client-id-store", "data")],
     prevent_initial_call=True
 )
-def show_chat_history(n_clicks, chat_history, current_chat_list, session_data):
+def show_chat_history(n_clicks, current_chat_list, client_id):
     ctx = dash.callback_context
-    if not any(n_clicks):
+    if not any(n_clicks) or not client_id:
         return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
 
-    clicked_id = json.loads(ctx.triggered[0]["prop_id"].split(".")[0])
-    clicked_index = clicked_id["index"]
-    
-    if not chat_history or clicked_index >= len(chat_history):
+    clicked_session_id = ctx.triggered_id["index"]
+    session = conversation_store.get_session(client_id, clicked_session_id)
+    if session is None:
         return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
 
-    new_session_data = {"current_session": clicked_index}
-    
-    conversation_id_to_restore = chat_history[clicked_index].get("conversation_id")
+    new_session_data = {"current_session": clicked_session_id}
 
     updated_chat_list = []
-    for i, item in enumerate(current_chat_list):
-        item['props']['className'] = "chat-item active" if i == clicked_index else "chat-item"
+    for item in current_chat_list:
+        item['props']['className'] = "chat-item active" if item['props']['id']['index'] == clicked_session_id else "chat-item"
         updated_chat_list.append(item)
 
-    return (chat_history[clicked_index]["messages"], "welcome-container hidden",
-            updated_chat_list, new_session_data, conversation_id_to_restore)
+    messages = conversation_store.get_messages(client_id, clicked_session_id)
+    return (messages, "welcome-container hidden",
+            updated_chat_list, new_session_data, session["conversation_id"])
 
 ###
 # CALLBACK: Restore Session on Page Load
 #
 # When the app is refreshed, this callback restores the chat UI from the
-# state persisted in session storage. It populates the chat messages and
-# the sidebar chat list, ensuring a seamless user experience.
+# session list persisted in session storage and the messages kept in the
+# conversation store, ensuring a seamless user experience.
 ###
 @app.callback(
     [Output("chat-messages", "children", allow_duplicate=True),
@@ -675,36 +1329,30 @@ def show_chat_history(n_clicks, chat_history, current_chat_list, session_data):
      Output("welcome-container", "className", allow_duplicate=True)],
     Input("main-content", "style"), # Trigger after main chat UI becomes visible
     [State("chat-history-store", "data"),
-     State("session-store", "data")],
+     State("session-store", "data"),
+     State("client-id-store", "data")],
     prevent_initial_call=True
 )
-def restore_session_on_load(main_style, chat_history, session_data):
+def restore_session_on_load(main_style, chat_history, session_data, client_id):
     # This callback runs when the main content area is shown (e.g., after agent selection or on page reload with a selected agent)
     if not main_style or main_style.get("display") == "none":
         return dash.no_update, dash.no_update, dash.no_update
 
     # Check if there's any history or an active session to restore
-    if not chat_history or not session_data or session_data.get("current_session") is None:
+    if not chat_history or not client_id or not session_data or session_data.get("current_session") is None:
         return dash.no_update, dash.no_update, dash.no_update
 
-    current_session_index = session_data.get("current_session")
+    current_session_id = session_data.get("current_session")
 
-    # Validate the session index against the chat history length
-    if not isinstance(current_session_index, int) or current_session_index >= len(chat_history):
+    # Validate the session against the server-side store
+    if conversation_store.get_session(client_id, current_session_id) is None:
         return dash.no_update, dash.no_update, dash.no_update
 
     # Restore the chat messages for the active session
-    messages = chat_history[current_session_index].get("messages", [])
+    messages = conversation_store.get_messages(client_id, current_session_id)
 
     # Rebuild the list of conversations in the sidebar
-    chat_list = [
-        html.Div(
-            session["queries"][0],
-            className=f"chat-item{' active' if i == current_session_index else ''}",
-            id={"type": "chat-item", "index": i}
-        )
-        for i, session in enumerate(chat_history)
-    ]
+    chat_list = render_chat_list(chat_history, current_session_id)
     
     # Hide the welcome container if there are messages to display
     welcome_class = "welcome-container hidden" if messages else "welcome-container visible"
@@ -746,19 +1394,17 @@ app.clientside_callback(
     [Output("chat-messages", "children", allow_duplicate=True),
      Output("chat-trigger", "data", allow_duplicate=True),
      Output("query-running-store", "data", allow_duplicate=True),
-     Output("chat-history-store", "data", allow_duplicate=True),
      Output("session-store", "data", allow_duplicate=True),
      Output("conversation-id-store", "data", allow_duplicate=True)],
     [Input("new-chat-button", "n_clicks"),
      Input("sidebar-new-chat-button", "n_clicks")],
-    State("chat-history-store", "data"),
     prevent_initial_call=True
 )
-def reset_to_welcome(n_clicks1, n_clicks2, chat_history_store):
+def reset_to_welcome(n_clicks1, n_clicks2):
     if not callback_context.triggered:
-        return [no_update] * 6
+        return [no_update] * 5
     
-    return [], {"trigger": False, "message": ""}, False, chat_history_store, {"current_session": None}, None
+    return [], {"trigger": False, "message": ""}, False, {"current_session": None}, None
 
 ###
 # CALLBACK: Change Agent and Reset UI
@@ -772,38 +1418,41 @@ def reset_to_welcome(n_clicks1, n_clicks2, chat_history_store):
      Output("chat-messages", "children", allow_duplicate=True),
      Output("chat-trigger", "data", allow_duplicate=True),
      Output("query-running-store", "data", allow_duplicate=True),
-     Output("chat-history-store", "data", allow_duplicate=True),
      Output("session-store", "data", allow_duplicate=True),
      Output("conversation-id-store", "data", allow_duplicate=True)],
     Input("change-space-button", "n_clicks"),
-    State("chat-history-store", "data"),
     prevent_initial_call=True
 )
-def change_space_and_reset(n_clicks, chat_history):
+def change_space_and_reset(n_clicks):
     if not n_clicks:
-        return [no_update] * 7
-    return None, [], {"trigger": False, "message": ""}, False, chat_history, {"current_session": None}, None
+        return [no_update] * 6
+    return None, [], {"trigger": False, "message": ""}, False, {"current_session": None}, None
 
 ###
 # CALLBACK: Show/Hide Welcome Container
 #
 # This callback controls the visibility of the initial welcome screen. It hides
 # the welcome message container as soon as the chat history is populated with
-# any messages.
+# any messages. It runs in the browser so the chat messages are never sent to
+# the server just to check whether there are any.
 ###
-@app.callback(
+app.clientside_callback(
+    """
+    function(chat_messages) {
+        return (chat_messages && chat_messages.length) ? "welcome-container hidden" : "welcome-container visible";
+    }
+    """,
     Output("welcome-container", "className", allow_duplicate=True),
     Input("chat-messages", "children"),
     prevent_initial_call=True
 )
-def reset_query_running(chat_messages):
-    return "welcome-container hidden" if chat_messages else "welcome-container visible"
 
 ###
 # CALLBACK: Disable Inputs While Query is Running
 #
 # To prevent multiple submissions, this callback disables the chat input field
-# and send/new-chat buttons whenever a query is being processed by the backend.
+# and send button whenever a query is being processed by the backend. The
+# new-chat buttons stay enabled so that they can cancel it.
 # This callback will no longer be strictly necessary for get_model_response
 # and confirm_and_generate_insights due to `running` arg in long_callback.
 # However, it might still be useful for other parts of the app.
@@ -811,16 +1460,14 @@ def reset_query_running(chat_messages):
 @app.callback(
     [Output("chat-input-fixed", "disabled"),
      Output("mic-button", "disabled"),
-     Output("send-button-fixed", "disabled"),
-     Output("new-chat-button", "disabled"),
-     Output("sidebar-new-chat-button", "disabled")],
+     Output("send-button-fixed", "disabled")],
     Input("query-running-store", "data")
 )
 def toggle_input_disabled(query_running):
     # This callback now acts as a fallback/general input disabler.
     # The `running` argument in long_callback handles specific disabling
     # during its execution.
-    return [query_running] * 5
+    return [query_running] * 3
 
 ###
 # CALLBACK: Open Insight Modal
@@ -885,7 +1532,9 @@ def close_modal_on_confirm(n_clicks):
 #
 # This is the first step in the insight generation chain. After the user
 # confirms the prompt, this callback adds a "Generating insights..." indicator
-# to the chat and triggers the final processing callback.
+# to the chat and triggers the final processing callback. When insights are
+# streamed, the indicator's "insight-stream" container is filled with the
+# text received so far.
 ###
 @app.callback(
     [Output("chat-messages", "children", allow_duplicate=True),
@@ -894,19 +1543,22 @@ def close_modal_on_confirm(n_clicks):
     Input("confirm-insight-prompt-button", "n_clicks"),
     [State("insight-prompt-textarea", "value"),
      State("current-dataframe-uuid", "data"),
-     State("chat-messages", "children"),
      State("query-running-store", "data")],
     prevent_initial_call=True
 )
-def trigger_insight_generation(n_clicks, prompt_value, table_uuid, current_messages, query_running):
+def trigger_insight_generation(n_clicks, prompt_value, table_uuid, query_running):
     if not n_clicks or not table_uuid or query_running:
         return no_update, no_update, no_update
 
     thinking_indicator = html.Div(
-        html.Div([html.Span(className="spinner"), html.Span("Generating insights...")], className="thinking-indicator"),
+        html.Div(
+            html.Div([html.Span(className="spinner"), html.Span("Generating insights...")], className="thinking-indicator"),
+            id="insight-stream"
+        ),
         className="bot-message message"
     )
-    updated_messages = (current_messages or []) + [thinking_indicator]
+    updated_messages = Patch()
+    updated_messages.append(thinking_indicator)
     trigger_data = {"table_uuid": table_uuid, "prompt_value": prompt_value}
     
     return updated_messages, True, trigger_data
@@ -916,47 +1568,62 @@ def trigger_insight_generation(n_clicks, prompt_value, table_uuid, current_messa
 #
 # This is the final step in the insight generation chain. It retrieves the
 # DataFrame from the server-side cache, calls the LLM to generate insights,
-# and then replaces the "Generating..." indicator with the final result.
+# and then replaces the "Generating..." indicator with the final result. With
+# INSIGHTS_STREAMING the answer appears token by token while it is generated;
+# the callback is polled every INSIGHT_STREAM_PUSH_SECONDS to pick it up.
 ###
 @app.callback(
     [Output("chat-messages", "children", allow_duplicate=True),
      Output("query-running-store", "data", allow_duplicate=True),
-     Output("chat-history-store", "data", allow_duplicate=True),
      Output("insight-trigger-store", "data", allow_duplicate=True)],
     Input("insight-trigger-store", "data"),
-    [State("chat-history-store", "data"),
-     State("chat-messages", "children"),
-     State("session-store", "data")],
+    [State("session-store", "data"),
+     State("client-id-store", "data"),
+     State("user-token-store", "data"),
+     State("username-store", "data")],
     prevent_initial_call=True,
     background=True,
+    interval=int(INSIGHT_STREAM_PUSH_SECONDS * 1000),
     # Define outputs to be updated while the callback is running
     running=[
         (Output("chat-input-fixed", "disabled"), True, False),
         (Output("mic-button", "disabled"), True, False),
         (Output("send-button-fixed", "disabled"), True, False),
-        (Output("new-chat-button", "disabled"), True, False),
-        (Output("sidebar-new-chat-button", "disabled"), True, False),
     ],
+    # "New chat" and "Change agent" abandon the answer, so they stop the job.
+    cancel=CANCEL_INPUTS,
 )
-def confirm_and_generate_insights(trigger_data, chat_history, current_messages, session_data):
+def confirm_and_generate_insights(trigger_data, session_data, client_id, user_token, username):
     # This callback can now be long-running without blocking the main Dash thread.
     if not trigger_data:
-        return no_update, no_update, no_update, no_update
+        return no_update, no_update, no_update
 
     table_uuid = trigger_data["table_uuid"]
     prompt_value = trigger_data["prompt_value"]
-    messages_without_thinking = current_messages[:-1]
-
-    # Retrieve the DataFrame as a CSV string from the diskcache
-    df_csv_string = df_cache_for_long_callbacks.get(table_uuid)
-    if df_csv_string is None:
-        error_msg = "Error: Data not found for insights."
-        error_response = html.Div(html.Div(html.Div(error_msg, className="message-text-bot"), className="message-content"), className="bot-message message")
-        updated_messages = messages_without_thinking + [error_response]
+    # Counted against the same per-user limit as the user's questions.
+    user = permission_scope((username or {}).get("email"), user_token) or client_id
+
+    # The prompt gets the table as CSV if it fits the token budget, otherwise a
+    # compact profile of it; either is computed once per table and cached.
+    def build_table_text():
+        df = df_cache_for_long_callbacks.get(table_uuid)
+        return table_for_prompt(df) if df is not None else None
+
+    table_text = None
+    if table_uuid in df_cache_for_long_callbacks:
+        table_text = df_cache_for_long_callbacks.derived(table_uuid, f"prompt-{INSIGHT_TABLE_TOKEN_BUDGET}", build_table_text)
+    if table_text is None:
+        logger.info(f"Insights requested for evicted table {table_uuid}")
+        error_msg = TABLE_EXPIRED_MESSAGE
+        insight_message = html.Div(html.Div(html.Div(error_msg, className="message-text-bot"), className="message-content"), className="bot-message message")
     else:
         try:
-            # Pass the DataFrame as a CSV string to the cached function (df_csv_string is already CSV)
-            insights = call_llm_for_insights(df_csv_string, prompt=prompt_value)
+            # Streamed answers are pushed into the chat as they arrive,
+            # otherwise the blocking call is used; both use the insight cache.
+            if INSIGHTS_STREAMING:
+                insights = stream_llm_insights(table_text, prompt=prompt_value, user=user)
+            else:
+                insights = call_llm_for_insights(table_text, prompt=prompt_value, user=user)
             # Create the "Ask follow-up" button
             ask_follow_up_button = html.Button(
                 "Ask follow-up", 
@@ -971,27 +1638,34 @@ def confirm_and_generate_insights(trigger_data, chat_history, current_messages,
                     ask_follow_up_button
                 ], className="message-content")
             ], className="bot-message message", id=f"insight-response-{uuid.uuid4()}")
-            updated_messages = messages_without_thinking + [insight_message]
         except Exception as e:
             error_msg = f"Error generating insights: {str(e)}"
-            error_response = html.Div(html.Div(html.Div(error_msg, className="message-text-bot"), className="message-content"), className="bot-message message")
-            updated_messages = messages_without_thinking + [error_response]
+            insight_message = html.Div(html.Div(html.Div(error_msg, className="message-text-bot"), className="message-content"), className="bot-message message")
     
-    if chat_history and session_data and session_data.get("current_session") is not None:
-        current_session_index = session_data["current_session"]
-        # Ensure chat_history is a mutable list. If it's a tuple from the state, convert it.
-        chat_history_list = list(chat_history) if isinstance(chat_history, tuple) else chat_history
-        if 0 <= current_session_index < len(chat_history_list):
-            chat_history_list[current_session_index]["messages"] = updated_messages
-        chat_history = chat_history_list
-        
-    return updated_messages, False, chat_history, None
+    persist_bot_message(client_id, session_data, insight_message)
+
+    # Replace the "Generating insights..." indicator
+    updated_messages = Patch()
+    updated_messages[-1] = insight_message
+    return updated_messages, False, None
+
+###
+# HELPER: Request Scope
+#
+# The permission scope (see answer_cache.permission_scope) of the user making
+# the current request, read from the authentication proxy's headers.
+###
+def request_scope():
+    return permission_scope(request.headers.get("X-Forwarded-Preferred-Username"),
+                            request.headers.get("X-Forwarded-Access-Token"))
 
 ###
 # CALLBACK: Fetch Available Agents (Spaces)
 #
-# On application load, this callback contacts the Genie API to get a list of
-# all available BI agents (called "spaces") that the user can interact with.
+# On application load, this callback gets the first page of the BI agents
+# (called "spaces") that the user can interact with from the spaces catalog.
+# The rest of the catalog is listed in the background and reached through
+# the dropdown's server-side search.
 ###
 @app.callback(
     Output("spaces-list", "data"),
@@ -1002,8 +1676,8 @@ def fetch_spaces(_):
         headers = request.headers
         token = headers.get('X-Forwarded-Access-Token')
         host = os.environ.get("DATABRICKS_HOST")
-        client = GenieClient(host=host, space_id="", token=token)
-        return client.list_spaces()
+        client = get_genie_client(host=host, space_id="", token=token)
+        return spaces_catalog.first_page(request_scope() or "anonymous", client)
     except Exception as e:
         logger.error(f"Failed to fetch spaces: {e}")
         return []
@@ -1011,16 +1685,27 @@ def fetch_spaces(_):
 ###
 # CALLBACK: Populate Agent Selection Dropdown
 #
-# Populates the dropdown on the initial selection screen with the list of
-# agents fetched by the `fetch_spaces` callback.
+# Populates the dropdown on the initial selection screen with the first page
+# of agents fetched by `fetch_spaces`. While the user types, the options are
+# replaced by the matching agents from the full catalog; the selected agent
+# is always kept so the dropdown can display it.
 ###
 @app.callback(
     Output("space-dropdown", "options"),
-    Input("spaces-list", "data")
+    [Input("spaces-list", "data"),
+     Input("space-dropdown", "search_value")],
+    State("space-dropdown", "value")
 )
-def update_space_dropdown(spaces):
+def update_space_dropdown(spaces, search_value, selected_value):
+    scope = request_scope() or "anonymous"
+    if search_value:
+        spaces = spaces_catalog.search(scope, search_value)
+    if selected_value and not any(s.get('space_id') == selected_value for s in spaces or []):
+        selected = spaces_catalog.get_space(scope, selected_value)
+        spaces = (spaces or []) + ([selected] if selected else [])
     if not spaces:
-        return [{"label": "No available agents", "value": "no_spaces_found", "disabled": True}]
+        label = "No matching agents" if search_value else "No available agents"
+        return [{"label": label, "value": "no_spaces_found", "disabled": True}]
     return [{"label": s.get('title', ''), "value": s.get('space_id', '')} for s in spaces]
 
 ###
@@ -1058,7 +1743,8 @@ def select_space(n_clicks, space_id, spaces):
     if not n_clicks or not space_id:
         return no_update, no_update, no_update, no_update, no_update
         
-    selected = next((s for s in spaces if s["space_id"] == space_id), {})
+    selected = (spaces_catalog.get_space(request_scope() or "anonymous", space_id)
+                or next((s for s in spaces if s["space_id"] == space_id), {}))
     title = selected.get("title")
     description = selected.get("description")
     return space_id, {"display": "none"}, {"display": "block"}, title, description
@@ -1199,7 +1885,9 @@ def update_username_display(user_data):
 # SCRIPT EXECUTION
 #
 # This standard Python construct ensures that the Dash development server
-# is started only when the script is executed directly.
+# is started only when the script is executed directly, for local
+# development. Deployments serve `server` with gunicorn (see app.yaml).
 ###
 if __name__ == "__main__":
+    init_server_process()
     app.run(debug=False)
\ No newline at end of file
@@ -0,0 +1,125 @@
+###
+# BENCHMARK: APP IMPORT TIME
+#
+# Measures how long `import app` takes in a fresh interpreter, which is the
+# cold start of every server process, using Python's `-X importtime` report.
+# Prints the import time per top-level package and fails (exit status 1) if
+# a module that app.py loads lazily (the Databricks SDK, by default) is
+# imported, or if the import takes longer than --max-seconds. Also times
+# `app.warm_up()`, the part of the start-up cost that moved out of the import.
+#
+# Usage (from the genie_space directory):
+#     python benchmarks/bench_import_time.py --repeat 5 --max-seconds 2 --json import_time.json
+###
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules app.py must not import at start-up.
+DEFAULT_FORBIDDEN = ("databricks.sdk", "sqlparse")
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+###
+# FUNCTION: run_import
+#
+# Imports the app in a fresh interpreter with `-X importtime` and returns the
+# wall time, the parsed report as (module, self µs, cumulative µs, depth)
+# rows and whatever the code printed. Runs in a temporary directory so the
+# caches the app opens on import start empty and are thrown away.
+###
+def run_import(code: str) -> Tuple[float, List[Tuple[str, int, int, int]], str]:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [APP_DIR, os.environ.get("PYTHONPATH")])))
+    with tempfile.TemporaryDirectory() as cwd:
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=cwd, env=env,
+                              capture_output=True, text=True, timeout=300)
+        wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"`{code}` failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return wall, rows, proc.stdout
+
+
+def by_package(rows: List[Tuple[str, int, int, int]]) -> Dict[str, float]:
+    totals: Dict[str, float] = defaultdict(float)
+    for module, self_us, _, _ in rows:
+        totals[module.split(".")[0]] += self_us / 1e6
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cold-start import time of the Dash app.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs; the fastest one is reported")
+    parser.add_argument("--top", type=int, default=15, help="Packages shown")
+    parser.add_argument("--forbid", nargs="*", default=list(DEFAULT_FORBIDDEN),
+                        help="Modules (and their submodules) that must not be imported")
+    parser.add_argument("--max-seconds", type=float, help="Fail if importing app takes longer")
+    parser.add_argument("--no-warm-up", action="store_true", help="Do not time app.warm_up()")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    runs = [run_import("import app") for _ in range(args.repeat)]
+    wall, rows, _ = min(runs, key=lambda run: run[0])
+    app_seconds = next((cumulative / 1e6 for module, _, cumulative, _ in rows if module == "app"), None)
+    packages = by_package(rows)
+    forbidden = sorted(module for module, _, _, _ in rows
+                       if any(module == name or module.startswith(name + ".") for name in args.forbid))
+
+    print(f"import app: {app_seconds:.3f}s of imports, {wall:.3f}s wall (best of {args.repeat}), "
+          f"{len(rows)} modules")
+    for package, seconds in list(packages.items())[:args.top]:
+        print(f"  {package:<28} {seconds * 1000:8.1f} ms")
+
+    warm_up = None
+    if not args.no_warm_up:
+        code = "import time, app; start = time.perf_counter(); app.warm_up(); print(time.perf_counter() - start)"
+        warm_wall, _, output = run_import(code)
+        warm_up = {"warm_up_s": float(output.split()[-1]), "wall_s": warm_wall}
+        print(f"app.warm_up(): {warm_up['warm_up_s']:.3f}s; import app + warm_up(): {warm_wall:.3f}s wall")
+
+    failures = []
+    if forbidden:
+        failures.append(f"imported at start-up: {', '.join(forbidden[:10])}"
+                        + (f" and {len(forbidden) - 10} more" if len(forbidden) > 10 else ""))
+    if args.max_seconds is not None and app_seconds is not None and app_seconds > args.max_seconds:
+        failures.append(f"import took {app_seconds:.3f}s, over the {args.max_seconds:.3f}s limit")
+
+    if args.json:
+        report: Dict[str, Any] = {
+            "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "python": sys.version.split()[0],
+                     "args": vars(args)},
+            "import_s": app_seconds,
+            "wall_s": wall,
+            "wall_runs_s": [run[0] for run in runs],
+            "modules": len(rows),
+            "packages_s": packages,
+            "warm_up": warm_up,
+            "forbidden": forbidden,
+            "failures": failures,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
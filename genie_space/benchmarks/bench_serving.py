@@ -0,0 +1,290 @@
+###
+# BENCHMARK: SERVING THROUGHPUT
+#
+# Load-tests the suggestion-button flow over HTTP against the Dash
+# development server (`python app.py`) and gunicorn (gunicorn.conf.py), both
+# running the app with a fake Genie backend (fake_genie_app.py). Each
+# simulated user repeatedly does what the browser does after a click on a
+# suggestion:
+#
+#   1. the `handle_all_inputs` callback (user message + "Thinking...")
+#   2. the `get_model_response` background callback, which starts a job
+#   3. polls of that job every --poll-interval seconds, as Dash's renderer
+#      does, until the answer (a result table) is returned
+#
+# and reports completed flows per second and flow latency. Every flow uses
+# a new user, so no answer comes from the answer cache, and the scheduler's
+# Genie rate limits are raised so that they do not cap the measurement.
+#
+# Usage (from the genie_space directory):
+#     python benchmarks/bench_serving.py --servers dev gunicorn --users 8 32 --duration 30 --json serving.json
+###
+import argparse
+import json
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+
+SUGGESTION = "suggestion-1"
+SUGGESTION_TEXTS = {
+    "suggestion-1-text": "What is the purpose of this Agent? Give me a short summary.",
+    "suggestion-2-text": "How to converse with the Agent? Give me an example prompt.",
+    "suggestion-3-text": "Explain the dataset behind this Agent.",
+    "suggestion-4-text": "What columns or fields are available in this dataset?",
+}
+
+# The scheduler would otherwise admit 2 new Genie questions per second.
+UNLIMITED_SCHEDULER = {
+    "GENIE_RATE_PER_SECOND": "100000",
+    "GENIE_RATE_BURST": "100000",
+    "GENIE_MAX_CONCURRENT": "100000",
+    "GENIE_MAX_CONCURRENT_PER_SPACE": "100000",
+}
+
+
+###
+# FUNCTION: start_server
+#
+# Starts the app with the fake backend in a scratch directory and waits
+# until it answers. Returns the process; its caches go with the directory,
+# its log to --log-dir if given.
+###
+def start_server(kind: str, port: int, directory: str, args: argparse.Namespace) -> subprocess.Popen:
+    env = dict(os.environ, **UNLIMITED_SCHEDULER,
+               PYTHONPATH=os.pathsep.join([APP_DIR, BENCH_DIR]),
+               PORT=str(port), GUNICORN_BIND=f"127.0.0.1:{port}",
+               FAKE_GENIE_SECONDS=str(args.genie_seconds), FAKE_GENIE_ROWS=str(args.rows))
+    if args.workers:
+        env["GUNICORN_WORKERS"] = str(args.workers)
+    if args.threads:
+        env["GUNICORN_THREADS"] = str(args.threads)
+    if kind == "dev":
+        command = [sys.executable, "-m", "fake_genie_app"]
+    else:
+        command = [sys.executable, "-m", "gunicorn", "-c", os.path.join(APP_DIR, "gunicorn.conf.py"), "fake_genie_app:server"]
+    log = open(os.path.join(args.log_dir or directory, f"{kind}.log"), "wb")
+    proc = subprocess.Popen(command, cwd=directory, env=env, stdout=log, stderr=subprocess.STDOUT,
+                            start_new_session=True)
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{kind} server exited; see {log.name}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/_dash-layout", timeout=1).ok:
+                return proc
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    stop_server(proc)
+    raise RuntimeError(f"{kind} server did not start; see {log.name}")
+
+
+def stop_server(proc: subprocess.Popen) -> None:
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+    except ProcessLookupError:
+        pass
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+###
+# CLASS: Flow
+#
+# Builds callback requests the way Dash's renderer does, from the
+# callback definitions the server publishes at /_dash-dependencies.
+###
+class Flow:
+    def __init__(self, base_url: str, poll_interval: float, timeout: float):
+        self.base_url = base_url
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        dependencies = requests.get(f"{base_url}/_dash-dependencies", timeout=30).json()
+        self.click = self._find(dependencies, f"{SUGGESTION}.n_clicks")
+        self.answer = self._find(dependencies, "chat-trigger.data")
+
+    @staticmethod
+    def _find(dependencies: List[Dict[str, Any]], input_id: str) -> Dict[str, Any]:
+        for dependency in dependencies:
+            if any(f"{i['id']}.{i['property']}" == input_id for i in dependency["inputs"]):
+                return dependency
+        raise LookupError(f"No callback takes {input_id} as input")
+
+    @staticmethod
+    def _body(dependency: Dict[str, Any], values: Dict[str, Any], changed: str) -> Dict[str, Any]:
+        outputs = [dict(zip(("id", "property"), output.split(".", 1)))
+                   for output in dependency["output"].strip(".").split("...")]
+        return {
+            "output": dependency["output"],
+            "outputs": outputs if len(outputs) > 1 else outputs[0],
+            "inputs": [dict(i, value=values.get(f"{i['id']}.{i['property']}")) for i in dependency["inputs"]],
+            "state": [dict(s, value=values.get(f"{s['id']}.{s['property']}")) for s in dependency["state"]],
+            "changedPropIds": [changed],
+        }
+
+    def _post(self, session: requests.Session, body: Dict[str, Any], params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        url = f"{self.base_url}/_dash-update-component"
+        try:
+            response = session.post(url, json=body, params=params, timeout=60)
+        except requests.ConnectionError:
+            # Like a browser, retry once on a kept-alive connection that a
+            # restarting worker closed.
+            response = session.post(url, json=body, params=params, timeout=60)
+        response.raise_for_status()
+        return response.json()
+
+    ###
+    # METHOD: run
+    #
+    # Runs one click-to-answer flow and returns the number of HTTP requests
+    # it made. Raises if the answer is not a successful one or takes longer
+    # than the timeout.
+    ###
+    def run(self, session: requests.Session) -> int:
+        give_up = time.monotonic() + self.timeout
+        values: Dict[str, Any] = {f"{k}.children": v for k, v in SUGGESTION_TEXTS.items()}
+        values[f"{SUGGESTION}.n_clicks"] = 1
+        clicked = self._post(session, self._body(self.click, values, f"{SUGGESTION}.n_clicks"))["response"]
+        for component, props in clicked.items():
+            for prop, value in props.items():
+                values[f"{component}.{prop}"] = value
+
+        user = uuid.uuid4().hex
+        values.update({"selected-space-id.data": "bench-space", "user-token-store.data": f"token-{user}",
+                       "username-store.data": {"email": f"{user}@bench.invalid", "display_name": "Bench"}})
+        body = self._body(self.answer, values, "chat-trigger.data")
+        job = self._post(session, body)
+        requests_made = 2
+        while True:
+            time.sleep(self.poll_interval)
+            result = self._post(session, body, params={"cacheKey": job["cacheKey"], "job": job["job"]})
+            requests_made += 1
+            if "response" in result:
+                break
+            if time.monotonic() > give_up:
+                raise TimeoutError(f"No answer after {self.timeout:.0f}s (job {job['job']})")
+        if not result["response"].get("conversation-id-store", {}).get("data"):
+            raise RuntimeError(f"Flow did not get an answer: {json.dumps(result)[:300]}")
+        return requests_made
+
+
+###
+# FUNCTION: run_load
+#
+# Runs `users` concurrent users doing flows back to back for `duration`
+# seconds and summarizes the flows that completed in that time.
+###
+def run_load(flow: Flow, users: int, duration: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors: List[str] = []
+    counts = {"requests": 0}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def user() -> None:
+        with requests.Session() as session:
+            while time.monotonic() < stop_at:
+                start = time.monotonic()
+                try:
+                    made = flow.run(session)
+                except Exception as e:
+                    with lock:
+                        errors.append(str(e)[:200])
+                    continue
+                with lock:
+                    latencies.append(time.monotonic() - start)
+                    counts["requests"] += made
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=user) for _ in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    latencies.sort()
+
+    def percentile(p: float) -> Optional[float]:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+
+    return {
+        "flows": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "flows_per_second": len(latencies) / elapsed,
+        "requests_per_second": counts["requests"] / elapsed,
+        "latency_p50_s": percentile(0.5),
+        "latency_p95_s": percentile(0.95),
+        "latency_max_s": latencies[-1] if latencies else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Throughput of the suggestion-button flow per server.")
+    parser.add_argument("--servers", nargs="+", choices=("dev", "gunicorn"), default=["dev", "gunicorn"])
+    parser.add_argument("--users", type=int, nargs="+", default=[8, 32], help="Concurrent users per run")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per run")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between polls of a job")
+    parser.add_argument("--flow-timeout", type=float, default=60, help="Seconds before a flow counts as failed")
+    parser.add_argument("--genie-seconds", type=float, default=2.0, help="Time the fake Genie takes to answer")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows in each answer's result table")
+    parser.add_argument("--workers", type=int, help="GUNICORN_WORKERS (default: from gunicorn.conf.py)")
+    parser.add_argument("--threads", type=int, help="GUNICORN_THREADS (default: from gunicorn.conf.py)")
+    parser.add_argument("--log-dir", help="Keep the server logs in this directory")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+
+    results = []
+    for kind in args.servers:
+        with tempfile.TemporaryDirectory(prefix=f"bench-{kind}-") as directory:
+            port = _free_port()
+            proc = start_server(kind, port, directory, args)
+            try:
+                flow = Flow(f"http://127.0.0.1:{port}", args.poll_interval, args.flow_timeout)
+                with requests.Session() as session:
+                    flow.run(session)  # first answer pays for lazy set-up
+                for users in args.users:
+                    metrics = run_load(flow, users, args.duration)
+                    results.append({"server": kind, "users": users, **metrics})
+                    p50, p95 = metrics["latency_p50_s"], metrics["latency_p95_s"]
+                    print(f"{kind:<9} {users:>4} users  {metrics['flows_per_second']:6.2f} flows/s  "
+                          f"{metrics['requests_per_second']:7.1f} req/s  "
+                          f"p50 {p50 if p50 is None else round(p50, 2)}s  p95 {p95 if p95 is None else round(p95, 2)}s  "
+                          f"{metrics['errors']} errors")
+            finally:
+                stop_server(proc)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "python": platform.python_version(),
+                         "cpus": os.cpu_count(), "platform": platform.platform(), "args": vars(args)},
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
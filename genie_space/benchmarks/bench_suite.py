@@ -0,0 +1,403 @@
+###
+# BENCHMARK: OFFLINE SUITE
+#
+# Micro-benchmarks of the hot paths between a Genie answer and the chat,
+# run entirely offline against a fake Databricks SDK client:
+#
+#   response  process_genie_response turning synthetic `data_array` chunks
+#             into a schema-typed DataFrame (the real client code, with the
+#             SDK calls answered from memory)
+#   render    what a result table costs to display: the grid's column
+#             definitions and first row block (and its JSON payload),
+#             against the previous `to_dict('records')` + `tooltip_data`
+#   cache     the table store write/read round-trip, against the previous
+#             CSV string cache
+#   polling   wait_for_message_completion against a fake message that
+#             completes after a set time: polls made, wasted wait and CPU
+#             time per poll
+#
+# Results are written as JSON (with the git commit and library versions) so
+# runs from two commits can be compared with --compare.
+#
+# Usage (from the genie_space directory):
+#     python benchmarks/bench_suite.py --json before.json
+#     python benchmarks/bench_suite.py --json after.json --compare before.json
+###
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+# Circuit-breaker state and metrics of the fake client must not end up in
+# the app's state directories.
+_STATE_DIR = tempfile.mkdtemp(prefix="bench-state-")
+os.environ.setdefault("RESILIENCE_STATE_DIR", os.path.join(_STATE_DIR, "resilience"))
+os.environ.setdefault("METRICS_DIR", os.path.join(_STATE_DIR, "metrics"))
+
+import genie_room  # noqa: E402
+from genie_room import AsyncGenieClient, GenieClient, PollingPolicy, process_genie_response  # noqa: E402
+from row_model import RowModel, column_defs, GRID_BLOCK_SIZE  # noqa: E402
+from table_store import TABLE_CACHE_COMPRESSION, TableStore  # noqa: E402
+from bench_table_cache import bench_arrow, bench_csv  # noqa: E402
+
+SECTIONS = ("response", "render", "cache", "polling")
+
+# Schema of the synthetic result: one column per type the parser handles.
+SCHEMA_COLUMNS = [
+    {"name": "order_id", "type_name": "LONG"},
+    {"name": "amount", "type_name": "DOUBLE"},
+    {"name": "quantity", "type_name": "INT"},
+    {"name": "price", "type_name": "DECIMAL", "type_precision": 10, "type_scale": 2},
+    {"name": "order_date", "type_name": "DATE"},
+    {"name": "updated_at", "type_name": "TIMESTAMP"},
+    {"name": "shipped", "type_name": "BOOLEAN"},
+    {"name": "region", "type_name": "STRING"},
+    {"name": "customer", "type_name": "STRING"},
+]
+
+
+###
+# FUNCTION: make_data_array
+#
+# Builds `rows` rows of strings in the shape the Statement Execution API
+# returns them (JSON_ARRAY format: every value a string or None).
+###
+def make_data_array(rows: int, seed: int = 0) -> List[List[Optional[str]]]:
+    rng = np.random.default_rng(seed)
+    days = rng.integers(0, 365, rows)
+    dates = (np.datetime64("2024-01-01") + days).astype(str)
+    seconds = (np.datetime64("2024-01-01T00:00:00") + rng.integers(0, 365 * 86400, rows)).astype(str)
+    amount = rng.normal(1000, 250, rows).round(2).astype(str).astype(object)
+    amount[rng.random(rows) < 0.01] = None
+    columns = [
+        np.arange(rows).astype(str),
+        amount,
+        rng.integers(1, 50, rows).astype(str),
+        rng.uniform(1, 500, rows).round(2).astype(str),
+        dates,
+        np.char.add(seconds, "Z"),
+        np.where(rng.random(rows) > 0.3, "true", "false"),
+        rng.choice(["North", "South", "East", "West"], rows),
+        np.char.add("customer-", (np.arange(rows) % 5000).astype(str)),
+    ]
+    return [list(row) for row in zip(*(c.tolist() for c in columns))]
+
+
+def _timed(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _payload_bytes(value: Any) -> int:
+    # Dash serializes callback outputs with Plotly's JSON encoder.
+    from plotly.utils import PlotlyJSONEncoder
+    return len(json.dumps(value, cls=PlotlyJSONEncoder).encode())
+
+
+###
+# FUNCTION: fake_async_client
+#
+# Returns an AsyncGenieClient whose WorkspaceClient is replaced by in-memory
+# fakes. Calls still go through the client's own `_call` (thread pool and
+# circuit breaker), so their overhead is part of the measurement.
+###
+def fake_async_client(genie: Any = None, statement_execution: Any = None) -> AsyncGenieClient:
+    client = AsyncGenieClient.__new__(AsyncGenieClient)
+    client.host = "bench.invalid"
+    client.space_id = "bench-space"
+    client.token = None
+    client.client = SimpleNamespace(genie=genie, statement_execution=statement_execution)
+    return client
+
+
+def fake_sync_client(async_client: AsyncGenieClient) -> GenieClient:
+    client = GenieClient.__new__(GenieClient)
+    client.host, client.space_id, client.token = async_client.host, async_client.space_id, async_client.token
+    client.async_client = async_client
+    client.client = async_client.client
+    return client
+
+
+###
+# FUNCTION: fake_result_client
+#
+# A client whose query attachment returns `data` split into chunks of
+# `chunk_rows` rows, the first inline and the rest via result chunks.
+###
+def fake_result_client(data: List[List[Optional[str]]], chunk_rows: int) -> GenieClient:
+    chunks = [data[i:i + chunk_rows] for i in range(0, len(data), chunk_rows)] or [[]]
+
+    def chunk(index: int) -> Any:
+        return SimpleNamespace(data_array=chunks[index], next_chunk_index=index + 1 if index + 1 < len(chunks) else None)
+
+    schema = SimpleNamespace(as_dict=lambda: {"columns": SCHEMA_COLUMNS})
+    statement = SimpleNamespace(statement_id="bench-statement", result=chunk(0),
+                                manifest=SimpleNamespace(schema=schema, total_row_count=len(data)))
+    genie = SimpleNamespace(get_message_attachment_query_result=lambda **_: SimpleNamespace(statement_response=statement))
+    statement_execution = SimpleNamespace(get_statement_result_chunk_n=lambda statement_id, chunk_index: chunk(chunk_index))
+    return fake_sync_client(fake_async_client(genie, statement_execution))
+
+
+QUERY_MESSAGE = {"attachments": [{"attachment_id": "bench-attachment", "query": {"query": "SELECT 1", "description": "bench"}}]}
+
+
+###
+# SECTION: response
+###
+def bench_response(rows: int, data: List[List[Optional[str]]], chunk_rows: int, repeat: int) -> Tuple[Dict[str, Any], pd.DataFrame]:
+    client = fake_result_client(data, chunk_rows)
+    result: Dict[str, Any] = {}
+
+    def run() -> None:
+        result["df"] = process_genie_response(client, "bench-conversation", "bench-message", QUERY_MESSAGE)[0]
+
+    seconds = _timed(run, repeat)
+    df = result["df"]
+    return {
+        "build_s": seconds,
+        "rows_per_second": round(rows / seconds) if seconds else None,
+        "chunks": -(-rows // chunk_rows),
+        "frame_bytes": int(df.memory_usage(deep=True).sum()),
+        "dtypes": {col: str(dtype) for col, dtype in df.dtypes.items()},
+    }, df
+
+
+###
+# SECTION: render
+#
+# "grid" is the current path: column definitions, then the first block the
+# infinite row model serves (cold from the table store, again from the view
+# cache, and sorted). "legacy" is the previous DataTable payload, which
+# shipped every row plus a tooltip per cell.
+###
+def bench_render(df: pd.DataFrame, repeat: int, legacy_max_rows: int) -> List[Dict[str, Any]]:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        store = TableStore(directory)
+        store.put("bench", df)
+        first_block = {"startRow": 0, "endRow": GRID_BLOCK_SIZE}
+        sorted_block = dict(first_block, sortModel=[{"colId": "amount", "sort": "desc"}])
+
+        defs_s = _timed(lambda: column_defs(df), repeat)
+        cold_s = _timed(lambda: RowModel(store).get_rows("bench", first_block), repeat)
+        model = RowModel(store)
+        model.get_rows("bench", first_block)
+        warm_s = _timed(lambda: model.get_rows("bench", first_block), repeat)
+        sorted_s = _timed(lambda: RowModel(store).get_rows("bench", sorted_block), repeat)
+        payload = _payload_bytes(column_defs(df)) + _payload_bytes(model.get_rows("bench", first_block))
+        store.cache.close()
+    results.append({"variant": "grid", "column_defs_s": defs_s, "first_block_cold_s": cold_s,
+                    "first_block_warm_s": warm_s, "first_block_sorted_s": sorted_s, "payload_bytes": payload})
+
+    if len(df) <= legacy_max_rows:
+        state: Dict[str, Any] = {}
+
+        def records() -> None:
+            state["records"] = df.to_dict("records")
+
+        def tooltips() -> None:
+            state["tooltips"] = [{col: {"value": str(row[col]), "type": "markdown"} for col in df.columns}
+                                 for row in state["records"]]
+
+        records_s = _timed(records, repeat)
+        tooltips_s = _timed(tooltips, repeat)
+        start = time.perf_counter()
+        payload = _payload_bytes(state["records"]) + _payload_bytes(state["tooltips"])
+        serialize_s = time.perf_counter() - start
+        results.append({"variant": "legacy", "to_dict_records_s": records_s, "tooltip_data_s": tooltips_s,
+                        "serialize_s": serialize_s, "payload_bytes": payload})
+    return results
+
+
+###
+# SECTION: cache
+###
+def bench_cache(df: pd.DataFrame, repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for variant, bench in (("csv", lambda d: bench_csv(df, d, repeat)),
+                           ("arrow", lambda d: bench_arrow(df, d, repeat, TABLE_CACHE_COMPRESSION))):
+        with tempfile.TemporaryDirectory() as directory:
+            result = bench(directory)
+        results.append({"variant": variant, "write_s": result["write_s"], "read_s": result["read_s"],
+                        "round_trip_s": result["write_s"] + result["read_s"], "bytes": result["bytes"]})
+    return results
+
+
+###
+# SECTION: polling
+#
+# Each fake message moves through Genie's statuses and completes
+# `complete_after` seconds after the first poll. All messages are polled
+# concurrently on one event loop, as concurrent questions would be.
+###
+STATUS_TIMELINE = (("SUBMITTED", 0.0), ("EXECUTING_QUERY", 0.3), ("COMPLETED", 1.0))
+
+
+def fake_polling_client(complete_after: Dict[str, float]) -> AsyncGenieClient:
+    started: Dict[str, float] = {}
+
+    def get_message(space_id: str, conversation_id: str, message_id: str) -> Any:
+        now = time.time()
+        start = started.setdefault(message_id, now)
+        duration = complete_after[message_id]
+        status = [name for name, at in STATUS_TIMELINE if now - start >= at * duration][-1]
+        message = {"status": status, "last_updated_timestamp": (start + duration) * 1000 if status == "COMPLETED" else None}
+        return SimpleNamespace(as_dict=lambda: message)
+
+    return fake_async_client(genie=SimpleNamespace(get_message=get_message))
+
+
+async def _poll_all(client: AsyncGenieClient, durations: List[float], policy: PollingPolicy) -> List[Dict[str, Any]]:
+    async def one(message_id: str) -> Dict[str, Any]:
+        start = time.monotonic()
+        await client.wait_for_message_completion("bench-conversation", message_id, timeout=600, policy=policy)
+        return {"elapsed": time.monotonic() - start}
+
+    return await asyncio.gather(*(one(f"m{i}") for i in range(len(durations))))
+
+
+def bench_polling(durations: List[float], policies: Dict[str, PollingPolicy]) -> List[Dict[str, Any]]:
+    results = []
+    for name, policy in policies.items():
+        client = fake_polling_client({f"m{i}": d for i, d in enumerate(durations)})
+        cpu_start = time.process_time()
+        outcomes = genie_room._run_sync(_poll_all(client, durations, policy))
+        cpu = time.process_time() - cpu_start
+        stats = genie_room.get_poll_stats()["per_message"][-len(durations):]
+        polls = sum(s["polls"] for s in stats)
+        for duration, outcome, stat in zip(durations, outcomes, stats):
+            results.append({"policy": name, "complete_after_s": duration, "polls": stat["polls"],
+                            "wasted_wait_s": stat["wasted_wait"], "latency_overhead_s": outcome["elapsed"] - duration})
+        results.append({"policy": name, "complete_after_s": durations, "polls": polls,
+                        "cpu_s": cpu, "cpu_per_poll_s": cpu / polls if polls else None})
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+###
+# FUNCTION: compare
+#
+# Prints the ratio (this run / baseline) of every timing that appears in
+# both runs and returns how many are slower than `threshold` (ignoring
+# differences under a millisecond, which are noise at this scale).
+###
+def compare(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> int:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    def key(entry: Dict[str, Any]) -> str:
+        return f"{entry['section']} {json.dumps(entry['params'], sort_keys=True)}"
+
+    old = {key(entry): entry["metrics"] for entry in baseline["results"]}
+    regressions = 0
+    print(f"\nCompared with {baseline_path} (commit {baseline['meta'].get('git_commit')}):")
+    for entry in results:
+        before = old.get(key(entry))
+        if before is None:
+            continue
+        for metric, value in entry["metrics"].items():
+            if not metric.endswith("_s") or not before.get(metric) or value is None:
+                continue
+            ratio = value / before[metric]
+            flag = "  REGRESSION" if ratio > threshold and value - before[metric] >= 0.001 else ""
+            regressions += bool(flag)
+            print(f"  {key(entry)} {metric}: {before[metric] * 1000:.2f} -> {value * 1000:.2f} ms ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline micro-benchmarks of the Genie answer hot paths.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--chunk-rows", type=int, default=25_000, help="Rows per result chunk of the fake API")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--sections", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument("--legacy-max-rows", type=int, default=100_000,
+                        help="Largest table measured with the previous to_dict/tooltip_data path")
+    parser.add_argument("--poll-durations", type=float, nargs="+", default=[0.5, 2.0, 5.0],
+                        help="Seconds after which the fake messages complete")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file from an earlier run")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the polling jitter")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    # The suite measures up to the largest size asked for, past the app's cap.
+    genie_room.GENIE_MAX_RESULT_ROWS = max(args.rows)
+
+    results: List[Dict[str, Any]] = []
+
+    def report(section: str, params: Dict[str, Any], metrics: Dict[str, Any]) -> None:
+        results.append({"section": section, "params": params, "metrics": metrics})
+        shown = ", ".join(f"{k} {v * 1000:.1f} ms" if k.endswith("_s") and isinstance(v, float) else f"{k} {v}"
+                          for k, v in metrics.items() if not isinstance(v, dict))
+        print(f"{section:<8} {json.dumps(params):<45} {shown}")
+
+    table_sections = {"response", "render", "cache"} & set(args.sections)
+    for rows in args.rows if table_sections else []:
+        data = make_data_array(rows)
+        metrics, df = bench_response(rows, data, args.chunk_rows, args.repeat)
+        del data
+        if "response" in args.sections:
+            report("response", {"rows": rows}, metrics)
+        if "render" in args.sections:
+            for entry in bench_render(df, args.repeat, args.legacy_max_rows):
+                report("render", {"rows": rows, "variant": entry.pop("variant")}, entry)
+        if "cache" in args.sections:
+            for entry in bench_cache(df, args.repeat):
+                report("cache", {"rows": rows, "variant": entry.pop("variant")}, entry)
+
+    if "polling" in args.sections:
+        policies = {"adaptive": PollingPolicy(), "fixed-1s": PollingPolicy.fixed(1.0)}
+        for entry in bench_polling(args.poll_durations, policies):
+            report("polling", {"policy": entry.pop("policy"), "complete_after_s": entry.pop("complete_after_s")}, entry)
+
+    output = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "pyarrow": pa.__version__,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(output, f, indent=2, default=str)
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        print(f"{regressions} regression(s) over {args.threshold:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
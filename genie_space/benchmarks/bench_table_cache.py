@@ -0,0 +1,115 @@
+###
+# BENCHMARK: TABLE CACHE FORMATS
+#
+# Compares the old CSV-string cache for result tables with the Arrow IPC
+# TableStore: write time, read time (back to a DataFrame) and bytes on disk.
+# Runs entirely offline on a synthetic, schema-typed result table.
+#
+# Usage (from the genie_space directory):
+#     python benchmarks/bench_table_cache.py --rows 10000 100000 --json results.json
+###
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from io import StringIO
+
+import diskcache
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from table_store import TableStore  # noqa: E402
+
+
+###
+# FUNCTION: make_frame
+#
+# Builds a synthetic result table with the dtypes process_genie_response
+# produces: integers, floats, datetimes, booleans, categoricals and text.
+###
+def make_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "order_id": pd.array(np.arange(rows), dtype="Int64"),
+        "amount": rng.normal(1000, 250, rows).round(2),
+        "quantity": pd.array(rng.integers(1, 50, rows), dtype="Int32"),
+        "order_date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, rows), unit="D"),
+        "shipped": pd.array(rng.random(rows) > 0.3, dtype="boolean"),
+        "region": pd.Categorical(rng.choice(["North", "South", "East", "West"], rows)),
+        "customer": [f"customer-{i % 5000:05d}" for i in range(rows)],
+    })
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def _timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+###
+# FUNCTION: bench_csv
+#
+# The previous code path: `to_csv` into diskcache, `pd.read_csv` back out.
+###
+def bench_csv(df: pd.DataFrame, directory: str, repeat: int) -> dict:
+    cache = diskcache.Cache(directory)
+    write = _timed(lambda: cache.set("table", df.to_csv(index=False)), repeat)
+    read = _timed(lambda: pd.read_csv(StringIO(cache.get("table"))), repeat)
+    size = cache.volume()
+    cache.close()
+    return {"write_s": write, "read_s": read, "bytes": size}
+
+
+###
+# FUNCTION: bench_arrow
+#
+# The TableStore path with the given IPC compression.
+###
+def bench_arrow(df: pd.DataFrame, directory: str, repeat: int, compression: str) -> dict:
+    store = TableStore(directory, compression=compression)
+    write = _timed(lambda: store.put("table", df), repeat)
+    read = _timed(lambda: store.get("table"), repeat)
+    size = _dir_size(directory)
+    store.cache.close()
+    return {"write_s": write, "read_s": read, "bytes": size}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare CSV and Arrow IPC table cache formats.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    for rows in args.rows:
+        df = make_frame(rows)
+        for name, bench in (
+            ("csv", lambda d: bench_csv(df, d, args.repeat)),
+            ("arrow-lz4", lambda d: bench_arrow(df, d, args.repeat, "lz4")),
+            ("arrow-zstd", lambda d: bench_arrow(df, d, args.repeat, "zstd")),
+            ("arrow-none", lambda d: bench_arrow(df, d, args.repeat, "none")),
+        ):
+            with tempfile.TemporaryDirectory() as directory:
+                result = {"rows": rows, "format": name, **bench(directory)}
+            results.append(result)
+            print(f"{rows:>9} {name:<11} write {result['write_s'] * 1000:9.1f} ms  "
+                  f"read {result['read_s'] * 1000:9.1f} ms  size {result['bytes'] / 1e6:8.2f} MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
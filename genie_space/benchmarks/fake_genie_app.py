@@ -0,0 +1,68 @@
+###
+# BENCHMARK HELPER: APP WITH A FAKE GENIE BACKEND
+#
+# The Dash app with every Genie client replaced by an in-memory fake, for
+# load tests of the server itself (see bench_serving.py). A question
+# completes FAKE_GENIE_SECONDS after it was sent, with a query attachment of
+# FAKE_GENIE_ROWS synthetic rows; the fake keeps no state, so any process
+# can answer any poll. The app's own code (scheduler, caches, table store,
+# rendering) runs unchanged.
+#
+# Usage (from a scratch directory, with genie_space and genie_space/benchmarks
+# on PYTHONPATH):
+#     python -m fake_genie_app                         # Dash development server
+#     gunicorn -c ../gunicorn.conf.py fake_genie_app:server
+###
+import os
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any
+
+from bench_suite import SCHEMA_COLUMNS, fake_async_client, fake_sync_client, make_data_array
+
+import genie_room
+
+FAKE_GENIE_SECONDS = float(os.environ.get("FAKE_GENIE_SECONDS", "2"))
+FAKE_GENIE_ROWS = int(os.environ.get("FAKE_GENIE_ROWS", "1000"))
+
+_DATA = make_data_array(FAKE_GENIE_ROWS)
+
+
+def _start_conversation(space_id: str, content: str) -> Any:
+    # The send time is part of the message ID, so polls need no shared state.
+    return SimpleNamespace(conversation_id=str(uuid.uuid4()), message_id=f"{uuid.uuid4()}:{time.time()}")
+
+
+def _get_message(space_id: str, conversation_id: str, message_id: str) -> Any:
+    sent = float(message_id.rsplit(":", 1)[1])
+    done = time.time() - sent >= FAKE_GENIE_SECONDS
+    message = {
+        "status": "COMPLETED" if done else "EXECUTING_QUERY",
+        "last_updated_timestamp": (sent + FAKE_GENIE_SECONDS) * 1000 if done else None,
+        "attachments": [{"attachment_id": "bench-attachment",
+                         "query": {"query": "SELECT * FROM bench", "description": "Synthetic orders"}}],
+    }
+    return SimpleNamespace(as_dict=lambda: message)
+
+
+def _get_query_result(**_: Any) -> Any:
+    schema = SimpleNamespace(as_dict=lambda: {"columns": SCHEMA_COLUMNS})
+    statement = SimpleNamespace(statement_id="bench-statement",
+                                result=SimpleNamespace(data_array=_DATA, next_chunk_index=None),
+                                manifest=SimpleNamespace(schema=schema, total_row_count=len(_DATA)))
+    return SimpleNamespace(statement_response=statement)
+
+
+_client = fake_sync_client(fake_async_client(genie=SimpleNamespace(
+    start_conversation=_start_conversation,
+    get_message=_get_message,
+    get_message_attachment_query_result=_get_query_result,
+)))
+genie_room.client_pool.get = lambda host, space_id, token: _client
+
+from app import app, server, warm_up  # noqa: E402,F401
+
+if __name__ == "__main__":
+    warm_up()
+    app.run(debug=False, port=int(os.environ.get("PORT", "8050")))
@@ -0,0 +1,184 @@
+###
+# IMPORTS AND CONFIGURATION
+#
+# Bounded disk caches. Both the background-callback cache and the result
+# table store are diskcache directories; this module gives them a default
+# TTL, an eviction policy, eviction counters shared across processes, and a
+# background job that culls expired and over-limit entries.
+###
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import diskcache
+
+logger = logging.getLogger(__name__)
+
+# How often the culling job runs, and the policy used to pick entries to
+# evict once a cache is over its size limit ("least-recently-used",
+# "least-frequently-used", "least-recently-stored" or "none").
+CACHE_CULL_INTERVAL_SECONDS = float(os.environ.get("CACHE_CULL_INTERVAL_SECONDS", "60"))
+CACHE_EVICTION_POLICY = os.environ.get("CACHE_EVICTION_POLICY", "least-recently-used")
+
+# Size limit and entry TTL of the background-callback cache (./cache).
+CALLBACK_CACHE_SIZE_LIMIT_MB = int(os.environ.get("CALLBACK_CACHE_SIZE_LIMIT_MB", "512"))
+CALLBACK_CACHE_TTL_SECONDS = int(os.environ.get("CALLBACK_CACHE_TTL_SECONDS", "3600"))
+
+# Counters are stored on disk next to the cache so every process sees the
+# same totals.
+_STATS_PREFIX = "__stats__:"
+_META_DIR = "meta"
+STAT_NAMES = ("hits", "misses", "evictions")
+
+
+###
+# ManagedCache CLASS
+#
+# A diskcache.Cache whose entries expire after `default_expire` seconds unless
+# a caller passes its own `expire`. Culling on write is disabled (cull_limit=0)
+# so that every eviction goes through `cull`, which counts it. Pickling keeps
+# the default TTL and the eviction policy, so a cache can be handed to a
+# background-callback process started by a forkserver. Stores of shared
+# state that are never size-bounded (breakers, metrics) pass
+# eviction_policy="none": under any other policy every `get` is a write
+# transaction that updates the entry's access time or count.
+#
+# Bookkeeping that must survive culling and is not an entry of its own (the
+# shared counters and the cross-process locks callers take with `meta.add`)
+# lives in `meta`, a small uncapped cache in a subdirectory.
+###
+class ManagedCache(diskcache.Cache):
+    def __init__(self, directory: str, default_expire: Optional[float] = None, **settings):
+        settings.setdefault("eviction_policy", CACHE_EVICTION_POLICY)
+        settings.setdefault("cull_limit", 0)
+        self._meta: Optional[diskcache.Cache] = None
+        self._meta_lock = threading.Lock()
+        super().__init__(directory, **settings)
+        self.default_expire = default_expire or None
+
+    def set(self, key, value, expire=None, read=False, tag=None, retry=False):
+        if expire is None:
+            expire = self.default_expire
+        return super().set(key, value, expire=expire, read=read, tag=tag, retry=retry)
+
+    def __getstate__(self):
+        return (self.directory, self.default_expire, self.timeout, self.eviction_policy)
+
+    def __setstate__(self, state):
+        directory, default_expire, timeout, eviction_policy = state
+        self.__init__(directory, default_expire, timeout=timeout, eviction_policy=eviction_policy)
+
+    @property
+    def meta(self) -> diskcache.Cache:
+        with self._meta_lock:
+            if self._meta is None:
+                self._meta = diskcache.Cache(os.path.join(self.directory, _META_DIR), timeout=self.timeout,
+                                             eviction_policy="none")
+            return self._meta
+
+    def close(self) -> None:
+        super().close()
+        if self._meta is not None:
+            self._meta.close()
+
+    ###
+    # METHOD: cull
+    #
+    # Removes expired entries, then evicts by policy until the cache is under
+    # its size limit. Returns (and records) the number of entries removed.
+    ###
+    def cull(self, retry: bool = False) -> int:
+        count = super().cull(retry=retry)
+        if count:
+            self.record("evictions", count)
+        return count
+
+    ###
+    # METHOD: record
+    #
+    # Adds `count` to a shared counter such as hits, misses or evictions.
+    ###
+    def record(self, name: str, count: int = 1) -> None:
+        try:
+            self.meta.incr(f"{_STATS_PREFIX}{name}", count, default=0, retry=True)
+        except diskcache.Timeout:
+            logger.debug(f"Skipped cache counter update for {name}")
+
+    ###
+    # METHOD: stats
+    #
+    # Returns the shared counters (STAT_NAMES unless other names are given)
+    # plus the entry count and bytes on disk.
+    ###
+    def stats(self, names: Iterable[str] = STAT_NAMES) -> Dict[str, Any]:
+        result: Dict[str, Any] = {name: self.meta.get(f"{_STATS_PREFIX}{name}", 0) for name in names}
+        result["entries"] = len(self)
+        result["bytes"] = self.volume()
+        result["size_limit"] = self.size_limit
+        return result
+
+
+###
+# CacheCuller CLASS
+#
+# Runs `cull` on a set of caches every `interval` seconds on a daemon thread.
+# Threads do not survive a fork, so `start` must be called in the process
+# that should own the job (the web server, not background-callback workers).
+###
+class CacheCuller:
+    def __init__(self, interval: float = CACHE_CULL_INTERVAL_SECONDS):
+        self.interval = interval
+        self._caches: List[tuple] = []
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stop = threading.Event()
+
+    def add(self, name: str, cache: ManagedCache) -> None:
+        self._caches.append((name, cache))
+
+    @property
+    def caches(self) -> List[tuple]:
+        return list(self._caches)
+
+    ###
+    # METHOD: start
+    #
+    # Starts the culling thread in this process if it is not already running.
+    ###
+    def start(self) -> None:
+        if self.interval <= 0:
+            return
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._stop.clear()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="cache-culler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    ###
+    # METHOD: run_once
+    #
+    # Culls every cache once and returns the number of entries evicted from each.
+    ###
+    def run_once(self) -> Dict[str, int]:
+        evicted = {}
+        for name, cache in self._caches:
+            start = time.monotonic()
+            try:
+                evicted[name] = cache.cull(retry=True)
+            except Exception as e:
+                logger.error(f"Culling the {name} cache failed: {e}")
+                continue
+            if evicted[name]:
+                logger.info(f"Evicted {evicted[name]} entries from the {name} cache in "
+                            f"{time.monotonic() - start:.2f}s; {cache.volume() / 2**20:.1f} MB on disk")
+        return evicted
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.run_once()
@@ -0,0 +1,171 @@
+###
+# IMPORTS AND CONFIGURATION
+#
+# Server-side storage for chat sessions. The browser only keeps a client ID
+# plus the ID and title of each session; the rendered message trees live in a
+# SQLite database shared by the web server and the background-callback
+# processes, and are loaded again when a session is opened.
+###
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import plotly.utils
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_DB_PATH = os.environ.get("CONVERSATION_DB_PATH", "./conversations.db")
+# Sessions not touched for this many days are deleted.
+CONVERSATION_RETENTION_DAYS = float(os.environ.get("CONVERSATION_RETENTION_DAYS", "7"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    client_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    conversation_id TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (client_id, session_id)
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated);
+CREATE TABLE IF NOT EXISTS messages (
+    client_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (client_id, session_id, seq)
+);
+"""
+
+
+###
+# ConversationStore CLASS
+#
+# Stores sessions and their messages keyed by (client_id, session_id).
+# Messages are Dash components (or their dict form) serialized to JSON, so
+# they can be returned straight to a `children` output when restored.
+###
+class ConversationStore:
+    ###
+    # METHOD: __init__
+    #
+    # Opens the database, enabling WAL so concurrent readers never block the
+    # writer, and creates the tables if needed.
+    ###
+    def __init__(self, path: str = CONVERSATION_DB_PATH, retention_days: float = CONVERSATION_RETENTION_DAYS):
+        self.path = path
+        self.retention_seconds = retention_days * 86400
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    ###
+    # METHOD: create_session
+    #
+    # Creates a new session and returns its ID. Expired sessions are pruned
+    # at the same time.
+    ###
+    def create_session(self, client_id: str, title: str) -> str:
+        session_id = str(uuid.uuid4())
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO sessions (client_id, session_id, title, conversation_id, created, updated) VALUES (?, ?, ?, NULL, ?, ?)",
+                (client_id, session_id, title, now, now)
+            )
+        self.prune()
+        return session_id
+
+    ###
+    # METHOD: get_session
+    #
+    # Returns the session's metadata (title, conversation ID) or None.
+    ###
+    def get_session(self, client_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT session_id, title, conversation_id FROM sessions WHERE client_id = ? AND session_id = ?",
+                (client_id, session_id)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"session_id": row[0], "title": row[1], "conversation_id": row[2]}
+
+    ###
+    # METHOD: set_conversation_id
+    #
+    # Records the Genie conversation ID that follow-ups in this session use.
+    ###
+    def set_conversation_id(self, client_id: str, session_id: str, conversation_id: Optional[str]) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE sessions SET conversation_id = ?, updated = ? WHERE client_id = ? AND session_id = ?",
+                (conversation_id, time.time(), client_id, session_id)
+            )
+
+    ###
+    # METHOD: append_messages
+    #
+    # Appends messages to the end of a session.
+    ###
+    def append_messages(self, client_id: str, session_id: str, messages: List[Any]) -> None:
+        payloads = [json.dumps(m, cls=plotly.utils.PlotlyJSONEncoder) for m in messages]
+        with self._connect() as conn:
+            (next_seq,) = conn.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE client_id = ? AND session_id = ?",
+                (client_id, session_id)
+            ).fetchone()
+            conn.executemany(
+                "INSERT INTO messages (client_id, session_id, seq, payload) VALUES (?, ?, ?, ?)",
+                [(client_id, session_id, next_seq + i, payload) for i, payload in enumerate(payloads)]
+            )
+            conn.execute(
+                "UPDATE sessions SET updated = ? WHERE client_id = ? AND session_id = ?",
+                (time.time(), client_id, session_id)
+            )
+
+    ###
+    # METHOD: get_messages
+    #
+    # Returns all messages of a session, oldest first, in the dict form Dash
+    # accepts for `children`.
+    ###
+    def get_messages(self, client_id: str, session_id: str) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT payload FROM messages WHERE client_id = ? AND session_id = ? ORDER BY seq",
+                (client_id, session_id)
+            ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    ###
+    # METHOD: prune
+    #
+    # Deletes sessions (and their messages) older than the retention period.
+    ###
+    def prune(self) -> None:
+        cutoff = time.time() - self.retention_seconds
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM messages WHERE (client_id, session_id) IN "
+                "(SELECT client_id, session_id FROM sessions WHERE updated < ?)",
+                (cutoff,)
+            )
+            deleted = conn.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,)).rowcount
+        if deleted:
+            logger.info(f"Pruned {deleted} expired chat sessions")
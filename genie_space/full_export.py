@@ -0,0 +1,215 @@
+###
+# IMPORTS AND CONFIGURATION
+#
+# Full-result exports. A result table in the chat holds at most
+# GENIE_MAX_RESULT_ROWS rows; a full export runs the attachment's query again
+# and pages through every row of the result, writing it to a gzip-compressed
+# CSV file on local disk. Exports run as jobs on a small thread pool in the
+# server process, so they never hold up a Dash worker, and their progress is
+# kept in a ManagedCache where any process can read it. A job's state also
+# names the process running it and is refreshed on a heartbeat, so a job
+# whose process died or was recycled is reported as failed instead of
+# running forever.
+###
+import csv
+import gzip
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from cache_maintenance import ManagedCache
+from genie_scheduler import pid_alive
+
+logger = logging.getLogger(__name__)
+
+FULL_EXPORT_CACHE_DIR = os.environ.get("FULL_EXPORT_CACHE_DIR", "./full_export_cache")
+FULL_EXPORT_TTL_SECONDS = int(os.environ.get("FULL_EXPORT_TTL_SECONDS", "86400"))
+FULL_EXPORT_SIZE_LIMIT_MB = int(os.environ.get("FULL_EXPORT_SIZE_LIMIT_MB", "4096"))
+# Exports running at once across the server process; further jobs wait in
+# the pool's queue.
+FULL_EXPORT_WORKERS = int(os.environ.get("FULL_EXPORT_WORKERS", "2"))
+# Minimum time between progress updates of a running job.
+FULL_EXPORT_PROGRESS_SECONDS = float(os.environ.get("FULL_EXPORT_PROGRESS_SECONDS", "1"))
+# How often the states of a process's queued and running jobs are refreshed
+# (also while the query runs and no rows arrive yet), and after how long
+# without a refresh a job counts as lost.
+FULL_EXPORT_HEARTBEAT_SECONDS = float(os.environ.get("FULL_EXPORT_HEARTBEAT_SECONDS", "10"))
+FULL_EXPORT_STALE_SECONDS = float(os.environ.get("FULL_EXPORT_STALE_SECONDS", "60"))
+
+FULL_EXPORT_MIMETYPE = "application/gzip"
+
+# Job statuses.
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Opens the result of a query: returns {'schema', 'total_row_count', 'batches'}
+# like GenieClient.execute_query_stream.
+StreamOpener = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+###
+# FullExporter CLASS
+#
+# Remembers which query produced each result table (`register`), runs export
+# jobs for them (`start`) and keeps job states and finished files in a
+# ManagedCache with a TTL and size limit, culled like the other caches.
+###
+class FullExporter:
+    def __init__(self, directory: str = FULL_EXPORT_CACHE_DIR, ttl_seconds: int = FULL_EXPORT_TTL_SECONDS,
+                 size_limit_mb: int = FULL_EXPORT_SIZE_LIMIT_MB, workers: int = FULL_EXPORT_WORKERS):
+        self.cache = ManagedCache(directory, default_expire=ttl_seconds, size_limit=size_limit_mb * 2**20,
+                                  disk_min_file_size=0)
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._active: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+
+    ###
+    # METHOD: register
+    #
+    # Records the Genie attachment (conversation, message and attachment IDs)
+    # and space a result table came from.
+    ###
+    def register(self, table_uuid: str, space_id: str, attachment: Dict[str, Any]) -> None:
+        self.cache.set(f"source:{table_uuid}", dict(attachment, space_id=space_id))
+
+    def source(self, table_uuid: str) -> Optional[Dict[str, Any]]:
+        return self.cache.get(f"source:{table_uuid}")
+
+    ###
+    # METHOD: start
+    #
+    # Queues an export of the table's full result and returns the job ID, or
+    # None if the table's source is unknown. `open_stream` is called on a
+    # worker thread with the table's source. Must be called from the
+    # long-lived server process.
+    ###
+    def start(self, table_uuid: str, open_stream: StreamOpener) -> Optional[str]:
+        source = self.source(table_uuid)
+        if source is None:
+            return None
+        job_id = str(uuid.uuid4())
+        executor = self._get_executor()
+        state = {"status": QUEUED, "table": table_uuid, "rows": 0, "total_rows": None, "bytes": 0, "error": None,
+                 "created": time.time(), "started": None, "finished": None, "pid": os.getpid(), "heartbeat": None}
+        with self._lock:
+            self._active[job_id] = state
+        self._set_state(job_id, state)
+        self.cache.record("jobs")
+        executor.submit(self._run, job_id, source, open_stream)
+        return job_id
+
+    ###
+    # METHOD: status
+    #
+    # Returns the job's state, or None if it expired. A queued or running job
+    # whose process is gone or whose heartbeat stopped is marked failed.
+    ###
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        state = self.cache.get(f"job:{job_id}")
+        if state is None or state["status"] not in (QUEUED, RUNNING):
+            return state
+        pid = state.get("pid")
+        if pid is None or not pid_alive(pid) or time.time() - state.get("heartbeat", 0) > FULL_EXPORT_STALE_SECONDS:
+            state.update(status=FAILED, finished=time.time(),
+                         error="the server process running it stopped. Please start the export again")
+            self.cache.set(f"job:{job_id}", state)
+            self.cache.record("failed")
+            logger.warning(f"Full export {job_id} was lost with process {pid} after {state['rows']} rows")
+        return state
+
+    ###
+    # METHOD: file_path
+    #
+    # Returns the path of a finished export, or None.
+    ###
+    def file_path(self, job_id: str) -> Optional[str]:
+        handle = self.cache.get(f"file:{job_id}", read=True)
+        if handle is None:
+            return None
+        handle.close()
+        return handle.name
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats(("jobs", "completed", "failed", "rows", "evictions"))
+
+    def _run(self, job_id: str, source: Dict[str, Any], open_stream: StreamOpener) -> None:
+        with self._lock:
+            state = self._active[job_id]
+        state.update(status=RUNNING, started=time.time())
+        self._set_state(job_id, state)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                stream = open_stream(source)
+                state["total_rows"] = stream.get("total_row_count")
+                columns = [col.get("name") for col in stream["schema"].get("columns", [])]
+                with gzip.GzipFile(fileobj=file, mode="wb", compresslevel=6) as gz:
+                    text = io.TextIOWrapper(gz, encoding="utf-8", newline="")
+                    writer = csv.writer(text)
+                    writer.writerow(columns)
+                    last_update = time.monotonic()
+                    for batch in stream["batches"]:
+                        writer.writerows(batch)
+                        state["rows"] += len(batch)
+                        if time.monotonic() - last_update >= FULL_EXPORT_PROGRESS_SECONDS:
+                            text.flush()
+                            state["bytes"] = file.tell()
+                            self._set_state(job_id, state)
+                            last_update = time.monotonic()
+                    text.flush()
+                    text.detach()
+                state["bytes"] = file.tell()
+            with open(tmp_path, "rb") as file:
+                self.cache.set(f"file:{job_id}", file, read=True)
+            state.update(status=DONE, finished=time.time())
+            self.cache.record("completed")
+            self.cache.record("rows", state["rows"])
+            logger.info(f"Full export {job_id} finished: {state['rows']} rows, "
+                        f"{state['bytes'] / 2**20:.1f} MB in {state['finished'] - state['started']:.1f}s")
+        except Exception as e:
+            state.update(status=FAILED, error=str(e), finished=time.time())
+            self.cache.record("failed")
+            logger.error(f"Full export {job_id} failed after {state['rows']} rows: {e}")
+        finally:
+            with self._lock:
+                self._active.pop(job_id, None)
+            self._set_state(job_id, state)
+            os.remove(tmp_path)
+
+    def _set_state(self, job_id: str, state: Dict[str, Any]) -> None:
+        # Serialized so a heartbeat cannot write an older copy of a state
+        # over the job's own last write.
+        with self._state_lock:
+            self.cache.set(f"job:{job_id}", dict(state, heartbeat=time.time()))
+
+    def _heartbeat(self, pid: int) -> None:
+        while self._executor_pid == pid:
+            time.sleep(FULL_EXPORT_HEARTBEAT_SECONDS)
+            with self._lock:
+                active = list(self._active.items())
+            for job_id, state in active:
+                try:
+                    self._set_state(job_id, state)
+                except Exception as e:
+                    logger.warning(f"Could not refresh the state of full export {job_id}: {e}")
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="full-export")
+                self._executor_pid = os.getpid()
+                self._active = {}
+                threading.Thread(target=self._heartbeat, args=(self._executor_pid,), name="full-export-heartbeat",
+                                 daemon=True).start()
+            return self._executor
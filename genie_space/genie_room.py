@@ -2,18 +2,26 @@
 # IMPORTS AND CONFIGURATION
 #
 # This section imports necessary libraries, including pandas for data handling,
-# time for polling delays, os and dotenv for environment variable management,
-# and the Databricks SDK for interacting with the Genie API.
+# asyncio and time for polling delays, os and dotenv for environment variable
+# management, and the Databricks SDK for interacting with the Genie API.
 # It also configures basic logging.
 ###
 import pandas as pd
+import asyncio
+import functools
+import hashlib
+import random
+import threading
 import time
 import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
 from dotenv import load_dotenv
-from typing import Dict, Any, Optional, List, Union, Tuple
+from typing import Dict, Any, Optional, List, Union, Tuple, Awaitable, AsyncIterator, Callable, Iterator, TypeVar
 import logging
-from databricks.sdk import WorkspaceClient
-from databricks.sdk.core import Config
+from resilience import ErrorKind, SDK_RETRY_TIMEOUT_SECONDS, classify_error, describe_error, get_resilience, is_throttled, retry_after
+from metrics import COUNT_BUCKETS, REGISTRY, ROWS_BUCKETS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,47 +29,324 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 DATABRICKS_HOST = os.environ.get("DATABRICKS_HOST")
 
+T = TypeVar("T")
+
+# Called with (conversation_id, message_id) once a question has been sent.
+MessageListener = Callable[[str, str], None]
+
+# One part of a Genie answer: (text or DataFrame, query text, description).
+ResponsePart = Tuple[Union[str, pd.DataFrame], Optional[str], Optional[str]]
+
+# Upper bound on the rows read from a single Genie query result.
+GENIE_MAX_RESULT_ROWS = int(os.environ.get("GENIE_MAX_RESULT_ROWS", "500000"))
+# Query results of one message fetched at the same time.
+GENIE_ATTACHMENT_CONCURRENCY = int(os.environ.get("GENIE_ATTACHMENT_CONCURRENCY", "4"))
+
 
 ###
-# GenieClient CLASS
+# METRICS
 #
-# This class acts as a client to interact with the Databricks Genie API. It
-# encapsulates the methods required to start and manage conversations, send
-# messages, and retrieve results, handling authentication and retry logic
-# for API requests.
+# Where the time of a question goes. Every API call (including each poll) is
+# timed by method; the phases are client construction, sending the question,
+# waiting for Genie, fetching each query result and building its DataFrame.
 ###
-class GenieClient:
+GENIE_API_SECONDS = REGISTRY.histogram(
+    "genie_api_request_duration_seconds", "Latency of Genie and Statement Execution API calls, including retries.",
+    ("method", "space_id"))
+GENIE_API_ERRORS = REGISTRY.counter(
+    "genie_api_errors", "Failed Genie and Statement Execution API calls by error kind.", ("method", "kind", "space_id"))
+GENIE_PHASE_SECONDS = REGISTRY.histogram(
+    "genie_phase_duration_seconds", "Time spent in each phase of answering a Genie question.", ("phase", "space_id"))
+GENIE_QUESTION_SECONDS = REGISTRY.histogram(
+    "genie_question_duration_seconds", "End-to-end time of answering a Genie question.", ("space_id",))
+GENIE_QUESTION_ERRORS = REGISTRY.counter(
+    "genie_question_errors", "Genie questions that ended in an error, by error kind.", ("kind", "space_id"))
+GENIE_QUESTIONS_IN_FLIGHT = REGISTRY.gauge(
+    "genie_questions_in_flight", "Genie questions being answered.", ("space_id",))
+GENIE_POLLS = REGISTRY.histogram(
+    "genie_polls_per_message", "Polls made until a Genie message reached a final status.", ("status", "space_id"),
+    COUNT_BUCKETS)
+GENIE_RESULT_ROWS = REGISTRY.histogram(
+    "genie_result_rows", "Rows per Genie query result.", ("space_id",), ROWS_BUCKETS)
+
+
+###
+# ASYNC EXECUTION HELPERS
+#
+# The Databricks SDK only ships a blocking HTTP transport, so the async client
+# hands each individual REST call to a bounded thread pool and awaits it. The
+# expensive part of a question (waiting for Genie) is spent in `asyncio.sleep`,
+# which means one event loop can keep hundreds of conversations in flight while
+# only a handful of threads are ever busy with actual I/O.
+# The pool is created lazily per process because Dash's background callbacks
+# fork worker processes and a thread pool does not survive a fork.
+###
+GENIE_ASYNC_MAX_WORKERS = int(os.environ.get("GENIE_ASYNC_MAX_WORKERS", "32"))
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=GENIE_ASYNC_MAX_WORKERS, thread_name_prefix="genie-io")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+###
+# HELPER: _sdk_call
+#
+# Runs a blocking SDK call on an executor thread. The SDK gives up on a
+# retried call by raising a TimeoutError from the last error it got, and
+# asyncio replaces a plain TimeoutError coming out of an executor with a new
+# one, losing that error; re-raising it as a subclass keeps it, so the call
+# can still be classified (a 429 or a 503 rather than a timeout).
+###
+class _SdkRetriesExhausted(TimeoutError):
+    pass
+
+
+def _sdk_call(fn: Callable[..., T], **kwargs: Any) -> T:
+    try:
+        return fn(**kwargs)
+    except TimeoutError as e:
+        if type(e) is TimeoutError and e.__cause__ is not None:
+            raise _SdkRetriesExhausted(*e.args) from e.__cause__
+        raise
+
+
+def _run_sync(coro: Awaitable[T]) -> T:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    coro.close()
+    raise RuntimeError("The synchronous Genie API cannot be used from a running event loop; use AsyncGenieClient instead.")
+
+
+def _iter_sync(agen: AsyncIterator[T]) -> Iterator[T]:
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.close()
+
+
+###
+# PollingPolicy CLASS
+#
+# Decides how long to wait between `get_message` polls. Intervals start short
+# so fast answers are picked up quickly, then back off exponentially with
+# jitter. The status Genie reports adjusts the pace: once the query is
+# executing the result is usually seconds away, so polls are capped tighter,
+# while a warehouse that is still starting up is polled more slowly. A status
+# change resets the backoff because it signals progress.
+###
+TERMINAL_MESSAGE_STATUSES = ("COMPLETED", "ERROR", "FAILED", "CANCELLED", "QUERY_RESULT_EXPIRED")
+
+
+class PollingPolicy:
+    DEFAULT_STATUS_BOUNDS = {
+        "EXECUTING_QUERY": (0.25, 1.0),
+        "PENDING_WAREHOUSE": (2.0, 5.0),
+    }
+
+    def __init__(self, initial_interval: float = 0.25, max_interval: float = 4.0, backoff_factor: float = 1.6,
+                 jitter: float = 0.2, status_bounds: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+        self.status_bounds = self.DEFAULT_STATUS_BOUNDS if status_bounds is None else status_bounds
+
+    ###
+    # METHOD: fixed
+    #
+    # Builds a policy that always waits the same interval, matching the old
+    # `poll_interval` behaviour.
+    ###
+    @classmethod
+    def fixed(cls, interval: float) -> "PollingPolicy":
+        return cls(initial_interval=interval, max_interval=interval, backoff_factor=1.0, jitter=0.0, status_bounds={})
+
+    ###
+    # METHOD: next_interval
+    #
+    # Returns the wait before the next poll, given how many polls have been
+    # made since the status last changed and the current status.
+    ###
+    def next_interval(self, attempt: int, status: Optional[str]) -> float:
+        interval = min(self.max_interval, self.initial_interval * (self.backoff_factor ** attempt))
+        low, high = self.status_bounds.get(status, (0.0, self.max_interval))
+        interval = min(max(interval, low), high)
+        if self.jitter:
+            interval *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return interval
+
+
+###
+# POLL STATISTICS
+#
+# Per-message polling statistics (number of polls, throttled polls, total
+# wait and the estimated "wasted" wait between Genie finishing and us
+# noticing) kept in a small bounded in-process log so the policy can be tuned.
+###
+POLL_STATS_MAX_ENTRIES = int(os.environ.get("GENIE_POLL_STATS_MAX_ENTRIES", "1000"))
+_poll_stats: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_poll_stats_lock = threading.Lock()
+
+
+def _record_poll_stats(message_id: str, stats: Dict[str, Any]) -> None:
+    with _poll_stats_lock:
+        _poll_stats[message_id] = stats
+        _poll_stats.move_to_end(message_id)
+        while len(_poll_stats) > POLL_STATS_MAX_ENTRIES:
+            _poll_stats.popitem(last=False)
+    logger.info(
+        f"Message {message_id} finished with status {stats['status']} after {stats['polls']} polls "
+        f"({stats['throttled']} throttled) in {stats['elapsed']:.2f}s, wasted wait {stats['wasted_wait']:.2f}s"
+    )
+
+
+def get_poll_stats() -> Dict[str, Any]:
+    with _poll_stats_lock:
+        entries = list(_poll_stats.values())
+    return {
+        "messages": len(entries),
+        "total_polls": sum(e["polls"] for e in entries),
+        "total_throttled": sum(e["throttled"] for e in entries),
+        "total_wasted_wait": sum(e["wasted_wait"] for e in entries),
+        "per_message": entries,
+    }
+
+
+###
+# THROTTLE LISTENERS
+#
+# Functions called with the server's Retry-After (in seconds) whenever a
+# Genie API call is answered with 429 after the SDK's own retries, e.g. so an
+# admission scheduler can stop starting new work for that long.
+###
+_throttle_listeners: List[Callable[[float], None]] = []
+
+
+def add_throttle_listener(listener: Callable[[float], None]) -> None:
+    _throttle_listeners.append(listener)
+
+
+def _notify_throttled(seconds: float) -> None:
+    for listener in _throttle_listeners:
+        try:
+            listener(seconds)
+        except Exception as e:
+            logger.error(f"Throttle listener failed: {e}")
+
+
+###
+# FUNCTION: genie_endpoint
+#
+# The circuit-breaker name of the Genie API on a workspace host.
+###
+def genie_endpoint(host: Optional[str] = DATABRICKS_HOST) -> str:
+    return f"genie:{host}"
+
+
+###
+# FUNCTION: genie_circuit_open
+#
+# True while Genie calls fail fast because the workspace's Genie API breaker
+# is open, so callers can serve a degraded answer without trying.
+###
+def genie_circuit_open(host: Optional[str] = DATABRICKS_HOST) -> bool:
+    return get_resilience().breaker(genie_endpoint(host)).is_open()
+
+
+###
+# AsyncGenieClient CLASS
+#
+# The asyncio counterpart of GenieClient, exposing the same methods as
+# coroutines. It configures the underlying Databricks WorkspaceClient with the
+# same credentials and retry settings and never blocks the event loop.
+###
+class AsyncGenieClient:
     ###
     # METHOD: __init__
     #
-    # Initializes the GenieClient and configures the underlying Databricks
+    # Initializes the client and configures the underlying Databricks
     # WorkspaceClient with specific credentials and robust retry settings for
     # network requests, including timeout, max retries, and exponential backoff.
+    # The HTTP connection pool is sized to the I/O thread pool so concurrent
+    # calls reuse kept-alive connections instead of opening new ones. The SDK
+    # is imported here, on first use, to keep importing this module cheap.
     ###
     def __init__(self, host: str, space_id: str, token: str):
+        from databricks.sdk import WorkspaceClient
+        from databricks.sdk.core import Config
+
         self.host = host
         self.space_id = space_id
         self.token = token
-        
+
         config = Config(
             host=f"https://{host}",
             token=token,
             auth_type="pat",
-            retry_timeout_seconds=300,
+            retry_timeout_seconds=SDK_RETRY_TIMEOUT_SECONDS,
             max_retries=5,
             retry_delay_seconds=2,
-            retry_backoff_factor=2
+            retry_backoff_factor=2,
+            max_connection_pools=GENIE_ASYNC_MAX_WORKERS,
+            max_connections_per_pool=GENIE_ASYNC_MAX_WORKERS
         )
         self.client = WorkspaceClient(config=config)
 
+    ###
+    # METHOD: _call
+    #
+    # Runs a single blocking SDK call on the shared I/O thread pool and awaits
+    # its result without blocking the event loop. Calls go through the Genie
+    # circuit breaker and, if `idempotent`, are retried on transient errors
+    # within the retry budget; that bookkeeping runs on the same pool, since
+    # it reads the shared resilience store. 429 responses are reported to the
+    # throttle listeners before being re-raised.
+    ###
+    async def _call(self, fn: Callable[..., T], idempotent: bool = True, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        method = getattr(fn, "__name__", "call")
+        start = time.perf_counter()
+        try:
+            return await get_resilience().call_async(
+                genie_endpoint(self.host),
+                lambda: loop.run_in_executor(_get_executor(), functools.partial(_sdk_call, fn, **kwargs)),
+                idempotent=idempotent,
+                executor=_get_executor()
+            )
+        except Exception as e:
+            GENIE_API_ERRORS.inc(method=method, kind=classify_error(e).value, space_id=self.space_id)
+            if is_throttled(e):
+                _notify_throttled(retry_after(e))
+            raise
+        finally:
+            GENIE_API_SECONDS.observe(time.perf_counter() - start, method=method, space_id=self.space_id)
+
     ###
     # METHOD: start_conversation
     #
     # Begins a new conversation in the specified Genie space with an initial
     # question and returns the new conversation and message IDs.
     ###
-    def start_conversation(self, question: str) -> Dict[str, Any]:
-        response = self.client.genie.start_conversation(
+    async def start_conversation(self, question: str) -> Dict[str, Any]:
+        response = await self._call(
+            self.client.genie.start_conversation,
+            idempotent=False,
             space_id=self.space_id,
             content=question
         )
@@ -76,8 +361,10 @@ class GenieClient:
     # Sends a follow-up message to an already existing conversation and
     # returns the ID of the newly created message.
     ###
-    def send_message(self, conversation_id: str, message: str) -> Dict[str, Any]:
-        response = self.client.genie.create_message(
+    async def send_message(self, conversation_id: str, message: str) -> Dict[str, Any]:
+        response = await self._call(
+            self.client.genie.create_message,
+            idempotent=False,
             space_id=self.space_id,
             conversation_id=conversation_id,
             content=message
@@ -92,75 +379,254 @@ class GenieClient:
     # Retrieves the full details and status of a specific message within
     # a conversation.
     ###
-    def get_message(self, conversation_id: str, message_id: str) -> Dict[str, Any]:
-        response = self.client.genie.get_message(
+    async def get_message(self, conversation_id: str, message_id: str) -> Dict[str, Any]:
+        response = await self._call(
+            self.client.genie.get_message,
             space_id=self.space_id,
             conversation_id=conversation_id,
             message_id=message_id
         )
         return response.as_dict()
 
+    ###
+    # METHOD: get_query_result_stream
+    #
+    # Opens the result of a query attachment and returns its schema, total row
+    # count and an async generator of row batches. The first batch comes from
+    # the attachment response itself; further batches are fetched chunk by
+    # chunk following the statement's `next_chunk_index`, so large results
+    # are never held in memory as one nested list. At most `max_rows` rows
+    # are yielded (defaults to GENIE_MAX_RESULT_ROWS).
+    ###
+    async def get_query_result_stream(self, conversation_id: str, message_id: str, attachment_id: str,
+                                      max_rows: Optional[int] = None) -> Dict[str, Any]:
+        statement = await self._get_statement_response(conversation_id, message_id, attachment_id)
+        return self._stream(statement, GENIE_MAX_RESULT_ROWS if max_rows is None else max_rows)
+
     ###
     # METHOD: get_query_result
     #
     # Fetches the results of a query associated with a message attachment. It
-    # extracts the data and schema from the response.
+    # extracts the data (following all result chunks, up to the row cap) and
+    # schema from the response.
     ###
-    def get_query_result(self, conversation_id: str, message_id: str, attachment_id: str) -> Dict[str, Any]:
-        response = self.client.genie.get_message_attachment_query_result(
+    async def get_query_result(self, conversation_id: str, message_id: str, attachment_id: str,
+                               max_rows: Optional[int] = None) -> Dict[str, Any]:
+        stream = await self.get_query_result_stream(conversation_id, message_id, attachment_id, max_rows)
+        data_array = []
+        async for batch in stream['batches']:
+            data_array.extend(batch)
+        return {
+            'data_array': data_array,
+            'schema': stream['schema']
+        }
+
+    ###
+    # METHOD: get_result_chunk
+    #
+    # Fetches a single result chunk of a SQL statement by its index.
+    ###
+    async def get_result_chunk(self, statement_id: str, chunk_index: int) -> Any:
+        return await self._call(
+            self.client.statement_execution.get_statement_result_chunk_n,
+            statement_id=statement_id,
+            chunk_index=chunk_index
+        )
+
+    async def _get_statement_response(self, conversation_id: str, message_id: str, attachment_id: str) -> Any:
+        response = await self._call(
+            self.client.genie.get_message_attachment_query_result,
             space_id=self.space_id,
             conversation_id=conversation_id,
             message_id=message_id,
             attachment_id=attachment_id
         )
-        
+
         if hasattr(response, 'statement_response') and response.statement_response and \
            hasattr(response.statement_response, 'result') and response.statement_response.result:
-            data_array = response.statement_response.result.data_array or []
-        else:
-            raise ValueError("Query execution failed: No result data available.")
-            
-        schema = {}
-        if hasattr(response, 'statement_response') and response.statement_response and \
-           hasattr(response.statement_response, 'manifest') and response.statement_response.manifest and \
-           hasattr(response.statement_response.manifest, 'schema') and response.statement_response.manifest.schema:
-            schema = response.statement_response.manifest.schema.as_dict()
-            
+            return response.statement_response
+        raise ValueError("Query execution failed: No result data available.")
+
+    def _stream(self, statement: Any, max_rows: Optional[int]) -> Dict[str, Any]:
         return {
-            'data_array': data_array,
-            'schema': schema
+            'schema': self._statement_schema(statement),
+            'total_row_count': self._statement_row_count(statement),
+            'batches': self._iter_result_batches(statement, max_rows)
         }
 
+    @staticmethod
+    def _statement_schema(statement: Any) -> Dict[str, Any]:
+        if hasattr(statement, 'manifest') and statement.manifest and \
+           hasattr(statement.manifest, 'schema') and statement.manifest.schema:
+            return statement.manifest.schema.as_dict()
+        return {}
+
+    @staticmethod
+    def _statement_row_count(statement: Any) -> Optional[int]:
+        manifest = getattr(statement, 'manifest', None)
+        return getattr(manifest, 'total_row_count', None) if manifest else None
+
+    async def _iter_result_batches(self, statement: Any, max_rows: Optional[int]) -> AsyncIterator[List[List[Any]]]:
+        result = statement.result
+        remaining = max_rows
+        while result is not None:
+            rows = result.data_array or []
+            if remaining is not None:
+                rows = rows[:remaining]
+                remaining -= len(rows)
+            if rows:
+                yield rows
+            next_chunk_index = getattr(result, 'next_chunk_index', None)
+            if next_chunk_index is None:
+                return
+            if remaining == 0:
+                logger.warning(f"Result of statement {statement.statement_id} truncated at {max_rows} rows")
+                return
+            result = await self.get_result_chunk(statement.statement_id, next_chunk_index)
+
+    ###
+    # METHOD: execute_query_stream
+    #
+    # Runs the query of an attachment again and returns its schema, total row
+    # count and an async generator over all of its row batches. Unlike
+    # `get_query_result_stream` the rows are not capped, so this is what full
+    # result exports use.
+    ###
+    async def execute_query_stream(self, conversation_id: str, message_id: str, attachment_id: str) -> Dict[str, Any]:
+        response = await self._execute(conversation_id, message_id, attachment_id)
+        statement = getattr(response, 'statement_response', None)
+        if statement is None or getattr(statement, 'result', None) is None:
+            raise ValueError("Query execution failed: No result data available.")
+        return self._stream(statement, None)
+
     ###
     # METHOD: execute_query
     #
     # A wrapper method to execute a query using its attachment ID.
     ###
-    def execute_query(self, conversation_id: str, message_id: str, attachment_id: str) -> Dict[str, Any]:
-        response = self.client.genie.execute_query(
+    async def execute_query(self, conversation_id: str, message_id: str, attachment_id: str) -> Dict[str, Any]:
+        response = await self._execute(conversation_id, message_id, attachment_id)
+        return response.as_dict()
+
+    async def _execute(self, conversation_id: str, message_id: str, attachment_id: str) -> Any:
+        return await self._call(
+            self.client.genie.execute_message_attachment_query,
+            idempotent=False,
             space_id=self.space_id,
             conversation_id=conversation_id,
             message_id=message_id,
             attachment_id=attachment_id
         )
-        return response.as_dict()
+
+    ###
+    # METHOD: cancel_message
+    #
+    # Stops the server-side work of a message that is still running. Genie's
+    # message API has no cancel call, so the SQL statements of the message's
+    # query attachments are cancelled, which ends the message as well.
+    # Returns the number of statements cancelled.
+    ###
+    async def cancel_message(self, conversation_id: str, message_id: str) -> int:
+        message = await self.get_message(conversation_id, message_id)
+        if message.get("status") in TERMINAL_MESSAGE_STATUSES:
+            return 0
+        statement_ids = {(attachment.get("query") or {}).get("statement_id")
+                         for attachment in message.get("attachments") or []}
+        statement_ids.discard(None)
+        for statement_id in statement_ids:
+            await self._call(self.client.statement_execution.cancel_execution, idempotent=False, statement_id=statement_id)
+        return len(statement_ids)
 
     ###
     # METHOD: wait_for_message_completion
     #
-    # Polls the `get_message` endpoint at regular intervals until the message
-    # reaches a terminal state (e.g., COMPLETED, ERROR). This is a blocking
-    # call that waits for Genie to finish processing.
+    # Polls the `get_message` endpoint until the message reaches a terminal
+    # state (e.g., COMPLETED, ERROR), pacing the polls with a PollingPolicy.
+    # Waiting is done with `asyncio.sleep`, so other conversations keep
+    # progressing meanwhile. A 429 response is retried after the server's
+    # Retry-After, and the wait, including a poll still in flight, never runs
+    # past `timeout` or the caller's `deadline` (an absolute
+    # `time.monotonic()` value).
+    ###
+    async def wait_for_message_completion(self, conversation_id: str, message_id: str, timeout: int = 300,
+                                          poll_interval: Optional[float] = None, deadline: Optional[float] = None,
+                                          policy: Optional[PollingPolicy] = None) -> Dict[str, Any]:
+        if policy is None:
+            policy = PollingPolicy.fixed(poll_interval) if poll_interval else PollingPolicy()
+        start_time = time.monotonic()
+        end_time = start_time + timeout if deadline is None else min(start_time + timeout, deadline)
+        polls = throttled = attempt = 0
+        last_status = None
+        last_sleep = 0.0
+
+        while True:
+            polls += 1
+            # A single poll can stall in the SDK's own retries; it gets only
+            # the time that is left.
+            poll = asyncio.ensure_future(self.get_message(conversation_id, message_id))
+            done, _ = await asyncio.wait({poll}, timeout=max(0.0, end_time - time.monotonic()))
+            if not done:
+                poll.cancel()
+                break
+            try:
+                message = poll.result()
+            except Exception as e:
+                if not is_throttled(e):
+                    raise
+                throttled += 1
+                wait = max(retry_after(e), policy.next_interval(attempt, last_status))
+                message = None
+            if message is not None:
+                status = message.get("status")
+                if status in TERMINAL_MESSAGE_STATUSES:
+                    GENIE_POLLS.observe(polls, status=status, space_id=self.space_id)
+                    _record_poll_stats(message_id, {
+                        "message_id": message_id,
+                        "status": status,
+                        "polls": polls,
+                        "throttled": throttled,
+                        "elapsed": time.monotonic() - start_time,
+                        "wasted_wait": self._estimate_wasted_wait(message, last_sleep),
+                    })
+                    return message
+                if status != last_status:
+                    attempt = 0
+                    last_status = status
+                wait = policy.next_interval(attempt, status)
+                attempt += 1
+
+            remaining = end_time - time.monotonic()
+            if remaining <= 0:
+                break
+            last_sleep = min(wait, remaining)
+            await asyncio.sleep(last_sleep)
+
+        raise TimeoutError(f"Message processing timed out after {time.monotonic() - start_time:.1f} seconds")
+
+    ###
+    # METHOD: _estimate_wasted_wait
+    #
+    # Estimates how long the message had already been finished before the
+    # poll that observed it, using Genie's last-update timestamp when present
+    # and half of the last sleep otherwise.
+    ###
+    @staticmethod
+    def _estimate_wasted_wait(message: Dict[str, Any], last_sleep: float) -> float:
+        updated_ms = message.get("last_updated_timestamp")
+        if updated_ms:
+            return min(last_sleep, max(0.0, time.time() - updated_ms / 1000.0))
+        return last_sleep / 2
+
+    ###
+    # METHOD: list_spaces_page
+    #
+    # Retrieves one page of the Genie spaces available to the user. Returns
+    # the spaces and the token of the next page (None on the last page).
     ###
-    def wait_for_message_completion(self, conversation_id: str, message_id: str, timeout: int = 300, poll_interval: int = 2) -> Dict[str, Any]:
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            message = self.get_message(conversation_id, message_id)
-            status = message.get("status")
-            if status in ["COMPLETED", "ERROR", "FAILED"]:
-                return message
-            time.sleep(poll_interval)
-        raise TimeoutError(f"Message processing timed out after {timeout} seconds")
+    async def list_spaces_page(self, page_size: int = 1000, page_token: Optional[str] = None) -> Tuple[list, Optional[str]]:
+        response = await self._call(self.client.genie.list_spaces, page_size=page_size, page_token=page_token)
+        spaces = [space.as_dict() for space in response.spaces] if getattr(response, 'spaces', None) else []
+        return spaces, getattr(response, 'next_page_token', None) or None
 
     ###
     # METHOD: list_spaces
@@ -168,126 +634,515 @@ class GenieClient:
     # Retrieves a list of all Genie spaces available to the user, handling
     # pagination to ensure all spaces are returned.
     ###
-    def list_spaces(self) -> list:
+    async def list_spaces(self) -> list:
         all_spaces = []
         next_page_token = None
         while True:
-            response = self.client.genie.list_spaces(page_size=1000, page_token=next_page_token)
-            if hasattr(response, 'spaces') and response.spaces:
-                all_spaces.extend([space.as_dict() for space in response.spaces])
-            next_page_token = getattr(response, 'next_page_token', None)
+            spaces, next_page_token = await self.list_spaces_page(page_size=1000, page_token=next_page_token)
+            all_spaces.extend(spaces)
             if not next_page_token:
                 break
         return all_spaces
 
 
 ###
-# FUNCTION: process_genie_response
+# GenieClient CLASS
+#
+# The synchronous client used by the Dash callbacks. It is a thin wrapper that
+# drives an AsyncGenieClient to completion for every call, so both APIs share
+# one implementation and one configured WorkspaceClient.
+###
+class GenieClient:
+    ###
+    # METHOD: __init__
+    #
+    # Initializes the wrapped AsyncGenieClient and exposes its WorkspaceClient.
+    ###
+    def __init__(self, host: str, space_id: str, token: str):
+        self.host = host
+        self.space_id = space_id
+        self.token = token
+        self.async_client = AsyncGenieClient(host=host, space_id=space_id, token=token)
+        self.client = self.async_client.client
+
+    def start_conversation(self, question: str) -> Dict[str, Any]:
+        return _run_sync(self.async_client.start_conversation(question))
+
+    def send_message(self, conversation_id: str, message: str) -> Dict[str, Any]:
+        return _run_sync(self.async_client.send_message(conversation_id, message))
+
+    def get_message(self, conversation_id: str, message_id: str) -> Dict[str, Any]:
+        return _run_sync(self.async_client.get_message(conversation_id, message_id))
+
+    def get_query_result(self, conversation_id: str, message_id: str, attachment_id: str,
+                         max_rows: Optional[int] = None) -> Dict[str, Any]:
+        return _run_sync(self.async_client.get_query_result(conversation_id, message_id, attachment_id, max_rows))
+
+    def get_query_result_stream(self, conversation_id: str, message_id: str, attachment_id: str,
+                                max_rows: Optional[int] = None) -> Dict[str, Any]:
+        return self._sync_stream(self.async_client.get_query_result_stream(conversation_id, message_id, attachment_id, max_rows))
+
+    def execute_query(self, conversation_id: str, message_id: str, attachment_id: str) -> Dict[str, Any]:
+        return _run_sync(self.async_client.execute_query(conversation_id, message_id, attachment_id))
+
+    def execute_query_stream(self, conversation_id: str, message_id: str, attachment_id: str) -> Dict[str, Any]:
+        return self._sync_stream(self.async_client.execute_query_stream(conversation_id, message_id, attachment_id))
+
+    @staticmethod
+    def _sync_stream(stream: Awaitable[Dict[str, Any]]) -> Dict[str, Any]:
+        # The batch generator has not started yet, so it can be driven by a
+        # loop of its own once `_run_sync`'s loop is closed.
+        result = _run_sync(stream)
+        result['batches'] = _iter_sync(result['batches'])
+        return result
+
+    def cancel_message(self, conversation_id: str, message_id: str) -> int:
+        return _run_sync(self.async_client.cancel_message(conversation_id, message_id))
+
+    def wait_for_message_completion(self, conversation_id: str, message_id: str, timeout: int = 300,
+                                    poll_interval: Optional[float] = None, deadline: Optional[float] = None,
+                                    policy: Optional[PollingPolicy] = None) -> Dict[str, Any]:
+        return _run_sync(self.async_client.wait_for_message_completion(conversation_id, message_id, timeout, poll_interval, deadline, policy))
+
+    def list_spaces_page(self, page_size: int = 1000, page_token: Optional[str] = None) -> Tuple[list, Optional[str]]:
+        return _run_sync(self.async_client.list_spaces_page(page_size, page_token))
+
+    def list_spaces(self) -> list:
+        return _run_sync(self.async_client.list_spaces())
+
+
+###
+# GenieClientPool CLASS
+#
+# Building a GenieClient means building a new Config and WorkspaceClient,
+# which repeats auth setup and opens fresh HTTPS connections. This bounded,
+# thread-safe pool keeps clients keyed by a hash of the user's token and the
+# space ID, so repeat questions reuse the client and its kept-alive
+# connections. Entries are evicted least-recently-used once the pool is full
+# and after a TTL, which also bounds how long an expired token is retained.
+# The pool is reset after a fork so processes never share sockets.
+###
+GENIE_CLIENT_POOL_SIZE = int(os.environ.get("GENIE_CLIENT_POOL_SIZE", "128"))
+GENIE_CLIENT_POOL_TTL_SECONDS = int(os.environ.get("GENIE_CLIENT_POOL_TTL_SECONDS", "600"))
+
+
+class GenieClientPool:
+    def __init__(self, max_size: int = GENIE_CLIENT_POOL_SIZE, ttl_seconds: int = GENIE_CLIENT_POOL_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clients: "OrderedDict[Tuple[str, str, str], Tuple[GenieClient, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    ###
+    # METHOD: get
+    #
+    # Returns a pooled client for the given host, space and token, creating
+    # one on a miss. Expired and least-recently-used entries are evicted.
+    ###
+    def get(self, host: str, space_id: str, token: str) -> GenieClient:
+        key = (hashlib.sha256((token or "").encode()).hexdigest(), host or "", space_id or "")
+        now = time.monotonic()
+        with self._lock:
+            if self._pid != os.getpid():
+                self._clients.clear()
+                self._pid = os.getpid()
+            entry = self._clients.get(key)
+            if entry is not None and now - entry[1] < self.ttl_seconds:
+                self._clients.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._clients[key]
+                self.evictions += 1
+            self.misses += 1
+
+        client = GenieClient(host=host, space_id=space_id, token=token)
+
+        with self._lock:
+            self._clients[key] = (client, now)
+            self._clients.move_to_end(key)
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+                self.evictions += 1
+        return client
+
+    ###
+    # METHOD: stats
+    #
+    # Returns hit/miss/eviction counters and the current pool size.
+    ###
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._clients),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+
+
+client_pool = GenieClientPool()
+
+
+###
+# FUNCTION: get_genie_client
 #
-# Parses the completed message from Genie to extract the meaningful result.
-# It handles different response types, such as plain text or a query result,
-# converting query data into a pandas DataFrame.
+# Returns a pooled GenieClient for the given host, space and token.
+###
+def get_genie_client(host: str, space_id: str, token: str) -> GenieClient:
+    return client_pool.get(host, space_id, token)
+
+
 ###
-def process_genie_response(client: GenieClient, conversation_id: str, message_id: str, complete_message: Dict[str, Any]) -> Tuple[Union[str, pd.DataFrame], Optional[str], Optional[str]]:
-    attachments = complete_message.get("attachments", [])
+# SCHEMA-TYPED DATAFRAME CONSTRUCTION
+#
+# Genie returns every cell as a string. Instead of leaving every column as
+# object dtype, each column is parsed with a vectorized pandas conversion
+# chosen from the statement schema (`type_name`, precision, scale): nullable
+# integers, floats, decimals, booleans and datetimes. Low-cardinality string
+# columns become categoricals once the whole result has been assembled.
+###
+INTEGER_DTYPES = {"BYTE": "Int8", "SHORT": "Int16", "INT": "Int32", "LONG": "Int64"}
+FLOAT_DTYPES = {"FLOAT": "float32", "DOUBLE": "float64"}
+DATETIME_TYPES = ("DATE", "TIMESTAMP", "TIMESTAMP_NTZ")
+STRING_TYPES = ("STRING", "CHAR")
+# Decimals up to this precision are exactly representable as float64.
+MAX_FLOAT_DECIMAL_PRECISION = 15
+CATEGORY_MIN_ROWS = int(os.environ.get("GENIE_CATEGORY_MIN_ROWS", "200"))
+CATEGORY_MAX_UNIQUE_RATIO = float(os.environ.get("GENIE_CATEGORY_MAX_UNIQUE_RATIO", "0.5"))
+
+
+def _parse_integers(values: pd.Series, dtype: str) -> pd.Series:
+    # Parsed from the text, never through float64, which would round
+    # BIGINTs above 2**53 (IDs and keys) as soon as the column has a NULL.
+    try:
+        return values.astype("string").astype(dtype)
+    except (ValueError, TypeError):
+        valid = values.astype("string").str.strip().str.fullmatch(r"[+-]?\d+").fillna(False)
+        return values.astype("string").where(valid).str.strip().astype(dtype)
+
+
+def _parse_column(values: pd.Series, column_schema: Dict[str, Any]) -> pd.Series:
+    type_name = (column_schema.get("type_name") or "").upper()
+    try:
+        if type_name in INTEGER_DTYPES:
+            return _parse_integers(values, INTEGER_DTYPES[type_name])
+        if type_name in FLOAT_DTYPES:
+            return pd.to_numeric(values, errors="coerce").astype(FLOAT_DTYPES[type_name])
+        if type_name == "DECIMAL":
+            precision = column_schema.get("type_precision") or 38
+            if precision <= MAX_FLOAT_DECIMAL_PRECISION:
+                return pd.to_numeric(values, errors="coerce")
+            return values.map(lambda v: Decimal(v) if v is not None else None)
+        if type_name == "BOOLEAN":
+            return values.str.lower().map({"true": True, "false": False}).astype("boolean")
+        if type_name in DATETIME_TYPES:
+            parsed = pd.to_datetime(values, errors="coerce", utc=True, format="ISO8601")
+            return parsed.dt.tz_localize(None)
+    except (ValueError, TypeError, InvalidOperation) as e:
+        logger.warning(f"Could not parse column {column_schema.get('name')} as {type_name}, keeping strings: {e}")
+    return values
+
+
+###
+# FUNCTION: build_typed_frame
+#
+# Builds a DataFrame from one batch of row lists, parsing every column
+# according to its schema entry.
+###
+def build_typed_frame(rows: List[List[Any]], columns: List[str], schema_columns: List[Dict[str, Any]]) -> pd.DataFrame:
+    raw = pd.DataFrame(rows, columns=columns, dtype=object)
+    if not schema_columns:
+        return raw
+    return pd.DataFrame(
+        {name: _parse_column(raw[name], column_schema) for name, column_schema in zip(columns, schema_columns)},
+        columns=columns
+    )
+
+
+###
+# FUNCTION: categorize_low_cardinality
+#
+# Converts string columns with few distinct values into categoricals, which
+# shrinks their memory footprint and speeds up sorting and grouping.
+###
+def categorize_low_cardinality(df: pd.DataFrame, schema_columns: List[Dict[str, Any]]) -> pd.DataFrame:
+    if len(df) < CATEGORY_MIN_ROWS:
+        return df
+    types = {c.get("name"): (c.get("type_name") or "").upper() for c in schema_columns}
+    for name in df.columns:
+        if df[name].dtype == object and types.get(name, "STRING") in STRING_TYPES:
+            if df[name].nunique(dropna=True) <= CATEGORY_MAX_UNIQUE_RATIO * len(df):
+                df[name] = df[name].astype("category")
+    return df
+
+
+###
+# FUNCTION: async_fetch_attachment
+#
+# Turns one attachment into a response part: its text, or its query result
+# as a schema-typed pandas DataFrame built one result chunk at a time.
+# Returns None for attachments with nothing to show.
+###
+async def async_fetch_attachment(client: AsyncGenieClient, conversation_id: str, message_id: str, attachment: Dict[str, Any]) -> Optional[ResponsePart]:
+    if "text" in attachment and "content" in attachment["text"]:
+        return attachment["text"]["content"], None, None
+
+    if "query" in attachment:
+        query_info = attachment.get("query", {})
+        query_text = query_info.get("query", "")
+        description = query_info.get("description")
+
+        # Fetching chunks and building frames interleave; their times are
+        # added up separately.
+        fetch_seconds = build_seconds = 0.0
+        start = time.perf_counter()
+        stream = await client.get_query_result_stream(conversation_id, message_id, attachment.get("attachment_id"))
+        schema_columns = stream['schema'].get('columns', [])
+        columns = [col.get('name') for col in schema_columns]
+
+        frames = []
+        async for batch in stream['batches']:
+            built = time.perf_counter()
+            fetch_seconds += built - start
+            if not columns and batch[0]:
+                columns = [f"column_{i}" for i in range(len(batch[0]))]
+            frames.append(build_typed_frame(batch, columns, schema_columns))
+            start = time.perf_counter()
+            build_seconds += start - built
+        fetch_seconds += time.perf_counter() - start
+        GENIE_PHASE_SECONDS.observe(fetch_seconds, phase="fetch_result", space_id=client.space_id)
+
+        if frames:
+            start = time.perf_counter()
+            df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+            df = categorize_low_cardinality(df, schema_columns)
+            GENIE_PHASE_SECONDS.observe(build_seconds + time.perf_counter() - start, phase="build_frame", space_id=client.space_id)
+            GENIE_RESULT_ROWS.observe(len(df), space_id=client.space_id)
+            # Lets the query be run again later, e.g. for a full-result export.
+            df.attrs["genie_attachment"] = {"conversation_id": conversation_id, "message_id": message_id,
+                                            "attachment_id": attachment.get("attachment_id")}
+            return df, query_text, description
+    return None
+
+
+###
+# FUNCTION: async_process_genie_attachments
+#
+# Fetches every attachment of a completed message and returns the response
+# parts in attachment order. Query results are fetched concurrently, at most
+# GENIE_ATTACHMENT_CONCURRENCY at a time, so the total wait is about that of
+# the slowest one; fetches still running at `deadline` are cancelled. When a
+# message has several parts, a failed fetch becomes an error text part
+# instead of discarding the others.
+###
+async def async_process_genie_attachments(client: AsyncGenieClient, conversation_id: str, message_id: str,
+                                          complete_message: Dict[str, Any], deadline: Optional[float] = None) -> List[ResponsePart]:
+    attachments = complete_message.get("attachments") or []
+    semaphore = asyncio.Semaphore(GENIE_ATTACHMENT_CONCURRENCY)
+
+    async def fetch(attachment: Dict[str, Any]) -> Optional[ResponsePart]:
+        async with semaphore:
+            return await async_fetch_attachment(client, conversation_id, message_id, attachment)
+
+    tasks = [asyncio.ensure_future(fetch(a)) for a in attachments if "query" in a]
+    if tasks:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+    query_results = iter(tasks)
+
+    parts: List[Any] = []
     for attachment in attachments:
-        attachment_id = attachment.get("attachment_id")
-        
-        if "text" in attachment and "content" in attachment["text"]:
-            return attachment["text"]["content"], None, None
-        
-        elif "query" in attachment:
-            query_info = attachment.get("query", {})
-            query_text = query_info.get("query", "")
-            description = query_info.get("description")
-            
-            query_result = client.get_query_result(conversation_id, message_id, attachment_id)
-           
-            data_array = query_result.get('data_array', [])
-            schema = query_result.get('schema', {})
-            columns = [col.get('name') for col in schema.get('columns', [])]
-            
-            if data_array:
-                if not columns and data_array and data_array[0]:
-                    columns = [f"column_{i}" for i in range(len(data_array[0]))]
-                df = pd.DataFrame(data_array, columns=columns)
-                return df, query_text, description
-    
+        if "query" not in attachment:
+            parts.append(await async_fetch_attachment(client, conversation_id, message_id, attachment))
+            continue
+        task = next(query_results)
+        if task.cancelled():
+            parts.append(TimeoutError("Query result not loaded within the time limit"))
+        else:
+            parts.append(task.exception() or task.result())
+
+    failures = [p for p in parts if isinstance(p, BaseException)]
+    if failures and len(parts) == 1:
+        raise failures[0]
+    for failure in failures:
+        logger.error(f"Failed to load a query result of message {message_id}: {failure}")
+    return [_failed_part(p) if isinstance(p, BaseException) else p for p in parts if p is not None]
+
+
+def _failed_part(error: BaseException) -> ResponsePart:
+    if isinstance(error, TimeoutError):
+        return "This result did not finish loading in time.", None, None
+    return f"This result could not be loaded. {describe_error(error, 'Genie')}", None, None
+
+
+###
+# FUNCTION: async_process_genie_response
+#
+# Parses the completed message from Genie into (result, query_text,
+# description). A message with a single part returns that part's text or
+# DataFrame; one with several returns the list of its parts as the result
+# (each part a (result, query_text, description) tuple).
+###
+async def async_process_genie_response(client: AsyncGenieClient, conversation_id: str, message_id: str, complete_message: Dict[str, Any],
+                                       deadline: Optional[float] = None) -> Tuple[Union[str, pd.DataFrame, List[ResponsePart]], Optional[str], Optional[str]]:
+    parts = await async_process_genie_attachments(client, conversation_id, message_id, complete_message, deadline)
+    if len(parts) == 1:
+        return parts[0]
+    if parts:
+        return parts, None, None
+
     if 'content' in complete_message:
         return complete_message.get('content', ''), None, None
-    
+
     return "No response available", None, None
 
 
 ###
-# FUNCTION: start_new_conversation
+# FUNCTION: async_start_new_conversation
 #
 # Handles the logic for starting a new conversation. It uses the provided
 # client to send the first message, wait for it to complete, and process
 # the final response.
 ###
-def start_new_conversation(client: GenieClient, question: str) -> Tuple[str, Union[str, pd.DataFrame], Optional[str], Optional[str]]:
+async def async_start_new_conversation(client: AsyncGenieClient, question: str, deadline: Optional[float] = None,
+                                       on_message: Optional[MessageListener] = None) -> Tuple[str, Union[str, pd.DataFrame], Optional[str], Optional[str]]:
     try:
-        response = client.start_conversation(question)
+        with GENIE_PHASE_SECONDS.time(phase="start_conversation", space_id=client.space_id):
+            response = await client.start_conversation(question)
         conversation_id = response["conversation_id"]
         message_id = response["message_id"]
-        
-        complete_message = client.wait_for_message_completion(conversation_id, message_id)
-        result, query_text, description = process_genie_response(client, conversation_id, message_id, complete_message)
-        
+        if on_message:
+            on_message(conversation_id, message_id)
+
+        with GENIE_PHASE_SECONDS.time(phase="wait", space_id=client.space_id):
+            complete_message = await client.wait_for_message_completion(conversation_id, message_id, deadline=deadline)
+        result, query_text, description = await async_process_genie_response(client, conversation_id, message_id, complete_message, deadline)
+
         return conversation_id, result, query_text, description
     except Exception as e:
-        if "Expired Token" in str(e):
-            return None, "Sorry, your authentication token has expired. Please refresh the page and try again.", None, None
-        return None, f"Sorry, an error occurred: {str(e)}. Please try again.", None, None
+        GENIE_QUESTION_ERRORS.inc(kind=classify_error(e).value, space_id=client.space_id)
+        logger.error(f"Error starting conversation ({classify_error(e).value}): {str(e)}")
+        return None, describe_error(e, "Genie"), None, None
 
 
 ###
-# FUNCTION: continue_conversation
+# FUNCTION: async_continue_conversation
 #
 # Handles the logic for sending a message to an existing conversation. It
 # uses the provided client to send the follow-up message, wait for completion,
 # and process the final response.
 ###
-def continue_conversation(client: GenieClient, conversation_id: str, question: str) -> Tuple[Union[str, pd.DataFrame], Optional[str], Optional[str]]:
+async def async_continue_conversation(client: AsyncGenieClient, conversation_id: str, question: str, deadline: Optional[float] = None,
+                                      on_message: Optional[MessageListener] = None) -> Tuple[Union[str, pd.DataFrame], Optional[str], Optional[str]]:
     logger.info(f"Continuing conversation {conversation_id} with question: {question[:30]}...")
     try:
-        response = client.send_message(conversation_id, question)
+        with GENIE_PHASE_SECONDS.time(phase="send_message", space_id=client.space_id):
+            response = await client.send_message(conversation_id, question)
         message_id = response["message_id"]
-        
-        complete_message = client.wait_for_message_completion(conversation_id, message_id)
-        result, query_text, description = process_genie_response(client, conversation_id, message_id, complete_message)
-        
+        if on_message:
+            on_message(conversation_id, message_id)
+
+        with GENIE_PHASE_SECONDS.time(phase="wait", space_id=client.space_id):
+            complete_message = await client.wait_for_message_completion(conversation_id, message_id, deadline=deadline)
+        result, query_text, description = await async_process_genie_response(client, conversation_id, message_id, complete_message, deadline)
+
         return result, query_text, description
     except Exception as e:
-        if "429" in str(e) or "Too Many Requests" in str(e):
-            return "Sorry, the system is currently experiencing high demand. Please try again in a few moments.", None, None
-        elif "Conversation not found" in str(e):
+        kind = classify_error(e)
+        GENIE_QUESTION_ERRORS.inc(kind=kind.value, space_id=client.space_id)
+        logger.error(f"Error continuing conversation ({kind.value}): {str(e)}")
+        if kind == ErrorKind.NOT_FOUND:
             return "Sorry, the previous conversation has expired. Please try your query again to start a new conversation.", None, None
-        elif "Expired Token" in str(e):
-            return "Sorry, your authentication token has expired. Please refresh the page and try again.", None, None
-        else:
-            logger.error(f"Error continuing conversation: {str(e)}")
-            return f"Sorry, an error occurred: {str(e)}", None, None
+        return describe_error(e, "Genie"), None, None
+
 
 ###
-# FUNCTION: genie_query
+# FUNCTION: async_genie_query
 #
-# This is the main entry point function for the application's backend logic.
-# It instantiates the GenieClient once and then determines whether to start a
-# new conversation or continue an existing one based on the presence of a `conversation_id`.
+# The asyncio entry point for the application's backend logic. It takes a
+# client from the shared pool and then determines whether to start a new
+# conversation or continue an existing one based on the presence of a
+# `conversation_id`. Many calls can be awaited concurrently on a single loop.
+# An optional `deadline` (absolute `time.monotonic()` value) bounds the wait,
+# and `on_message(conversation_id, message_id)` is called as soon as the
+# question has been sent, e.g. so it can be cancelled later.
 ###
-def genie_query(question: str, token: str, space_id: str, conversation_id: Optional[str] = None) -> Union[Tuple[str, Union[str, pd.DataFrame], Optional[str], Optional[str]], Tuple[None, str, None, None]]:
+async def async_genie_query(question: str, token: str, space_id: str, conversation_id: Optional[str] = None, deadline: Optional[float] = None,
+                            on_message: Optional[MessageListener] = None) -> Union[Tuple[str, Union[str, pd.DataFrame], Optional[str], Optional[str]], Tuple[None, str, None, None]]:
+    start = time.perf_counter()
     try:
-        client = GenieClient(host=DATABRICKS_HOST, space_id=space_id, token=token)
-        
-        if conversation_id:
-            result, query_text, description = continue_conversation(client, conversation_id, question)
-        else:
-            conversation_id, result, query_text, description = start_new_conversation(client, question)
-        
+        with GENIE_QUESTIONS_IN_FLIGHT.track(space_id=space_id):
+            with GENIE_PHASE_SECONDS.time(phase="client", space_id=space_id):
+                client = get_genie_client(host=DATABRICKS_HOST, space_id=space_id, token=token).async_client
+
+            if conversation_id:
+                result, query_text, description = await async_continue_conversation(client, conversation_id, question, deadline, on_message)
+            else:
+                conversation_id, result, query_text, description = await async_start_new_conversation(client, question, deadline, on_message)
+
         return conversation_id, result, query_text, description
-            
+
     except Exception as e:
+        GENIE_QUESTION_ERRORS.inc(kind=classify_error(e).value, space_id=space_id)
         logger.error(f"Error in conversation: {str(e)}. Please try again.")
-        return None, f"Sorry, an error occurred: {str(e)}. Please try again.", None, None
\ No newline at end of file
+        return None, describe_error(e, "Genie"), None, None
+    finally:
+        GENIE_QUESTION_SECONDS.observe(time.perf_counter() - start, space_id=space_id)
+
+
+###
+# SYNCHRONOUS WRAPPERS
+#
+# The blocking functions used by the Dash callbacks. Each one simply runs its
+# async counterpart to completion, so behaviour stays identical between the
+# two APIs.
+###
+def process_genie_response(client: GenieClient, conversation_id: str, message_id: str, complete_message: Dict[str, Any],
+                           deadline: Optional[float] = None) -> Tuple[Union[str, pd.DataFrame, List[ResponsePart]], Optional[str], Optional[str]]:
+    return _run_sync(async_process_genie_response(client.async_client, conversation_id, message_id, complete_message, deadline))
+
+
+def start_new_conversation(client: GenieClient, question: str, deadline: Optional[float] = None) -> Tuple[str, Union[str, pd.DataFrame], Optional[str], Optional[str]]:
+    return _run_sync(async_start_new_conversation(client.async_client, question, deadline))
+
+
+def continue_conversation(client: GenieClient, conversation_id: str, question: str, deadline: Optional[float] = None) -> Tuple[Union[str, pd.DataFrame], Optional[str], Optional[str]]:
+    return _run_sync(async_continue_conversation(client.async_client, conversation_id, question, deadline))
+
+
+###
+# FUNCTION: genie_query
+#
+# This is the main entry point function for the application's backend logic.
+# It runs `async_genie_query` to completion on a private event loop, so the
+# callers in app.py keep their simple blocking interface.
+###
+def genie_query(question: str, token: str, space_id: str, conversation_id: Optional[str] = None, deadline: Optional[float] = None,
+                on_message: Optional[MessageListener] = None) -> Union[Tuple[str, Union[str, pd.DataFrame], Optional[str], Optional[str]], Tuple[None, str, None, None]]:
+    return _run_sync(async_genie_query(question, token, space_id, conversation_id, deadline, on_message))
+
+
+###
+# FUNCTION: cancel_genie_message
+#
+# Cancels the server-side work of a question sent by `genie_query` (see
+# AsyncGenieClient.cancel_message). Returns the number of statements cancelled.
+###
+def cancel_genie_message(token: str, space_id: str, conversation_id: str, message_id: str) -> int:
+    return get_genie_client(host=DATABRICKS_HOST, space_id=space_id, token=token).cancel_message(conversation_id, message_id)
@@ -0,0 +1,291 @@
+###
+# IMPORTS AND CONFIGURATION
+#
+# App-wide admission control for Genie (and insight) work. Every question
+# takes a ticket before it calls Genie and gives it back when done. Tickets
+# are admitted in priority order, fairly across users, within per-user,
+# per-space and global concurrency limits and a token-bucket rate limit.
+# Background callbacks run in separate processes, so the queue lives in a
+# small SQLite database that all of them share.
+###
+import logging
+import os
+import sqlite3
+import statistics
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_DB_PATH = os.environ.get("SCHEDULER_DB_PATH", "./scheduler.db")
+
+# Concurrency limits: questions running at once overall, per user and per space.
+GENIE_MAX_CONCURRENT = int(os.environ.get("GENIE_MAX_CONCURRENT", "16"))
+GENIE_MAX_CONCURRENT_PER_USER = int(os.environ.get("GENIE_MAX_CONCURRENT_PER_USER", "2"))
+GENIE_MAX_CONCURRENT_PER_SPACE = int(os.environ.get("GENIE_MAX_CONCURRENT_PER_SPACE", "8"))
+# Token bucket for starting Genie questions: sustained rate and burst size.
+GENIE_RATE_PER_SECOND = float(os.environ.get("GENIE_RATE_PER_SECOND", "2"))
+GENIE_RATE_BURST = float(os.environ.get("GENIE_RATE_BURST", "10"))
+# How long a ticket may wait before the request is turned away.
+GENIE_QUEUE_MAX_WAIT_SECONDS = float(os.environ.get("GENIE_QUEUE_MAX_WAIT_SECONDS", "120"))
+GENIE_QUEUE_POLL_SECONDS = 0.25
+# Admitted tickets older than this are assumed abandoned and released.
+GENIE_TICKET_MAX_AGE_SECONDS = float(os.environ.get("GENIE_TICKET_MAX_AGE_SECONDS", "900"))
+# Number of recent queue waits kept for the wait-time metrics.
+_WAIT_HISTORY = 1000
+
+# Lower numbers are admitted first.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_INSIGHT = 1
+PRIORITY_PREFETCH = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_INSIGHT: "insight", PRIORITY_PREFETCH: "prefetch"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    id TEXT PRIMARY KEY,
+    user TEXT NOT NULL,
+    space TEXT,
+    priority INTEGER NOT NULL,
+    rate_limited INTEGER NOT NULL,
+    pid INTEGER NOT NULL,
+    enqueued REAL NOT NULL,
+    admitted REAL
+);
+CREATE TABLE IF NOT EXISTS bucket (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    blocked_until REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS waits (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    priority INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    timed_out INTEGER NOT NULL
+);
+"""
+
+
+class QueueTimeout(TimeoutError):
+    pass
+
+
+###
+# FUNCTION: pid_alive
+#
+# Whether a process with this PID exists (also used by metrics to drop the
+# gauges of processes that died).
+###
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+###
+# GenieScheduler CLASS
+#
+# Use `admit` as a context manager around each unit of work:
+#
+#     with scheduler.admit(user, space_id, PRIORITY_INTERACTIVE, on_wait=...):
+#         genie_query(...)
+#
+# Waiting tickets are ordered by priority, then by how many tickets their
+# user already has running (so one busy user cannot starve the others), then
+# by arrival. A ticket is admitted once every ticket ahead of it that could
+# run has been counted against the limits and there is still room for it.
+###
+class GenieScheduler:
+    def __init__(self, path: str = SCHEDULER_DB_PATH, max_concurrent: int = GENIE_MAX_CONCURRENT,
+                 max_per_user: int = GENIE_MAX_CONCURRENT_PER_USER, max_per_space: int = GENIE_MAX_CONCURRENT_PER_SPACE,
+                 rate_per_second: float = GENIE_RATE_PER_SECOND, burst: float = GENIE_RATE_BURST,
+                 max_wait_seconds: float = GENIE_QUEUE_MAX_WAIT_SECONDS):
+        self.path = path
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_per_space = max_per_space
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_wait_seconds = max_wait_seconds
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            conn.execute("INSERT OR IGNORE INTO bucket (id, tokens, updated, blocked_until) VALUES (1, ?, ?, 0)",
+                         (burst, time.time()))
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE takes the write lock up front, so admission
+        # decisions of different processes never interleave.
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    ###
+    # METHOD: admit
+    #
+    # Waits until the work may start, then runs the body and releases the
+    # ticket. `on_wait(position)` is called whenever the 1-based queue
+    # position changes. Raises QueueTimeout after `max_wait_seconds` or at the
+    # caller's `deadline` (an absolute `time.monotonic()` value).
+    ###
+    @contextmanager
+    def admit(self, user: str, space_id: Optional[str] = None, priority: int = PRIORITY_INTERACTIVE,
+              rate_limited: bool = True, on_wait: Optional[Callable[[int], None]] = None,
+              deadline: Optional[float] = None) -> Iterator[None]:
+        ticket = str(uuid.uuid4())
+        enqueued = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO tickets (id, user, space, priority, rate_limited, pid, enqueued, admitted) VALUES (?, ?, ?, ?, ?, ?, ?, NULL)",
+                (ticket, user or "anonymous", space_id, priority, int(rate_limited), os.getpid(), enqueued)
+            )
+        try:
+            self._wait(ticket, priority, enqueued, on_wait, deadline)
+            yield
+        finally:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM tickets WHERE id = ?", (ticket,))
+
+    def _wait(self, ticket: str, priority: int, enqueued: float, on_wait: Optional[Callable[[int], None]],
+              deadline: Optional[float]) -> None:
+        give_up = time.monotonic() + self.max_wait_seconds
+        if deadline is not None:
+            give_up = min(give_up, deadline)
+        last_position = None
+        while True:
+            position = self._try_admit(ticket)
+            if position == 0:
+                self._record_wait(priority, time.time() - enqueued, timed_out=False)
+                return
+            if position != last_position and on_wait is not None:
+                on_wait(position)
+                last_position = position
+            if time.monotonic() >= give_up:
+                self._record_wait(priority, time.time() - enqueued, timed_out=True)
+                raise QueueTimeout(f"Still queued at position {position} after {time.time() - enqueued:.0f} seconds")
+            time.sleep(GENIE_QUEUE_POLL_SECONDS)
+
+    ###
+    # METHOD: _try_admit
+    #
+    # Admits the ticket if it may start now and returns 0, otherwise returns
+    # its 1-based position among the waiting tickets.
+    ###
+    def _try_admit(self, ticket: str) -> int:
+        now = time.time()
+        with self._transaction() as conn:
+            self._release_abandoned(conn, now)
+            rows = conn.execute("SELECT id, user, space, priority, rate_limited, enqueued, admitted FROM tickets").fetchall()
+            running = [r for r in rows if r[6] is not None]
+            running_total = len(running)
+            per_user = Counter(r[1] for r in running)
+            per_space = Counter(r[2] for r in running if r[2])
+            tokens, blocked_until = self._refill(conn, now)
+
+            waiting = sorted((r for r in rows if r[6] is None), key=lambda r: (r[3], per_user[r[1]], r[5]))
+            for position, (tid, user, space, _, rate_limited, _, _) in enumerate(waiting, start=1):
+                fits = (running_total < self.max_concurrent
+                        and per_user[user] < self.max_per_user
+                        and (not space or per_space[space] < self.max_per_space)
+                        and (not rate_limited or (tokens >= 1 and now >= blocked_until)))
+                if tid == ticket:
+                    if not fits:
+                        return position
+                    conn.execute("UPDATE tickets SET admitted = ? WHERE id = ?", (now, ticket))
+                    if rate_limited:
+                        conn.execute("UPDATE bucket SET tokens = tokens - 1 WHERE id = 1")
+                    return 0
+                if fits:
+                    # Reserve room for the ticket ahead; it is admitted when
+                    # its own process next checks.
+                    running_total += 1
+                    per_user[user] += 1
+                    if space:
+                        per_space[space] += 1
+                    if rate_limited:
+                        tokens -= 1
+            # The ticket was released as abandoned.
+            raise QueueTimeout("The queued request was abandoned")
+
+    def _refill(self, conn: sqlite3.Connection, now: float) -> tuple:
+        tokens, updated, blocked_until = conn.execute("SELECT tokens, updated, blocked_until FROM bucket WHERE id = 1").fetchone()
+        tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate_per_second)
+        conn.execute("UPDATE bucket SET tokens = ?, updated = ? WHERE id = 1", (tokens, now))
+        return tokens, blocked_until
+
+    def _release_abandoned(self, conn: sqlite3.Connection, now: float) -> None:
+        # Tickets of processes that died (e.g. cancelled background jobs) or
+        # that have been held far too long are dropped.
+        for tid, pid, admitted in conn.execute("SELECT id, pid, admitted FROM tickets").fetchall():
+            stale = admitted is not None and now - admitted > GENIE_TICKET_MAX_AGE_SECONDS
+            if stale or (pid != os.getpid() and not pid_alive(pid)):
+                conn.execute("DELETE FROM tickets WHERE id = ?", (tid,))
+                logger.warning(f"Released abandoned scheduler ticket of process {pid}")
+
+    def _record_wait(self, priority: int, seconds: float, timed_out: bool) -> None:
+        with self._transaction() as conn:
+            conn.execute("INSERT INTO waits (priority, seconds, timed_out) VALUES (?, ?, ?)", (priority, seconds, int(timed_out)))
+            conn.execute("DELETE FROM waits WHERE seq <= (SELECT MAX(seq) FROM waits) - ?", (_WAIT_HISTORY,))
+
+    ###
+    # METHOD: throttle
+    #
+    # Stops admitting rate-limited work for `retry_after` seconds (at least
+    # one token interval) and empties the bucket; called on 429 responses.
+    ###
+    def throttle(self, retry_after: float) -> None:
+        pause = max(retry_after, 1.0 / self.rate_per_second if self.rate_per_second else 1.0)
+        with self._transaction() as conn:
+            conn.execute("UPDATE bucket SET tokens = 0, updated = ?, blocked_until = MAX(blocked_until, ?) WHERE id = 1",
+                         (time.time(), time.time() + pause))
+        logger.warning(f"Genie is throttling requests; pausing new questions for {pause:.1f}s")
+
+    ###
+    # METHOD: stats
+    #
+    # Returns queue depth and running work per priority plus wait-time
+    # statistics (seconds) over the recent admissions.
+    ###
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            tickets = conn.execute("SELECT priority, admitted FROM tickets").fetchall()
+            waits = conn.execute("SELECT priority, seconds, timed_out FROM waits").fetchall()
+            tokens, updated, blocked_until = conn.execute("SELECT tokens, updated, blocked_until FROM bucket WHERE id = 1").fetchone()
+        now = time.time()
+        result: Dict[str, Any] = {
+            "queued": {name: 0 for name in PRIORITY_NAMES.values()},
+            "running": {name: 0 for name in PRIORITY_NAMES.values()},
+            "tokens": min(self.burst, tokens + max(0.0, now - updated) * self.rate_per_second),
+            "throttled_for": max(0.0, blocked_until - now),
+        }
+        for priority, admitted in tickets:
+            result["running" if admitted is not None else "queued"][PRIORITY_NAMES.get(priority, str(priority))] += 1
+        result["queue_depth"] = sum(result["queued"].values())
+        seconds: List[float] = [w[1] for w in waits]
+        result["waits"] = len(waits)
+        result["timeouts"] = sum(w[2] for w in waits)
+        result["wait_mean"] = statistics.fmean(seconds) if seconds else 0.0
+        result["wait_p95"] = statistics.quantiles(seconds, n=20, method="inclusive")[-1] if len(seconds) >= 2 else (seconds[0] if seconds else 0.0)
+        result["wait_max"] = max(seconds) if seconds else 0.0
+        return result
@@ -0,0 +1,79 @@
+###
+# GUNICORN CONFIGURATION
+#
+# Production WSGI server for the Dash app (`gunicorn -c gunicorn.conf.py
+# app:server`, see app.yaml). Requests are served by several worker
+# processes, each with a pool of threads: most requests are short (callback
+# updates, background-callback polls every second, grid row blocks), but
+# table downloads stream for as long as the client reads, so a worker needs
+# many threads rather than one per process.
+#
+# Every setting can be overridden with the environment variable named next
+# to it.
+###
+import multiprocessing
+import os
+
+_port = os.environ.get("DATABRICKS_APP_PORT") or os.environ.get("PORT") or "8050"
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{_port}")
+
+# Threads of a gthread worker share one process (and GIL); extra processes
+# add CPU parallelism for callback serialization and pandas work.
+workers = int(os.environ.get("GUNICORN_WORKERS", str(min(max(2, multiprocessing.cpu_count()), 8))))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "16"))
+
+# The app is imported by each worker, not by the master before forking, so
+# its disk caches, SQLite connections, cache-culler thread, thread pools and
+# Dash's background callback manager are all created in the process that
+# uses them. Nothing opened in the master is ever shared with a worker.
+preload_app = False
+
+# Genie questions wait up to GENIE_QUERY_TIMEOUT_SECONDS (300s) in
+# background-callback processes forked from a worker. A worker that is
+# restarted or shut down waits for those processes before it exits, so it is
+# given that long (plus a margin) before being killed. `timeout` is the
+# worker heartbeat; gthread workers keep beating while requests run, so it
+# only catches a stuck worker, and it is kept above the Genie wait in case a
+# blocking worker class is configured.
+_genie_timeout = int(os.environ.get("GENIE_QUERY_TIMEOUT_SECONDS", "300"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", str(_genie_timeout + 30)))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", str(_genie_timeout + 30)))
+
+# Idle connections are kept open longer than the proxy in front of the app
+# keeps them, so the proxy never reuses a connection the server just closed.
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "75"))
+
+# Workers are not replaced after a number of requests unless this is set
+# (with a jitter so they do not all restart at once). A worker also runs work
+# outside any request: full-result exports, spaces-catalog listings and the
+# forkserver of its background callbacks. `graceful_timeout` only waits for
+# requests in flight, so a recycled worker drops that work (an export is then
+# reported as failed). Browsers poll running background callbacks every
+# second, so any limit low enough to matter is reached every few minutes;
+# set one only to contain a memory leak.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+# Heartbeat files on tmpfs, so a slow disk cannot make workers look stuck.
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+###
+# HOOK: post_worker_init
+#
+# Runs in each worker after it imported the app and before it accepts
+# requests: starts the worker's cache culler, loads the modules the app
+# imports lazily, and starts the forkserver that background callbacks are
+# forked from (see app.init_server_process), preloaded with the module
+# gunicorn serves.
+###
+def post_worker_init(worker):
+    import app
+
+    app.init_server_process(forkserver_preload=worker.app.app_uri.split(":")[0])
+    worker.log.info(f"Worker {worker.pid} ready ({threads} threads)")
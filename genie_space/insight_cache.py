@@ -0,0 +1,67 @@
+###
+# IMPORTS AND CONFIGURATION
+#
+# Persistent cache of LLM insights, shared by the web server and the
+# background-callback processes. Entries are keyed by a BLAKE2 hash of the
+# table text sent to the model (the CSV or its profile) together with the
+# prompt and the serving endpoint name, so equal tables hit the cache no
+# matter which result message or worker they come from.
+###
+import hashlib
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from cache_maintenance import ManagedCache
+
+logger = logging.getLogger(__name__)
+
+INSIGHT_CACHE_DIR = os.environ.get("INSIGHT_CACHE_DIR", "./insight_cache")
+INSIGHT_CACHE_TTL_SECONDS = int(os.environ.get("INSIGHT_CACHE_TTL_SECONDS", "86400"))
+INSIGHT_CACHE_SIZE_LIMIT_MB = int(os.environ.get("INSIGHT_CACHE_SIZE_LIMIT_MB", "256"))
+
+
+###
+# FUNCTION: insight_key
+#
+# Hashes the table text, prompt and endpoint into a cache key. Each part is
+# length-prefixed so different splits of the same bytes cannot collide.
+###
+def insight_key(table_text: str, prompt: Optional[str], endpoint: Optional[str]) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    for part in (endpoint or "", prompt or "", table_text):
+        data = part.encode()
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+###
+# InsightCache CLASS
+#
+# A size-bounded, TTL-limited ManagedCache of generated insights that counts
+# hits and misses. Only successful answers should be stored.
+###
+class InsightCache:
+    def __init__(self, directory: str = INSIGHT_CACHE_DIR, ttl_seconds: int = INSIGHT_CACHE_TTL_SECONDS,
+                 size_limit_mb: int = INSIGHT_CACHE_SIZE_LIMIT_MB):
+        self.cache = ManagedCache(directory, default_expire=ttl_seconds, size_limit=size_limit_mb * 2**20)
+
+    def get(self, table_text: str, prompt: Optional[str], endpoint: Optional[str]) -> Optional[str]:
+        insights = self.cache.get(insight_key(table_text, prompt, endpoint))
+        self.cache.record("hits" if insights is not None else "misses")
+        return insights
+
+    def put(self, table_text: str, prompt: Optional[str], endpoint: Optional[str], insights: str) -> None:
+        self.cache.set(insight_key(table_text, prompt, endpoint), insights)
+
+    ###
+    # METHOD: stats
+    #
+    # Returns hits, misses, evictions, hit rate, entry count and bytes on disk.
+    ###
+    def stats(self) -> Dict[str, Any]:
+        result = self.cache.stats()
+        lookups = result["hits"] + result["misses"]
+        result["hit_rate"] = result["hits"] / lookups if lookups else 0.0
+        return result
@@ -0,0 +1,219 @@
+###
+# IMPORTS AND CONFIGURATION
+#
+# LLM insights for result tables. The table and the user's prompt are sent
+# to a Databricks model serving endpoint, either as one blocking request or
+# as a streamed chat completion whose tokens are handed to the caller as
+# they arrive. Time-to-first-token and total time are recorded separately.
+# Requests go through the endpoint's circuit breaker (see resilience.py).
+###
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Iterator, Optional
+
+import requests
+
+from metrics import BYTES_BUCKETS, REGISTRY
+from resilience import ErrorKind, classify_error, databricks_error_type, describe_error, get_resilience
+
+if TYPE_CHECKING:
+    from databricks.sdk import WorkspaceClient
+
+logger = logging.getLogger(__name__)
+
+# Stream insight tokens into the chat as they arrive ("false" waits for the
+# whole answer, as before).
+INSIGHTS_STREAMING = os.environ.get("INSIGHTS_STREAMING", "true").lower() in ("1", "true", "yes")
+INSIGHTS_STREAM_TIMEOUT_SECONDS = float(os.environ.get("INSIGHTS_STREAM_TIMEOUT_SECONDS", "300"))
+
+INSIGHT_SECONDS = REGISTRY.histogram(
+    "insight_request_duration_seconds", "Time to generate insights, by mode (query or stream).", ("mode",))
+INSIGHT_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "insight_time_to_first_token_seconds", "Time until the first insight token arrives.", ("mode",))
+INSIGHT_PROMPT_BYTES = REGISTRY.histogram(
+    "insight_prompt_bytes", "Size of the prompts sent to the insight model.", ("mode",), BYTES_BUCKETS)
+INSIGHT_ERRORS = REGISTRY.counter(
+    "insight_errors", "Failed insight requests by error kind.", ("mode", "kind"))
+INSIGHTS_IN_FLIGHT = REGISTRY.gauge(
+    "insights_in_flight", "Insight requests being generated.", ("mode",))
+
+FORMATTING_INSTRUCTION = "\n\nIMPORTANT: Do not use markdown headers (e.g., '#', '##'). Instead, use bolding for titles (e.g., '**Key Insights**')."
+DEFAULT_PROMPT = (
+    "You are a professional data analyst. Given the following table data, provide deep, actionable analysis for\n"
+    "1. Key insights and trends.\n"
+    "2. Notable patterns\n"
+    "3. Business implications.\n"
+    "Be thorough, professional, and concise."
+)
+
+
+###
+# InsightTiming CLASS
+#
+# Timestamps of one insight request (time.monotonic()), filled in while the
+# answer is generated.
+###
+@dataclass
+class InsightTiming:
+    started: float = 0.0
+    first_token: Optional[float] = None
+    finished: Optional[float] = None
+    characters: int = 0
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        return None if self.first_token is None else self.first_token - self.started
+
+    @property
+    def total_time(self) -> Optional[float]:
+        return None if self.finished is None else self.finished - self.started
+
+
+###
+# FUNCTION: serving_endpoint
+#
+# The circuit-breaker name of the insight model's serving endpoint.
+###
+def serving_endpoint() -> str:
+    return f"serving:{os.getenv('SERVING_ENDPOINT_NAME')}"
+
+
+def insights_circuit_open() -> bool:
+    return get_resilience().breaker(serving_endpoint()).is_open()
+
+
+###
+# FUNCTION: build_insight_prompt
+#
+# Combines the user's (or the default) prompt, the formatting rules and the
+# table data into the message sent to the model.
+###
+def build_insight_prompt(df_csv: str, prompt: Optional[str] = None) -> str:
+    final_prompt = (prompt or DEFAULT_PROMPT) + FORMATTING_INSTRUCTION
+    return f"{final_prompt}\n\nTable data:\n{df_csv}"
+
+
+###
+# FUNCTION: describe_insight_error
+#
+# Turns an error from the serving endpoint into the message shown in the chat.
+###
+def describe_insight_error(error: Exception) -> str:
+    kind = classify_error(error)
+    if isinstance(error, (databricks_error_type(), requests.HTTPError)):
+        logger.error(f"Serving endpoint error generating insights ({kind.value}): {error}")
+        # Attempt to log the raw response body if available in the DatabricksError
+        if getattr(error, 'body', None):
+            logger.error(f"DatabricksError response body: {error.body}")
+    else:
+        logger.error(f"An unexpected error occurred while generating insights ({kind.value}): {str(error)}")
+    if kind == ErrorKind.PERMISSION:
+        return "Error: You do not have permission to access the analysis model. Please contact support."
+    if kind == ErrorKind.UNKNOWN:
+        return f"An unexpected error occurred while generating insights: {str(error)}"
+    if kind == ErrorKind.BAD_REQUEST:
+        return f"Error communicating with the analysis service: {getattr(error, 'message', None) or error}"
+    return describe_error(error, "the analysis service")
+
+
+###
+# FUNCTION: query_insights
+#
+# Sends the prompt to the serving endpoint and returns the complete answer in
+# one blocking call.
+###
+def query_insights(client: "WorkspaceClient", df_csv: str, prompt: Optional[str] = None,
+                   timing: Optional[InsightTiming] = None) -> str:
+    from databricks.sdk.service.serving import ChatMessage, ChatMessageRole
+
+    timing = timing or InsightTiming()
+    timing.started = time.monotonic()
+    content = build_insight_prompt(df_csv, prompt)
+    INSIGHT_PROMPT_BYTES.observe(len(content.encode()), mode="query")
+    try:
+        with INSIGHTS_IN_FLIGHT.track(mode="query"):
+            response = get_resilience().call(
+                serving_endpoint(),
+                client.serving_endpoints.query,
+                os.getenv("SERVING_ENDPOINT_NAME"),
+                messages=[ChatMessage(content=content, role=ChatMessageRole.USER)],
+            )
+    except Exception as e:
+        INSIGHT_ERRORS.inc(mode="query", kind=classify_error(e).value)
+        raise
+    content = response.choices[0].message.content
+    timing.first_token = timing.finished = time.monotonic()
+    timing.characters = len(content or "")
+    INSIGHT_SECONDS.observe(timing.total_time, mode="query")
+    INSIGHT_FIRST_TOKEN_SECONDS.observe(timing.time_to_first_token, mode="query")
+    return content
+
+
+###
+# FUNCTION: stream_insights
+#
+# Requests a streamed chat completion from the serving endpoint and yields the
+# text of each token delta as it arrives. The SDK's `query` only parses
+# complete JSON bodies, so the server-sent events are read over a plain HTTP
+# connection authenticated with the client's own credentials.
+###
+def stream_insights(client: "WorkspaceClient", df_csv: str, prompt: Optional[str] = None,
+                    timing: Optional[InsightTiming] = None) -> Iterator[str]:
+    timing = timing or InsightTiming()
+    timing.started = time.monotonic()
+    url = f"{client.config.host.rstrip('/')}/serving-endpoints/{os.getenv('SERVING_ENDPOINT_NAME')}/invocations"
+    headers = {"Content-Type": "application/json", "Accept": "text/event-stream", **client.config.authenticate()}
+    body = {"messages": [{"role": "user", "content": build_insight_prompt(df_csv, prompt)}], "stream": True}
+    INSIGHT_PROMPT_BYTES.observe(len(body["messages"][0]["content"].encode()), mode="stream")
+
+    def open_stream() -> requests.Response:
+        response = requests.post(url, headers=headers, json=body, stream=True, timeout=INSIGHTS_STREAM_TIMEOUT_SECONDS)
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            response.close()
+            raise
+        return response
+
+    INSIGHTS_IN_FLIGHT.inc(mode="stream")
+    try:
+        # Only opening the stream is retried; nothing has been shown by then.
+        with get_resilience().call(serving_endpoint(), open_stream) as response:
+            # Event streams are UTF-8; requests would otherwise assume ISO-8859-1.
+            response.encoding = "utf-8"
+            # chunk_size=None hands over each chunk as soon as it arrives.
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                text = _delta_text(json.loads(data))
+                if not text:
+                    continue
+                if timing.first_token is None:
+                    timing.first_token = time.monotonic()
+                    INSIGHT_FIRST_TOKEN_SECONDS.observe(timing.time_to_first_token, mode="stream")
+                timing.characters += len(text)
+                yield text
+    except Exception as e:
+        INSIGHT_ERRORS.inc(mode="stream", kind=classify_error(e).value)
+        raise
+    finally:
+        INSIGHTS_IN_FLIGHT.dec(mode="stream")
+    timing.finished = time.monotonic()
+    INSIGHT_SECONDS.observe(timing.total_time, mode="stream")
+
+
+def _delta_text(chunk: dict) -> str:
+    choices = chunk.get("choices") or []
+    if not choices:
+        return ""
+    content: Any = (choices[0].get("delta") or {}).get("content")
+    # Some models send a list of typed content parts instead of a string.
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict) and part.get("type") == "text")
+    return content or ""
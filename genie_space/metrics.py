@@ -0,0 +1,308 @@
+###
+# IMPORTS AND CONFIGURATION
+#
+# Prometheus metrics. Questions are answered in Dash's background-callback
+# processes, which are forked per job and stopped once their result is read,
+# so metrics cannot be kept in process memory. As with the caches' counters,
+# every sample is kept in a ManagedCache that all processes update; the
+# `/metrics` route renders them in the Prometheus text format, together with
+# gauges read from the caches, scheduler and circuit breakers at scrape time.
+# Labels carry space IDs, phases and formats but never user data.
+###
+import atexit
+import bisect
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import diskcache
+
+from cache_maintenance import ManagedCache
+from genie_scheduler import pid_alive
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.environ.get("METRICS_DIR", "./metrics_state")
+
+# Bucket upper bounds (the +Inf bucket is implicit).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(11))  # 1 KiB .. 1 GiB
+ROWS_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+###
+# Family CLASS
+#
+# One metric family as returned by a collector: name, type ("gauge" or
+# "counter"), help text and (labels, value) samples.
+###
+class Family(NamedTuple):
+    name: str
+    kind: str
+    documentation: str
+    samples: List[Tuple[Dict[str, Any], float]]
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, Any]) -> LabelKey:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, "" if labels[name] is None else str(labels[name])) for name in self.labelnames)
+
+
+###
+# Counter CLASS
+#
+# A monotonically increasing count, rendered as `<name>_total`.
+###
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        self.registry._add([(self.name, self._key(labels), "total", amount)])
+
+
+###
+# Histogram CLASS
+#
+# Counts observations per bucket plus their sum and count. Buckets are stored
+# non-cumulatively (one increment per observation) and summed when rendered.
+###
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        self.registry._add([
+            (self.name, key, ("bucket", bisect.bisect_left(self.buckets, value)), 1),
+            (self.name, key, "sum", value),
+            (self.name, key, "count", 1),
+        ])
+
+    ###
+    # METHOD: time
+    #
+    # Observes the time spent in the `with` block, whether or not it raises.
+    ###
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+###
+# Gauge CLASS
+#
+# Work in progress, counted per process so that work of a process that was
+# killed (e.g. a cancelled background callback) is dropped when rendering.
+###
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        # Retried rather than dropped, so increments and decrements pair up.
+        self.registry._add([(self.name, self._key(labels), ("pid", os.getpid()), amount)], retry=True)
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels: Any) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+###
+# MetricsRegistry CLASS
+#
+# Declares metrics, stores their samples in a ManagedCache shared by all
+# processes (opened lazily, on first use) and renders everything, including
+# the families returned by registered collectors, as Prometheus text.
+# Updates never wait long for the cache: when it is busy, the samples are
+# kept in the process and added with its next update (or at exit), and
+# `metrics_store_busy_total` counts how often that happened. Samples still
+# held by a background-callback process when it is stopped are lost.
+###
+class MetricsRegistry:
+    def __init__(self, directory: str = METRICS_DIR):
+        self.directory = directory
+        self._cache: Optional[ManagedCache] = None
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[Any, ...], float] = {}
+        self._pending_lock = threading.Lock()
+        self._busy_logged_at = 0.0
+        self._busy = self.counter("metrics_store_busy", "Metric updates deferred because the metrics store was busy.")
+
+    @property
+    def cache(self) -> ManagedCache:
+        with self._lock:
+            if self._cache is None:
+                self._cache = ManagedCache(self.directory, timeout=0.05, eviction_policy="none")
+            return self._cache
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        self._collectors.append(collector)
+
+    def _register(self, metric: Any) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def _add(self, updates: List[Tuple[str, LabelKey, Any, float]], retry: bool = False) -> None:
+        with self._pending_lock:
+            amounts, self._pending = self._pending, {}
+        for name, key, suffix, amount in updates:
+            amounts[("metric", name, key, suffix)] = amounts.get(("metric", name, key, suffix), 0) + amount
+        try:
+            cache = self.cache
+            with cache.transact(retry=retry):
+                for cache_key, amount in amounts.items():
+                    cache.incr(cache_key, amount, default=0)
+        except diskcache.Timeout:
+            busy_key = ("metric", self._busy.name, (), "total")
+            amounts[busy_key] = amounts.get(busy_key, 0) + 1
+            with self._pending_lock:
+                for cache_key, amount in amounts.items():
+                    self._pending[cache_key] = self._pending.get(cache_key, 0) + amount
+                pending = len(self._pending)
+            if time.monotonic() - self._busy_logged_at >= 60:
+                self._busy_logged_at = time.monotonic()
+                logger.info(f"Metrics store busy; {pending} samples deferred to the next update")
+        except Exception as e:
+            logger.warning(f"Could not record metrics ({len(amounts)} samples lost): {e}")
+
+    ###
+    # METHOD: flush
+    #
+    # Writes the samples deferred while the store was busy, waiting for it.
+    ###
+    def flush(self) -> None:
+        with self._pending_lock:
+            if not self._pending:
+                return
+        self._add([], retry=True)
+
+    ###
+    # METHOD: render
+    #
+    # Returns all metrics in the Prometheus text exposition format, after
+    # writing this process's deferred samples.
+    ###
+    def render(self) -> str:
+        self.flush()
+        samples: Dict[str, Dict[LabelKey, Dict[Any, float]]] = {}
+        dead_pids = set()
+        for key in list(self.cache.iterkeys()):
+            if not (isinstance(key, tuple) and len(key) == 4 and key[0] == "metric"):
+                continue
+            _, name, labels, suffix = key
+            if isinstance(suffix, tuple) and suffix[0] == "pid":
+                if suffix[1] in dead_pids or not pid_alive(suffix[1]):
+                    dead_pids.add(suffix[1])
+                    self.cache.delete(key)
+                    continue
+            value = self.cache.get(key)
+            if value is not None:
+                samples.setdefault(name, {}).setdefault(labels, {})[suffix] = value
+
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines += _header(metric.name, metric.kind, metric.documentation)
+            for labels, values in sorted(samples.get(metric.name, {}).items()):
+                if metric.kind == "counter":
+                    lines.append(_sample(f"{metric.name}_total", labels, values.get("total", 0)))
+                elif metric.kind == "gauge":
+                    lines.append(_sample(metric.name, labels, sum(values.values())))
+                else:
+                    cumulative = 0.0
+                    for index, bound in enumerate(metric.buckets + (math.inf,)):
+                        cumulative += values.get(("bucket", index), 0)
+                        lines.append(_sample(f"{metric.name}_bucket", labels + (("le", _format(bound)),), cumulative))
+                    lines.append(_sample(f"{metric.name}_sum", labels, values.get("sum", 0)))
+                    lines.append(_sample(f"{metric.name}_count", labels, values.get("count", 0)))
+
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+                continue
+            for family in families:
+                lines += _header(family.name, family.kind, family.documentation)
+                suffix = "_total" if family.kind == "counter" else ""
+                for labels, value in family.samples:
+                    lines.append(_sample(f"{family.name}{suffix}", tuple((k, str(v)) for k, v in labels.items()), value))
+        return "\n".join(lines) + "\n"
+
+
+def _header(name: str, kind: str, documentation: str) -> List[str]:
+    return [f"# HELP {name} {documentation.replace(chr(92), chr(92) * 2)}", f"# TYPE {name} {kind}"]
+
+
+def _sample(name: str, labels: LabelKey, value: float) -> str:
+    if not labels:
+        return f"{name} {_format(value)}"
+    escaped = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return f"{name}{{{escaped}}} {_format(value)}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# The registry every module declares its metrics in.
+REGISTRY = MetricsRegistry()
+atexit.register(REGISTRY.flush)
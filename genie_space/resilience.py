@@ -0,0 +1,468 @@
+###
+# IMPORTS AND CONFIGURATION
+#
+# Shared resilience layer for calls to Genie and the model serving endpoint:
+# typed error classification, a circuit breaker per backend endpoint and a
+# global retry budget. Breaker and budget state live in a ManagedCache so the
+# web server and every background-callback process see the same state; when
+# a backend is failing, all of them fail fast instead of each holding a
+# worker through its own retries.
+###
+import asyncio
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import Executor
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import requests
+
+from cache_maintenance import ManagedCache
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RESILIENCE_STATE_DIR = os.environ.get("RESILIENCE_STATE_DIR", "./resilience_state")
+
+# The SDK retries transient errors on its own for this long (it defaults to
+# 300 seconds); anything longer is left to the retry budget below.
+SDK_RETRY_TIMEOUT_SECONDS = int(os.environ.get("SDK_RETRY_TIMEOUT_SECONDS", "5"))
+
+# A breaker opens after this many consecutive transient failures, fails fast
+# while open, and lets one probe call through after the reset timeout.
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", "30"))
+
+# Retries of idempotent calls: at most this many per call, and overall no
+# more than RETRY_BUDGET_RATIO retries per call made plus
+# RETRY_BUDGET_MIN_PER_SECOND, so retries cannot multiply the load on a
+# struggling backend.
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "2"))
+RETRY_BUDGET_RATIO = float(os.environ.get("RETRY_BUDGET_RATIO", "0.1"))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.environ.get("RETRY_BUDGET_MIN_PER_SECOND", "0.5"))
+RETRY_BUDGET_MAX_TOKENS = float(os.environ.get("RETRY_BUDGET_MAX_TOKENS", "20"))
+# Deposits are added up in each process and written to the shared bucket at
+# most this often, so successful calls do not queue on its write lock.
+RETRY_BUDGET_FLUSH_SECONDS = float(os.environ.get("RETRY_BUDGET_FLUSH_SECONDS", "1"))
+RETRY_BACKOFF_SECONDS = 0.5
+RETRY_BACKOFF_MAX_SECONDS = 4.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+BREAKER_STATES = (CLOSED, OPEN, HALF_OPEN)
+
+
+###
+# ErrorKind CLASS
+#
+# What went wrong with a backend call, independent of the message text.
+###
+class ErrorKind(str, Enum):
+    AUTH_EXPIRED = "auth_expired"
+    PERMISSION = "permission"
+    NOT_FOUND = "not_found"
+    BAD_REQUEST = "bad_request"
+    THROTTLED = "throttled"
+    UNAVAILABLE = "unavailable"
+    TIMEOUT = "timeout"
+    CIRCUIT_OPEN = "circuit_open"
+    UNKNOWN = "unknown"
+
+
+# Failures that say something about the backend's health: they count
+# against the breaker and (for idempotent calls) are retried.
+TRANSIENT_KINDS = frozenset({ErrorKind.UNAVAILABLE, ErrorKind.TIMEOUT})
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} is unavailable; retrying in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+###
+# FUNCTION: databricks_error_type
+#
+# Returns the SDK's DatabricksError class, or an empty tuple (which matches
+# nothing in `except` and `isinstance`) if the SDK has not been imported.
+# The SDK is slow to import and is loaded lazily, and an SDK error cannot
+# exist before it is, so checking for one never imports it.
+###
+def databricks_error_type() -> Any:
+    errors = sys.modules.get("databricks.sdk.errors")
+    return errors.DatabricksError if errors is not None else ()
+
+
+###
+# FUNCTION: unwrap_error
+#
+# The SDK gives up on a retried call by raising a TimeoutError (or, after
+# too many attempts, a RuntimeError) from the last error it got; returns
+# that error, or `error` itself if it is not wrapped.
+###
+def unwrap_error(error: BaseException) -> BaseException:
+    if isinstance(error, (TimeoutError, RuntimeError)) and isinstance(error.__cause__, (databricks_error_type(), requests.RequestException)):
+        return unwrap_error(error.__cause__)
+    return error
+
+
+###
+# FUNCTION: classify_error
+#
+# Maps an exception from the SDK, requests or the breaker to an ErrorKind.
+# Errors the SDK wrapped after exhausting its retries are classified by the
+# error they wrap.
+###
+def classify_error(error: BaseException) -> ErrorKind:
+    if isinstance(error, CircuitOpenError):
+        return ErrorKind.CIRCUIT_OPEN
+    error = unwrap_error(error)
+    errors = sys.modules.get("databricks.sdk.errors")
+    if errors is not None:
+        if isinstance(error, (errors.Unauthenticated, errors.PermissionDenied)):
+            return ErrorKind.AUTH_EXPIRED if "expired" in str(error).lower() else ErrorKind.PERMISSION
+        if isinstance(error, errors.NotFound):
+            return ErrorKind.NOT_FOUND
+        if isinstance(error, errors.TooManyRequests):
+            return ErrorKind.THROTTLED
+        # The SDK sets a Retry-After on 503s too, so these come before the
+        # generic check below.
+        if isinstance(error, (errors.TemporarilyUnavailable, errors.InternalError)):
+            return ErrorKind.UNAVAILABLE
+        if isinstance(error, errors.BadRequest):
+            return ErrorKind.BAD_REQUEST
+        if isinstance(error, errors.DeadlineExceeded):
+            return ErrorKind.TIMEOUT
+    if getattr(error, "retry_after_secs", None):
+        return ErrorKind.THROTTLED
+    if isinstance(error, (requests.Timeout, TimeoutError, asyncio.TimeoutError)):
+        return ErrorKind.TIMEOUT
+    if isinstance(error, requests.ConnectionError):
+        return ErrorKind.UNAVAILABLE
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        if status == 401:
+            return ErrorKind.AUTH_EXPIRED
+        if status == 403:
+            return ErrorKind.PERMISSION
+        if status == 404:
+            return ErrorKind.NOT_FOUND
+        if status == 429:
+            return ErrorKind.THROTTLED
+        if status >= 500:
+            return ErrorKind.UNAVAILABLE
+        return ErrorKind.BAD_REQUEST
+    return ErrorKind.UNKNOWN
+
+
+###
+# FUNCTION: is_throttled
+#
+# Whether `error` is a 429, also when the SDK wrapped it after exhausting
+# its retries, and the Retry-After it carried (0 if none).
+###
+def is_throttled(error: BaseException) -> bool:
+    return classify_error(error) == ErrorKind.THROTTLED
+
+
+def retry_after(error: BaseException) -> float:
+    return float(getattr(unwrap_error(error), "retry_after_secs", None) or 0)
+
+
+###
+# CircuitBreaker CLASS
+#
+# Closed: calls pass and consecutive transient failures are counted.
+# Open: calls fail fast with CircuitOpenError until the reset timeout.
+# Half-open: one probe call passes (the others still fail fast); its success
+# closes the breaker, its failure opens it again.
+# State is stored as {"state", "failures", "opened_at"} under the breaker's
+# name; every transition is counted as "<name>:<from>-><to>".
+###
+class CircuitBreaker:
+    def __init__(self, name: str, store: ManagedCache, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.store = store
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._key = f"breaker:{name}"
+
+    def _state(self) -> Dict[str, Any]:
+        return self.store.get(self._key) or {"state": CLOSED, "failures": 0, "opened_at": 0.0}
+
+    @property
+    def state(self) -> str:
+        state = self._state()
+        if state["state"] == OPEN and time.time() - state["opened_at"] >= self.reset_seconds:
+            return HALF_OPEN
+        return state["state"]
+
+    def is_open(self) -> bool:
+        return self.state == OPEN
+
+    ###
+    # METHOD: allow
+    #
+    # Raises CircuitOpenError unless a call may go through now.
+    ###
+    def allow(self) -> None:
+        state = self._state()
+        if state["state"] == CLOSED:
+            return
+        retry_in = state["opened_at"] + self.reset_seconds - time.time()
+        # Only one process gets to probe per reset period.
+        if retry_in <= 0 and self.store.add(f"{self._key}:probe", True, expire=self.reset_seconds):
+            if state["state"] != HALF_OPEN:
+                self._transition(state["state"], HALF_OPEN)
+            return
+        self.store.record(f"{self.name}:rejected")
+        raise CircuitOpenError(self.name, max(retry_in, 0.0))
+
+    def record_success(self) -> None:
+        # Reads are cheap; only write when there is something to reset.
+        state = self._state()
+        if state["state"] != CLOSED or state["failures"]:
+            with self.store.transact(retry=True):
+                previous = self._state()["state"]
+                self.store.set(self._key, {"state": CLOSED, "failures": 0, "opened_at": 0.0}, expire=None)
+                self.store.delete(f"{self._key}:probe")
+            if previous != CLOSED:
+                self._count_transition(previous, CLOSED)
+
+    def record_failure(self, kind: ErrorKind) -> None:
+        if kind not in TRANSIENT_KINDS:
+            return
+        with self.store.transact(retry=True):
+            state = self._state()
+            failures = state["failures"] + 1
+            opens = state["state"] != CLOSED or failures >= self.failure_threshold
+            self.store.set(self._key, {"state": OPEN if opens else CLOSED, "failures": failures,
+                                       "opened_at": time.time() if opens else 0.0}, expire=None)
+            self.store.delete(f"{self._key}:probe")
+        if opens:
+            self._count_transition(state["state"], OPEN)
+
+    def _transition(self, previous: str, state: str) -> None:
+        with self.store.transact(retry=True):
+            current = self._state()
+            current["state"] = state
+            self.store.set(self._key, current, expire=None)
+        self._count_transition(previous, state)
+
+    def _count_transition(self, previous: str, state: str) -> None:
+        self.store.record(f"{self.name}:{previous}->{state}")
+        log = logger.warning if state == OPEN else logger.info
+        log(f"Circuit breaker {self.name}: {previous} -> {state}")
+
+    def stats(self) -> Dict[str, Any]:
+        transitions = [f"{self.name}:{a}->{b}" for a in BREAKER_STATES for b in BREAKER_STATES if a != b]
+        counters = self.store.stats(transitions + [f"{self.name}:rejected"])
+        return {
+            "state": self.state,
+            "consecutive_failures": self._state()["failures"],
+            "rejected": counters[f"{self.name}:rejected"],
+            "transitions": {name.split(":", 1)[1]: counters[name] for name in transitions if counters[name]},
+        }
+
+
+###
+# RetryBudget CLASS
+#
+# A token bucket shared by all processes. Every call deposits
+# RETRY_BUDGET_RATIO tokens, the bucket also refills at a minimum rate, and
+# every retry takes one token; retries are skipped when the bucket is empty.
+# A process keeps its deposits in memory and adds them to the bucket every
+# RETRY_BUDGET_FLUSH_SECONDS or with its next retry, whichever comes first;
+# deposits a process had not flushed when it exited are lost, which only
+# makes the budget stricter.
+###
+class RetryBudget:
+    def __init__(self, store: ManagedCache, ratio: float = RETRY_BUDGET_RATIO,
+                 min_per_second: float = RETRY_BUDGET_MIN_PER_SECOND, max_tokens: float = RETRY_BUDGET_MAX_TOKENS):
+        self.store = store
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._pending = 0.0
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take_pending(self) -> float:
+        with self._lock:
+            pending, self._pending = self._pending, 0.0
+            self._flushed_at = time.monotonic()
+        return pending
+
+    def _update(self, deposit: float, spend: float = 0.0) -> bool:
+        with self.store.transact(retry=True):
+            now = time.time()
+            tokens, updated = self.store.get("retry_budget", (self.max_tokens, now))
+            tokens = min(self.max_tokens, tokens + (now - updated) * self.min_per_second + deposit)
+            allowed = tokens >= spend
+            if allowed:
+                tokens -= spend
+            self.store.set("retry_budget", (tokens, now), expire=None)
+        return allowed
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._pending += self.ratio
+            if time.monotonic() - self._flushed_at < RETRY_BUDGET_FLUSH_SECONDS:
+                return
+        self._update(self._take_pending())
+
+    def try_spend(self) -> bool:
+        allowed = self._update(self._take_pending(), spend=1.0)
+        self.store.record("retries" if allowed else "retries_denied")
+        return allowed
+
+    def stats(self) -> Dict[str, Any]:
+        tokens, updated = self.store.get("retry_budget", (self.max_tokens, time.time()))
+        counters = self.store.stats(("retries", "retries_denied"))
+        return {
+            "tokens": min(self.max_tokens, tokens + (time.time() - updated) * self.min_per_second),
+            "retries": counters["retries"],
+            "retries_denied": counters["retries_denied"],
+        }
+
+
+###
+# Resilience CLASS
+#
+# Runs backend calls through the breaker of their endpoint and the retry
+# budget. `call` is for blocking functions, `call_async` for coroutines;
+# the latter reads and updates the shared store on `executor` (the loop's
+# default one if None), so the event loop never waits on it. Only idempotent
+# calls are retried, and only on transient errors.
+###
+class Resilience:
+    def __init__(self, directory: str = RESILIENCE_STATE_DIR, max_attempts: int = RETRY_MAX_ATTEMPTS):
+        self.store = ManagedCache(directory, eviction_policy="none")
+        self.budget = RetryBudget(self.store)
+        self.max_attempts = max_attempts
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(name, self.store)
+            return self._breakers[name]
+
+    def call(self, name: str, fn: Callable[..., T], *args: Any, idempotent: bool = True, **kwargs: Any) -> T:
+        attempt = 0
+        while True:
+            delay = None
+            try:
+                self._before(name)
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._after_failure(name, e, attempt, idempotent)
+                if delay is None:
+                    raise
+            if delay is None:
+                self.breaker(name).record_success()
+                return result
+            attempt += 1
+            time.sleep(delay)
+
+    async def call_async(self, name: str, fn: Callable[[], Awaitable[T]], idempotent: bool = True,
+                         executor: Optional[Executor] = None) -> T:
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            delay = None
+            try:
+                await loop.run_in_executor(executor, self._before, name)
+                result = await fn()
+            except Exception as e:
+                delay = await loop.run_in_executor(executor, self._after_failure, name, e, attempt, idempotent)
+                if delay is None:
+                    raise
+            if delay is None:
+                await loop.run_in_executor(executor, self.breaker(name).record_success)
+                return result
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _before(self, name: str) -> None:
+        self.breaker(name).allow()
+        self.budget.deposit()
+
+    def _after_failure(self, name: str, error: Exception, attempt: int, idempotent: bool) -> Optional[float]:
+        # Returns the backoff before the next attempt, or None to give up.
+        if isinstance(error, CircuitOpenError):
+            return None
+        kind = classify_error(error)
+        self.store.record(f"{name}:error:{kind.value}")
+        # Client errors still show the backend is answering.
+        if kind in TRANSIENT_KINDS:
+            self.breaker(name).record_failure(kind)
+        elif kind != ErrorKind.THROTTLED:
+            self.breaker(name).record_success()
+        if not idempotent or kind not in TRANSIENT_KINDS or attempt >= self.max_attempts or self.breaker(name).is_open():
+            return None
+        if not self.budget.try_spend():
+            logger.info(f"Retry budget exhausted; not retrying {name} after {kind.value} error")
+            return None
+        backoff = min(RETRY_BACKOFF_MAX_SECONDS, RETRY_BACKOFF_SECONDS * 2 ** attempt)
+        logger.info(f"Retrying {name} after {kind.value} error (attempt {attempt + 1})")
+        return backoff * (0.5 + random.random() / 2)
+
+    ###
+    # METHOD: stats
+    #
+    # Returns every known breaker's state and counters plus the retry budget.
+    ###
+    def stats(self) -> Dict[str, Any]:
+        names = {key.split(":", 1)[1] for key in self.store.iterkeys() if isinstance(key, str)
+                 and key.startswith("breaker:") and not key.endswith(":probe")}
+        return {
+            "breakers": {name: self.breaker(name).stats() for name in sorted(names | set(self._breakers))},
+            "retry_budget": self.budget.stats(),
+        }
+
+
+_resilience: Optional[Resilience] = None
+_resilience_lock = threading.Lock()
+
+
+###
+# FUNCTION: get_resilience
+#
+# Returns the process-wide Resilience instance, creating it on first use.
+###
+def get_resilience() -> Resilience:
+    global _resilience
+    with _resilience_lock:
+        if _resilience is None:
+            _resilience = Resilience()
+        return _resilience
+
+
+###
+# FUNCTION: describe_error
+#
+# The chat message shown for a failed call to `service` (e.g. "Genie").
+###
+def describe_error(error: BaseException, service: str = "the service") -> str:
+    kind = classify_error(error)
+    if kind == ErrorKind.AUTH_EXPIRED:
+        return "Sorry, your authentication token has expired. Please refresh the page and try again."
+    if kind == ErrorKind.PERMISSION:
+        return f"Sorry, you do not have permission to use {service}. Please contact support."
+    if kind == ErrorKind.THROTTLED:
+        return "Sorry, the system is currently experiencing high demand. Please try again in a few moments."
+    if kind == ErrorKind.CIRCUIT_OPEN:
+        return f"Sorry, {service} is temporarily unavailable. Please try again in about {max(error.retry_in, 5):.0f} seconds."
+    if kind in TRANSIENT_KINDS:
+        return f"Sorry, {service} is not responding right now. Please try again in a few moments."
+    return f"Sorry, an error occurred: {str(error)}. Please try again."
@@ -0,0 +1,226 @@
+###
+# IMPORTS AND CONFIGURATION
+#
+# Server-side row model for result tables. The browser only ever receives
+# the block of rows the grid is currently displaying; sorting and filtering
+# run here, in pandas, against the DataFrame kept in the table store.
+###
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per grid request, and how much memory (per process) the row
+# model may keep for tables being scrolled and the row order of their
+# sorted/filtered views, so scrolling does not re-read or re-sort a table.
+GRID_BLOCK_SIZE = 100
+ROW_MODEL_CACHE_MB = int(os.environ.get("ROW_MODEL_CACHE_MB", "256"))
+
+
+###
+# FUNCTION: column_defs
+#
+# Builds AG Grid column definitions for a DataFrame, choosing the filter
+# type from the column dtype. Tooltips read the hovered cell's own value,
+# so nothing is generated for them up front.
+###
+def column_defs(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    defs = []
+    for col in df.columns:
+        if pd.api.types.is_bool_dtype(df[col]):
+            column_filter = "agTextColumnFilter"
+        elif pd.api.types.is_numeric_dtype(df[col]):
+            column_filter = "agNumberColumnFilter"
+        elif pd.api.types.is_datetime64_any_dtype(df[col]):
+            column_filter = "agDateColumnFilter"
+        else:
+            column_filter = "agTextColumnFilter"
+        defs.append({"field": str(col), "headerName": str(col), "filter": column_filter, "tooltipField": str(col)})
+    return defs
+
+
+###
+# FILTER MODEL
+#
+# Translates an AG Grid filter model into a boolean mask. Both simple
+# conditions and combined ones ({"operator": "AND"|"OR", "conditions": [...]})
+# are supported for text, number and date filters.
+###
+def _text_mask(series: pd.Series, condition: Dict[str, Any]) -> pd.Series:
+    op = condition.get("type", "contains")
+    text = series.astype("string").str.lower()
+    value = str(condition.get("filter", "")).lower()
+    ops: Dict[str, Callable[[], pd.Series]] = {
+        "contains": lambda: text.str.contains(value, regex=False),
+        "notContains": lambda: ~text.str.contains(value, regex=False),
+        "equals": lambda: text == value,
+        "notEqual": lambda: text != value,
+        "startsWith": lambda: text.str.startswith(value),
+        "endsWith": lambda: text.str.endswith(value),
+    }
+    return ops.get(op, ops["contains"])()
+
+
+def _range_mask(series: pd.Series, op: str, low: Any, high: Any) -> pd.Series:
+    ops: Dict[str, Callable[[], pd.Series]] = {
+        "equals": lambda: series == low,
+        "notEqual": lambda: series != low,
+        "lessThan": lambda: series < low,
+        "lessThanOrEqual": lambda: series <= low,
+        "greaterThan": lambda: series > low,
+        "greaterThanOrEqual": lambda: series >= low,
+        "inRange": lambda: (series >= low) & (series <= high),
+    }
+    if op not in ops:
+        raise ValueError(f"Unsupported filter type: {op}")
+    return ops[op]()
+
+
+def _condition_mask(series: pd.Series, condition: Dict[str, Any]) -> pd.Series:
+    if "conditions" in condition:
+        masks = [_condition_mask(series, c) for c in condition["conditions"]]
+        combined = masks[0]
+        for mask in masks[1:]:
+            combined = (combined | mask) if condition.get("operator") == "OR" else (combined & mask)
+        return combined
+
+    op = condition.get("type")
+    if op == "blank":
+        return series.isna() | (series.astype("string") == "")
+    if op == "notBlank":
+        return series.notna() & (series.astype("string") != "")
+
+    filter_type = condition.get("filterType", "text")
+    if filter_type == "number":
+        return _range_mask(series, op, condition.get("filter"), condition.get("filterTo"))
+    if filter_type == "date":
+        low = pd.Timestamp(condition.get("dateFrom")) if condition.get("dateFrom") else None
+        high = pd.Timestamp(condition.get("dateTo")) if condition.get("dateTo") else None
+        if op in ("equals", "notEqual"):
+            days = series.dt.normalize()
+            return (days == low) if op == "equals" else (days != low)
+        return _range_mask(series, op, low, high)
+    return _text_mask(series, condition)
+
+
+def apply_filter_model(df: pd.DataFrame, filter_model: Optional[Dict[str, Any]]) -> pd.DataFrame:
+    if not filter_model:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for col, condition in filter_model.items():
+        if col in df.columns:
+            mask &= _condition_mask(df[col], condition).fillna(False).astype(bool)
+    return df[mask]
+
+
+###
+# FUNCTION: apply_sort_model
+#
+# Sorts by the columns of an AG Grid sort model, in order.
+###
+def apply_sort_model(df: pd.DataFrame, sort_model: Optional[List[Dict[str, Any]]]) -> pd.DataFrame:
+    sort_model = [s for s in (sort_model or []) if s.get("colId") in df.columns]
+    if not sort_model:
+        return df
+    return df.sort_values(
+        by=[s["colId"] for s in sort_model],
+        ascending=[s.get("sort") != "desc" for s in sort_model],
+        kind="stable",
+        na_position="last"
+    )
+
+
+###
+# RowModel CLASS
+#
+# Serves AG Grid infinite-row-model requests for tables in a TableStore.
+# Each table is read from the store once and shared by all of its views; a
+# sorted or filtered view is kept only as the positions of its rows in that
+# table, so consecutive scroll requests over the same view only take rows.
+# Both are kept in one LRU cache bounded by bytes; the entry just added is
+# always kept, so a table larger than the whole cache can still be scrolled.
+###
+class RowModel:
+    def __init__(self, table_store: Any, cache_bytes: int = ROW_MODEL_CACHE_MB * 2**20):
+        self.table_store = table_store
+        self.cache_bytes = cache_bytes
+        self._cache: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._cache_used = 0
+        self._lock = threading.Lock()
+
+    ###
+    # METHOD: get_rows
+    #
+    # Answers a `getRowsRequest` with the requested block of rows and the
+    # total row count of the current view. Returns None if the table is no
+    # longer in the store.
+    ###
+    def get_rows(self, table_uuid: str, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        df = self._get_table(table_uuid)
+        if df is None:
+            return None
+        positions = self._get_positions(table_uuid, df, request.get("sortModel"), request.get("filterModel"))
+        start = int(request.get("startRow", 0))
+        end = int(request.get("endRow", start + GRID_BLOCK_SIZE))
+        if positions is None:
+            return {"rowData": df.iloc[start:end].to_dict("records"), "rowCount": len(df)}
+        return {"rowData": df.iloc[positions[start:end]].to_dict("records"), "rowCount": len(positions)}
+
+    def _get_table(self, table_uuid: str) -> Optional[pd.DataFrame]:
+        key = ("table", table_uuid)
+        df = self._cached(key)
+        if df is not None:
+            return df
+        table = self.table_store.get_arrow(table_uuid)
+        if table is None:
+            return None
+        # Stored tables have a RangeIndex, so row labels are positions.
+        df = table.to_pandas()
+        self._store(key, df, table.nbytes)
+        return df
+
+    ###
+    # METHOD: _get_positions
+    #
+    # Returns the positions, in table order, of the rows of the sorted and
+    # filtered view, or None if the view is the table as stored.
+    ###
+    def _get_positions(self, table_uuid: str, df: pd.DataFrame, sort_model: Any, filter_model: Any) -> Optional[np.ndarray]:
+        if not sort_model and not filter_model:
+            return None
+        key = (table_uuid, json.dumps(sort_model or [], sort_keys=True), json.dumps(filter_model or {}, sort_keys=True))
+        positions = self._cached(key)
+        if positions is not None:
+            return positions
+
+        try:
+            view = apply_sort_model(apply_filter_model(df, filter_model), sort_model)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Ignoring unsupported grid filter for table {table_uuid}: {e}")
+            view = apply_sort_model(df, sort_model)
+        positions = view.index.to_numpy(dtype=np.intp)
+        self._store(key, positions, positions.nbytes)
+        return positions
+
+    def _cached(self, key: Hashable) -> Any:
+        with self._lock:
+            if key not in self._cache:
+                return None
+            self._cache.move_to_end(key)
+            return self._cache[key][0]
+
+    def _store(self, key: Hashable, value: Any, nbytes: int) -> None:
+        with self._lock:
+            if key in self._cache:
+                self._cache_used -= self._cache.pop(key)[1]
+            self._cache[key] = (value, nbytes)
+            self._cache_used += nbytes
+            while self._cache_used > self.cache_bytes and len(self._cache) > 1:
+                self._cache_used -= self._cache.popitem(last=False)[1][1]
@@ -0,0 +1,195 @@
+###
+# IMPORTS AND CONFIGURATION
+#
+# Per-user catalog of Genie spaces. The agent-selection screen is served the
+# first page of the catalog straight away; the remaining pages are listed in
+# the background and the dropdown searches the full catalog server-side, so
+# only matching spaces are ever sent to the browser. Catalogs are cached per
+# permission scope with a TTL and refreshed in the background once stale.
+###
+import heapq
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from cache_maintenance import ManagedCache
+
+logger = logging.getLogger(__name__)
+
+SPACES_CACHE_DIR = os.environ.get("SPACES_CACHE_DIR", "./spaces_cache")
+# Catalogs are fresh for the TTL and served (while being refreshed) until
+# TTL + STALE seconds after they were listed.
+SPACES_CACHE_TTL_SECONDS = int(os.environ.get("SPACES_CACHE_TTL_SECONDS", "300"))
+SPACES_CACHE_STALE_SECONDS = int(os.environ.get("SPACES_CACHE_STALE_SECONDS", "86400"))
+# Spaces listed before the selection screen renders, and per later page.
+SPACES_FIRST_PAGE_SIZE = int(os.environ.get("SPACES_FIRST_PAGE_SIZE", "100"))
+SPACES_PAGE_SIZE = int(os.environ.get("SPACES_PAGE_SIZE", "1000"))
+SPACES_SEARCH_LIMIT = int(os.environ.get("SPACES_SEARCH_LIMIT", "50"))
+SPACES_REFRESH_WORKERS = int(os.environ.get("SPACES_REFRESH_WORKERS", "4"))
+# A listing that has not finished after this long no longer blocks a new one.
+SPACES_LOAD_LOCK_SECONDS = 300
+
+
+def _compact(space: Dict[str, Any]) -> Dict[str, Any]:
+    return {"space_id": space.get("space_id", ""), "title": space.get("title", ""), "description": space.get("description")}
+
+
+def _sort_key(space: Dict[str, Any]) -> str:
+    return (space.get("title") or "").casefold()
+
+
+def _sorted(spaces: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return sorted(spaces, key=_sort_key)
+
+
+###
+# SpacesCatalog CLASS
+#
+# Keeps each scope's catalog as {"spaces", "complete", "fetched_at"} in a
+# ManagedCache shared by all processes. `client` arguments are GenieClients
+# (anything with `list_spaces_page`). Background listing runs on a thread
+# pool, so it must be started from the long-lived server process.
+###
+class SpacesCatalog:
+    def __init__(self, directory: str = SPACES_CACHE_DIR, ttl_seconds: int = SPACES_CACHE_TTL_SECONDS,
+                 stale_seconds: int = SPACES_CACHE_STALE_SECONDS, first_page_size: int = SPACES_FIRST_PAGE_SIZE,
+                 page_size: int = SPACES_PAGE_SIZE):
+        self.cache = ManagedCache(directory, default_expire=ttl_seconds + stale_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.first_page_size = first_page_size
+        self.page_size = page_size
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    ###
+    # METHOD: first_page
+    #
+    # Returns the spaces to show before the user searches. A cached catalog is
+    # used when there is one (and refreshed in the background once stale);
+    # otherwise only the first page is listed now and the rest is loaded in
+    # the background.
+    ###
+    def first_page(self, scope: str, client: Any) -> List[Dict[str, Any]]:
+        entry = self.cache.get(scope)
+        if entry is not None:
+            self.cache.record("hits")
+            if time.time() - entry["fetched_at"] > self.ttl_seconds:
+                self._submit(scope, self._reload, client)
+            elif not entry["complete"]:
+                self._submit(scope, self._load_rest, client, entry.get("next_page_token"))
+            return entry["spaces"][:self.first_page_size]
+
+        self.cache.record("misses")
+        spaces, next_page_token = client.list_spaces_page(page_size=self.first_page_size)
+        spaces = _sorted([_compact(s) for s in spaces])
+        self._store(scope, spaces, next_page_token)
+        if next_page_token:
+            self._submit(scope, self._load_rest, client, next_page_token)
+        return spaces
+
+    ###
+    # METHOD: search
+    #
+    # Returns up to `limit` spaces matching `query`, best matches first:
+    # title prefix, then title word prefix, then anywhere in the title, then
+    # in the description.
+    ###
+    def search(self, scope: str, query: str, limit: int = SPACES_SEARCH_LIMIT) -> List[Dict[str, Any]]:
+        entry = self.cache.get(scope)
+        if entry is None:
+            return []
+        needle = (query or "").casefold().strip()
+        if not needle:
+            return entry["spaces"][:limit]
+
+        ranked = []
+        for space in entry["spaces"]:
+            title = (space.get("title") or "").casefold()
+            if title.startswith(needle):
+                rank = 0
+            elif any(word.startswith(needle) for word in title.split()):
+                rank = 1
+            elif needle in title:
+                rank = 2
+            elif needle in (space.get("description") or "").casefold():
+                rank = 3
+            else:
+                continue
+            ranked.append((rank, title, space))
+        ranked.sort(key=lambda item: (item[0], item[1]))
+        return [space for _, _, space in ranked[:limit]]
+
+    ###
+    # METHOD: get_space
+    #
+    # Returns one space of the scope's catalog, or None if it is not listed.
+    ###
+    def get_space(self, scope: str, space_id: str) -> Optional[Dict[str, Any]]:
+        entry = self.cache.get(scope)
+        if entry is None:
+            return None
+        return next((s for s in entry["spaces"] if s["space_id"] == space_id), None)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
+
+    def _store(self, scope: str, spaces: List[Dict[str, Any]], next_page_token: Optional[str],
+               fetched_at: Optional[float] = None) -> None:
+        self.cache.set(scope, {
+            "spaces": spaces,
+            "complete": next_page_token is None,
+            "next_page_token": next_page_token,
+            "fetched_at": fetched_at or time.time(),
+        })
+
+    def _submit(self, scope: str, fn, *args) -> None:
+        # One listing per scope at a time, across all processes.
+        lock_key = f"__loading__:{scope}"
+        if not self.cache.meta.add(lock_key, True, expire=SPACES_LOAD_LOCK_SECONDS):
+            return
+        self._get_executor().submit(self._run_locked, lock_key, fn, scope, *args)
+
+    def _run_locked(self, lock_key: str, fn, *args) -> None:
+        try:
+            fn(*args)
+        except Exception as e:
+            logger.error(f"Listing Genie spaces failed: {e}")
+        finally:
+            self.cache.meta.delete(lock_key)
+
+    def _load_rest(self, scope: str, client: Any, page_token: Optional[str]) -> None:
+        # Merges the remaining pages into the cached first page, storing after
+        # each one so searches see them as soon as they arrive.
+        entry = self.cache.get(scope)
+        if entry is None or entry["complete"]:
+            return
+        spaces, fetched_at = entry["spaces"], entry["fetched_at"]
+        start = time.monotonic()
+        while page_token:
+            page, page_token = client.list_spaces_page(page_size=self.page_size, page_token=page_token)
+            spaces = list(heapq.merge(spaces, _sorted([_compact(s) for s in page]), key=_sort_key))
+            self._store(scope, spaces, page_token, fetched_at)
+        logger.info(f"Listed {len(spaces)} Genie spaces in the background in {time.monotonic() - start:.1f}s")
+
+    def _reload(self, scope: str, client: Any) -> None:
+        # Lists the whole catalog again; the stale one is served until done.
+        start = time.monotonic()
+        spaces, page_token = [], None
+        while True:
+            page, page_token = client.list_spaces_page(page_size=self.page_size, page_token=page_token)
+            spaces.extend(_compact(s) for s in page)
+            if not page_token:
+                break
+        self._store(scope, _sorted(spaces), None)
+        logger.info(f"Refreshed catalog of {len(spaces)} Genie spaces in {time.monotonic() - start:.1f}s")
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=SPACES_REFRESH_WORKERS, thread_name_prefix="spaces-catalog")
+                self._executor_pid = os.getpid()
+            return self._executor
@@ -0,0 +1,239 @@
+###
+# IMPORTS AND CONFIGURATION
+#
+# Downloads of stored result tables as CSV, gzip-compressed CSV, Parquet or
+# Excel. Tables are read from the table store one record batch at a time and
+# written straight into the response, so memory use stays flat however large
+# the table is. While a download streams, the file is also written to a
+# bounded export cache; later downloads (and HTTP range requests, which need
+# the complete file) are served from there.
+###
+import gzip
+import io
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from cache_maintenance import ManagedCache
+from metrics import BYTES_BUCKETS, REGISTRY
+from table_store import TableStore
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CACHE_DIR = os.environ.get("EXPORT_CACHE_DIR", "./export_cache")
+EXPORT_CACHE_TTL_SECONDS = int(os.environ.get("EXPORT_CACHE_TTL_SECONDS", "3600"))
+EXPORT_CACHE_SIZE_LIMIT_MB = int(os.environ.get("EXPORT_CACHE_SIZE_LIMIT_MB", "2048"))
+
+# Format name -> (MIME type, file extension).
+EXPORT_FORMATS: Dict[str, Tuple[str, str]] = {
+    "csv": ("text/csv", ".csv"),
+    "csv.gz": ("application/gzip", ".csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx"),
+}
+
+TABLE_EXPORT_SECONDS = REGISTRY.histogram(
+    "table_export_duration_seconds", "Time to stream a table export to the client.", ("format",))
+TABLE_EXPORT_BYTES = REGISTRY.histogram(
+    "table_export_bytes", "Size of completed table exports.", ("format",), BYTES_BUCKETS)
+TABLE_EXPORTS = REGISTRY.counter(
+    "table_exports", "Streamed table exports by outcome (completed, aborted or failed).", ("format", "outcome"))
+TABLE_EXPORTS_IN_FLIGHT = REGISTRY.gauge(
+    "table_exports_in_flight", "Table exports being streamed.", ("format",))
+
+# Rows per Excel worksheet (the format's limit, less the header row); longer
+# tables continue on further sheets.
+XLSX_MAX_ROWS = 1_048_575
+
+
+###
+# _TeeSink CLASS
+#
+# A write-only, unseekable file object that appends everything written to a
+# file and keeps the bytes written since the last `take` for the response.
+###
+class _TeeSink(io.RawIOBase):
+    def __init__(self, file: io.BufferedWriter):
+        self.file = file
+        self._pending: list = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        data = bytes(data)
+        self.file.write(data)
+        self._pending.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        chunk = b"".join(self._pending)
+        self._pending = []
+        return chunk
+
+
+def _plain(batch: pa.RecordBatch) -> pa.RecordBatch:
+    # Categorical columns are stored dictionary-encoded; writers want values.
+    columns = [pc.cast(col, col.type.value_type) if pa.types.is_dictionary(col.type) else col for col in batch.columns]
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+def _plain_schema(schema: pa.Schema) -> pa.Schema:
+    return pa.schema([pa.field(f.name, f.type.value_type if pa.types.is_dictionary(f.type) else f.type) for f in schema])
+
+
+###
+# FUNCTION: write_batches
+#
+# Writes the batches to `sink` in the given format, yielding after each batch
+# (and once more after the file is finished) so the caller can pass the bytes
+# written so far on to the client.
+###
+def write_batches(schema: pa.Schema, batches: Iterator[pa.RecordBatch], fmt: str, sink: Any) -> Iterator[None]:
+    schema = _plain_schema(schema).remove_metadata()
+    if fmt in ("csv", "csv.gz"):
+        target = gzip.GzipFile(fileobj=sink, mode="wb", compresslevel=6) if fmt == "csv.gz" else sink
+        with pa_csv.CSVWriter(target, schema) as writer:
+            for batch in batches:
+                writer.write_batch(_plain(batch))
+                yield
+        if target is not sink:
+            target.close()
+    elif fmt == "parquet":
+        with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+            for batch in batches:
+                writer.write_batch(_plain(batch))
+                yield
+    elif fmt == "xlsx":
+        yield from _write_xlsx(schema, batches, sink)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+    yield
+
+
+def _write_xlsx(schema: pa.Schema, batches: Iterator[pa.RecordBatch], sink: Any) -> Iterator[None]:
+    import xlsxwriter
+
+    # constant_memory flushes each row to a temporary file as it is written.
+    workbook = xlsxwriter.Workbook(sink, {"constant_memory": True, "nan_inf_to_errors": True,
+                                          "default_date_format": "yyyy-mm-dd hh:mm:ss", "strings_to_urls": False})
+    sheet, row = None, XLSX_MAX_ROWS
+    for batch in batches:
+        for values in zip(*(col.to_pylist() for col in _plain(batch).columns)):
+            if row >= XLSX_MAX_ROWS:
+                sheet = workbook.add_worksheet()
+                sheet.write_row(0, 0, schema.names)
+                row = 0
+            row += 1
+            sheet.write_row(row, 0, values)
+        yield
+    if sheet is None:
+        workbook.add_worksheet().write_row(0, 0, schema.names)
+    workbook.close()
+
+
+###
+# TableExporter CLASS
+#
+# Streams stored tables in an export format and keeps finished files in a
+# ManagedCache (with a TTL and size limit, culled like the other caches).
+# Files are always stored on disk (never inline in the cache database) so
+# they can be handed to Flask's `send_file`.
+###
+class TableExporter:
+    def __init__(self, store: TableStore, directory: str = EXPORT_CACHE_DIR,
+                 ttl_seconds: int = EXPORT_CACHE_TTL_SECONDS, size_limit_mb: int = EXPORT_CACHE_SIZE_LIMIT_MB):
+        self.store = store
+        self.cache = ManagedCache(directory, default_expire=ttl_seconds, size_limit=size_limit_mb * 2**20,
+                                  disk_min_file_size=0)
+
+    ###
+    # METHOD: cached_path
+    #
+    # Returns the path of a finished export of the table, or None.
+    ###
+    def cached_path(self, key: str, fmt: str) -> Optional[str]:
+        handle = self.cache.get(f"{key}.{fmt}", read=True)
+        if handle is None:
+            self.cache.record("misses")
+            return None
+        self.cache.record("hits")
+        handle.close()
+        return handle.name
+
+    ###
+    # METHOD: stream
+    #
+    # Returns an iterator over the bytes of the table in the given format, or
+    # None if the table is not in the store. The export is cached once the
+    # iterator has been consumed to the end.
+    ###
+    def stream(self, key: str, fmt: str) -> Optional[Iterator[bytes]]:
+        source = self.store.iter_batches(key)
+        if source is None:
+            return None
+        schema, batches = source
+        return self._tee(f"{key}.{fmt}", schema, batches, fmt)
+
+    ###
+    # METHOD: build
+    #
+    # Writes the complete export (if it is not cached yet) and returns its path,
+    # or None if the table is not in the store.
+    ###
+    def build(self, key: str, fmt: str) -> Optional[str]:
+        path = self.cached_path(key, fmt)
+        if path is not None:
+            return path
+        chunks = self.stream(key, fmt)
+        if chunks is None:
+            return None
+        for _ in chunks:
+            pass
+        return self.cached_path(key, fmt)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
+
+    def _tee(self, name: str, schema: pa.Schema, batches: Iterator[pa.RecordBatch], fmt: str) -> Iterator[bytes]:
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache.directory, suffix=".part")
+        complete = False
+        outcome = "failed"
+        start = time.perf_counter()
+        TABLE_EXPORTS_IN_FLIGHT.inc(format=fmt)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                sink = _TeeSink(file)
+                for _ in write_batches(schema, batches, fmt, sink):
+                    chunk = sink.take()
+                    if chunk:
+                        yield chunk
+            complete = True
+            with open(tmp_path, "rb") as file:
+                self.cache.set(name, file, read=True)
+            logger.info(f"Exported {name} ({sink.tell() / 2**20:.1f} MB)")
+            outcome = "completed"
+            TABLE_EXPORT_SECONDS.observe(time.perf_counter() - start, format=fmt)
+            TABLE_EXPORT_BYTES.observe(sink.tell(), format=fmt)
+        except GeneratorExit:
+            outcome = "aborted"
+            raise
+        finally:
+            # Also reached when the client disconnects mid-download.
+            os.remove(tmp_path)
+            TABLE_EXPORTS_IN_FLIGHT.dec(format=fmt)
+            TABLE_EXPORTS.inc(format=fmt, outcome=outcome)
+            if not complete:
+                logger.info(f"Export of {name} was not completed")
@@ -0,0 +1,250 @@
+###
+# IMPORTS AND CONFIGURATION
+#
+# This module stores the result tables shown in the chat so that other
+# callbacks (export, insights) and other worker processes can read them back.
+# Tables are kept in a diskcache directory as compressed Arrow IPC files,
+# which preserves the DataFrame dtypes and allows memory-mapped reads. The
+# directory is bounded: tables expire after a TTL, each user has a byte
+# quota, and the whole store is culled back under its size limit.
+###
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+from cache_maintenance import ManagedCache
+from metrics import BYTES_BUCKETS, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Arrow IPC body compression: "zstd", "lz4" or "none". Uncompressed files are
+# read zero-copy from the memory map; compressed ones trade that for size.
+TABLE_CACHE_COMPRESSION = os.environ.get("TABLE_CACHE_COMPRESSION", "zstd")
+# Rows per stored record batch; batches are decompressed one at a time when a
+# table is streamed (see iter_batches).
+TABLE_BATCH_ROWS = int(os.environ.get("TABLE_BATCH_ROWS", "65536"))
+
+# Total size of the store, how long a table is kept, and how many bytes of
+# tables a single user may hold (their oldest tables are evicted first).
+TABLE_CACHE_SIZE_LIMIT_MB = int(os.environ.get("TABLE_CACHE_SIZE_LIMIT_MB", "2048"))
+TABLE_CACHE_TTL_SECONDS = int(os.environ.get("TABLE_CACHE_TTL_SECONDS", "86400"))
+TABLE_CACHE_USER_QUOTA_MB = int(os.environ.get("TABLE_CACHE_USER_QUOTA_MB", "256"))
+
+TABLE_STORE_SECONDS = REGISTRY.histogram(
+    "table_store_operation_duration_seconds", "Time to serialize a table to Arrow IPC and to write it to the store.",
+    ("operation",))
+TABLE_STORE_BYTES = REGISTRY.histogram(
+    "table_store_table_bytes", "Size of the tables written to the store (compressed Arrow IPC).", (), BYTES_BUCKETS)
+
+_OWNER_PREFIX = "__owner__:"
+_DERIVED_PREFIX = "__derived__:"
+
+
+###
+# TableStore CLASS
+#
+# A small wrapper around a ManagedCache that serializes DataFrames to
+# Arrow IPC on write and memory-maps the stored file on read. Writes can be
+# handed to a background writer thread so the calling callback can carry on
+# building its response; callers must `flush()` before the process exits.
+# Reads are counted as hits or misses; a miss means the table expired, was
+# evicted, or never existed.
+###
+class TableStore:
+    ###
+    # METHOD: __init__
+    #
+    # Opens (or creates) the cache directory and configures IPC compression,
+    # the size limit, the table TTL and the per-user quota.
+    ###
+    def __init__(self, directory: str, compression: str = TABLE_CACHE_COMPRESSION,
+                 size_limit_mb: int = TABLE_CACHE_SIZE_LIMIT_MB, ttl_seconds: int = TABLE_CACHE_TTL_SECONDS,
+                 user_quota_mb: int = TABLE_CACHE_USER_QUOTA_MB, **cache_settings):
+        self.cache = ManagedCache(directory, default_expire=ttl_seconds, size_limit=size_limit_mb * 2**20, **cache_settings)
+        self.compression = None if compression in (None, "", "none") else compression
+        self.user_quota_bytes = user_quota_mb * 2**20
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._writer_pid: Optional[int] = None
+        self._pending: "set[Future]" = set()
+        self._lock = threading.Lock()
+
+    ###
+    # METHOD: put
+    #
+    # Serializes a DataFrame to Arrow IPC and stores it under `key`. When an
+    # `owner` is given the table counts against that owner's quota. If the
+    # write takes the store over its size limit, it is culled right away.
+    ###
+    def put(self, key: str, df: pd.DataFrame, owner: Optional[str] = None) -> None:
+        start = time.perf_counter()
+        table = self._to_arrow(df)
+        sink = pa.BufferOutputStream()
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=TABLE_BATCH_ROWS)
+        buffer = sink.getvalue()
+        written = time.perf_counter()
+        self.cache.set(key, pa.BufferReader(buffer), read=True, tag=owner)
+        TABLE_STORE_SECONDS.observe(written - start, operation="serialize")
+        TABLE_STORE_SECONDS.observe(time.perf_counter() - written, operation="write")
+        TABLE_STORE_BYTES.observe(buffer.size)
+        if owner and self.user_quota_bytes > 0:
+            self._enforce_quota(owner, key, buffer.size)
+        if self.cache.volume() > self.cache.size_limit:
+            self.cull()
+
+    ###
+    # METHOD: put_async
+    #
+    # Queues `put` on the background writer and returns its Future.
+    ###
+    def put_async(self, key: str, df: pd.DataFrame, owner: Optional[str] = None) -> Future:
+        future = self._get_writer().submit(self.put, key, df, owner)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._discard_pending)
+        return future
+
+    ###
+    # METHOD: flush
+    #
+    # Waits for all queued background writes to finish, re-raising the first
+    # write error.
+    ###
+    def flush(self, timeout: Optional[float] = None) -> None:
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.result(timeout=timeout)
+
+    ###
+    # METHOD: get_arrow
+    #
+    # Returns the stored table as a pyarrow.Table backed by a memory map of
+    # the cache file, or None if the key is missing.
+    ###
+    def get_arrow(self, key: str) -> Optional[pa.Table]:
+        handle = self.cache.get(key, read=True)
+        if handle is None:
+            self.cache.record("misses")
+            return None
+        self.cache.record("hits")
+        with handle:
+            source = pa.memory_map(handle.name) if getattr(handle, "name", None) else pa.BufferReader(handle.read())
+        return pa.ipc.open_file(source).read_all()
+
+    ###
+    # METHOD: iter_batches
+    #
+    # Returns the stored table's schema and an iterator over its record
+    # batches, or None if the key is missing. Only one batch is decompressed
+    # at a time, so large tables can be streamed in flat memory.
+    ###
+    def iter_batches(self, key: str) -> Optional[Tuple[pa.Schema, Iterator[pa.RecordBatch]]]:
+        handle = self.cache.get(key, read=True)
+        if handle is None:
+            self.cache.record("misses")
+            return None
+        self.cache.record("hits")
+        with handle:
+            source = pa.memory_map(handle.name) if getattr(handle, "name", None) else pa.BufferReader(handle.read())
+        reader = pa.ipc.open_file(source)
+        return reader.schema, (reader.get_batch(i) for i in range(reader.num_record_batches))
+
+    ###
+    # METHOD: get
+    #
+    # Returns the stored table as a DataFrame with its original dtypes, or
+    # None if the key is missing.
+    ###
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        table = self.get_arrow(key)
+        return table.to_pandas() if table is not None else None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.cache
+
+    ###
+    # METHOD: derived
+    #
+    # Returns a value derived from the table under `key` (e.g. its summary),
+    # computing it with `build` on first use and storing it next to the table
+    # with the same TTL.
+    ###
+    def derived(self, key: str, name: str, build: Callable[[], Any]) -> Any:
+        derived_key = f"{_DERIVED_PREFIX}{name}:{key}"
+        value = self.cache.get(derived_key)
+        if value is None:
+            value = build()
+            self.cache.set(derived_key, value)
+        return value
+
+    ###
+    # METHOD: cull
+    #
+    # Drops expired tables and evicts by policy until under the size limit.
+    ###
+    def cull(self) -> int:
+        return self.cache.cull(retry=True)
+
+    ###
+    # METHOD: stats
+    #
+    # Returns hit, miss and eviction counts plus the entry count and bytes on disk.
+    ###
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+    def _enforce_quota(self, owner: str, key: str, nbytes: int) -> None:
+        # Each owner's tables are listed oldest first under a reserved key;
+        # entries that already expired or were culled are dropped from the list.
+        index_key = f"{_OWNER_PREFIX}{owner}"
+        evicted = 0
+        with self.cache.transact(retry=True):
+            entries = [(k, size) for k, size in self.cache.get(index_key, default=[]) if k != key and k in self.cache]
+            entries.append((key, nbytes))
+            used = sum(size for _, size in entries)
+            while used > self.user_quota_bytes and len(entries) > 1:
+                old_key, size = entries.pop(0)
+                self.cache.delete(old_key)
+                used -= size
+                evicted += 1
+            self.cache.set(index_key, entries)
+        if evicted:
+            self.cache.record("evictions", evicted)
+            logger.info(f"Evicted {evicted} tables over the {self.user_quota_bytes / 2**20:.0f} MB quota of one user")
+
+    def _get_writer(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._writer is None or self._writer_pid != os.getpid():
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="table-writer")
+                self._writer_pid = os.getpid()
+                self._pending = set()
+            return self._writer
+
+    def _discard_pending(self, future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+
+    @staticmethod
+    def _to_arrow(df: pd.DataFrame) -> pa.Table:
+        try:
+            return pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+        # Columns mixing Python types cannot be inferred; store only those as text.
+        mixed = {}
+        for col in df.columns:
+            if df[col].dtype == object:
+                try:
+                    pa.array(df[col], from_pandas=True)
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    mixed[col] = "str"
+        logger.warning(f"Storing mixed-type columns as text: {list(mixed)}")
+        return pa.Table.from_pandas(df.astype(mixed), preserve_index=False)
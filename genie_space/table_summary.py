@@ -0,0 +1,197 @@
+###
+# IMPORTS AND CONFIGURATION
+#
+# Prepares a result table for an insight prompt. Tables that fit the token
+# budget are sent in full as CSV; larger ones are replaced by a compact
+# profile (column statistics, value distributions, trends over time and a
+# stratified sample) that is shrunk until it fits. All statistics are
+# computed with vectorized pandas operations.
+###
+import logging
+import os
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Budget for the table part of an insight prompt, in (estimated) tokens.
+INSIGHT_TABLE_TOKEN_BUDGET = int(os.environ.get("INSIGHT_TABLE_TOKEN_BUDGET", "6000"))
+
+# Rough characters-per-token ratio used to estimate prompt size without a
+# model-specific tokenizer.
+_CHARS_PER_TOKEN = 4
+
+# Progressively smaller profiles tried until one fits: (top-k values per
+# column, trend periods, sample rows).
+_PROFILE_LEVELS = ((10, 24, 50), (5, 12, 20), (3, 6, 10), (3, 0, 5), (0, 0, 0))
+
+# Period lengths tried for trends, finest first, with the minimum span (in
+# days) each is considered for.
+_TREND_FREQUENCIES = (("D", 0), ("W", 14), ("MS", 90), ("QS", 730), ("YS", 1825))
+_TREND_MAX_MEASURES = 5
+
+# A column is used to stratify the sample if it has this many groups or fewer.
+_MAX_STRATA = 50
+
+# Top values are only listed for columns where some value reaches this share.
+_MIN_TOP_SHARE = 0.01
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+
+###
+# FUNCTION: table_for_prompt
+#
+# Returns the text to send for a table: the full CSV when it fits the token
+# budget, otherwise the largest profile that does.
+###
+def table_for_prompt(df: pd.DataFrame, token_budget: int = INSIGHT_TABLE_TOKEN_BUDGET) -> str:
+    # Every cell takes at least two characters (value and separator), so large
+    # tables are ruled out without rendering them.
+    if len(df) * len(df.columns) * 2 <= token_budget * _CHARS_PER_TOKEN:
+        csv = df.to_csv(index=False)
+        if estimate_tokens(csv) <= token_budget:
+            return csv
+
+    for top_k, trend_points, sample_rows in _PROFILE_LEVELS:
+        text = profile_table(df, top_k, trend_points, sample_rows)
+        if estimate_tokens(text) <= token_budget:
+            logger.info(f"Summarized {len(df)}x{len(df.columns)} table into ~{estimate_tokens(text)} tokens")
+            return text
+
+    # Even the smallest profile is too large (very wide tables); cut it off.
+    return text[:token_budget * _CHARS_PER_TOKEN] + "\n[profile truncated]"
+
+
+###
+# FUNCTION: profile_table
+#
+# Builds the text profile of a table.
+###
+def profile_table(df: pd.DataFrame, top_k: int, trend_points: int, sample_rows: int) -> str:
+    sections = [
+        f"The table has {len(df)} rows and is too large to include in full. "
+        "Below is a statistical profile of it, followed by a representative sample.",
+        _overview(df),
+        _numeric_stats(df),
+        _distributions(df, top_k),
+        _datetime_ranges(df),
+        _trends(df, trend_points),
+        _stratified_sample(df, sample_rows),
+    ]
+    return "\n\n".join(s.strip() for s in sections if s)
+
+
+def _overview(df: pd.DataFrame) -> str:
+    null_share = df.isna().mean()
+    columns = ", ".join(f"{col} ({dtype}, {null_share[col]:.0%} null)" for col, dtype in df.dtypes.items())
+    return f"Rows: {len(df)}\nColumns: {columns}"
+
+
+def _numeric_columns(df: pd.DataFrame) -> List[str]:
+    return [col for col in df.columns
+            if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])]
+
+
+def _numeric_stats(df: pd.DataFrame) -> str:
+    columns = _numeric_columns(df)
+    if not columns:
+        return ""
+    stats = df[columns].astype("float64").describe().T
+    stats["sum"] = df[columns].astype("float64").sum()
+    return "Numeric columns:\n" + stats.round(4).to_csv()
+
+
+def _distributions(df: pd.DataFrame, top_k: int) -> str:
+    if top_k <= 0:
+        return ""
+    numeric = set(_numeric_columns(df))
+    lines = []
+    for col in df.columns:
+        if col in numeric or pd.api.types.is_datetime64_any_dtype(df[col]):
+            continue
+        counts = df[col].value_counts(normalize=True, dropna=True)
+        if counts.empty:
+            continue
+        if counts.iloc[0] < _MIN_TOP_SHARE:
+            lines.append(f"{col} ({len(counts)} distinct): no value above {_MIN_TOP_SHARE:.0%} of rows")
+            continue
+        top = ", ".join(f"{value} {share:.1%}" for value, share in counts.head(top_k).items())
+        lines.append(f"{col} ({len(counts)} distinct): {top}")
+    return "Most frequent values:\n" + "\n".join(lines) if lines else ""
+
+
+def _datetime_columns(df: pd.DataFrame) -> List[str]:
+    return [col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])]
+
+
+def _datetime_ranges(df: pd.DataFrame) -> str:
+    lines = [f"{col}: {df[col].min()} to {df[col].max()}" for col in _datetime_columns(df)]
+    return "Date ranges:\n" + "\n".join(lines) if lines else ""
+
+
+###
+# FUNCTION: _trends
+#
+# Row counts and sums of the numeric columns per period of the first date
+# column, using the finest period that yields at most `max_points` periods.
+###
+def _trends(df: pd.DataFrame, max_points: int) -> str:
+    dates = _datetime_columns(df)
+    measures = _numeric_columns(df)[:_TREND_MAX_MEASURES]
+    if max_points <= 0 or not dates or df[dates[0]].isna().all():
+        return ""
+    date_col = dates[0]
+    span_days = (df[date_col].max() - df[date_col].min()).days
+
+    trend: Optional[pd.DataFrame] = None
+    for freq, min_span in _TREND_FREQUENCIES:
+        if span_days < min_span:
+            continue
+        grouped = df.groupby(pd.Grouper(key=date_col, freq=freq))
+        trend = grouped[measures].sum() if measures else pd.DataFrame(index=grouped.size().index)
+        trend.insert(0, "rows", grouped.size())
+        if len(trend) <= max_points:
+            break
+    if trend is None or len(trend) < 2:
+        return ""
+    trend = trend.tail(max_points)
+    return f"Trend by {date_col} (row count and sums per period):\n" + trend.round(2).to_csv()
+
+
+###
+# FUNCTION: _stratified_sample
+#
+# Samples rows in proportion to the groups of a text column (every group
+# gets at least one row), or uniformly if there is none. The column with the
+# most groups that still fit in the sample is used.
+###
+def _stratified_sample(df: pd.DataFrame, rows: int) -> str:
+    if rows <= 0 or df.empty:
+        return ""
+    rows = min(rows, len(df))
+    numeric = set(_numeric_columns(df))
+    cardinality = {col: df[col].nunique() for col in df.columns
+                   if col not in numeric and not pd.api.types.is_datetime64_any_dtype(df[col])}
+    strata = [col for col, n in sorted(cardinality.items(), key=lambda item: -item[1]) if 2 <= n <= min(rows, _MAX_STRATA)]
+
+    if strata:
+        col = strata[0]
+        rng = np.random.default_rng(0)
+        keys = df[col].astype("string").fillna("<null>")
+        group_size = keys.map(keys.value_counts())
+        quota = np.maximum(1, np.round(rows * group_size / len(df)))
+        rank = pd.Series(rng.random(len(df)), index=df.index).groupby(keys).rank(method="first")
+        # Take every group's first picks before anyone's second, so the row
+        # cap never drops a whole group.
+        picked = rank[rank <= quota].sort_values(kind="stable")
+        sample = df.loc[picked.index[:rows]].sort_index()
+        label = f"Sample of {len(sample)} rows, stratified by {col}:"
+    else:
+        sample = df.sample(rows, random_state=0).sort_index()
+        label = f"Random sample of {len(sample)} rows:"
+    return label + "\n" + sample.to_csv(index=False)
@@ -0,0 +1,20 @@
+###
+# TEST CONFIGURATION
+#
+# Makes the app modules (and tests/helpers.py) importable from the tests and
+# keeps the state the modules write (breakers, retry budget, metrics) out of
+# the app's directories.
+#
+# Usage (from the genie_space directory):
+#     python -m pytest tests
+###
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_STATE_DIR = tempfile.mkdtemp(prefix="genie-tests-")
+os.environ.setdefault("RESILIENCE_STATE_DIR", os.path.join(_STATE_DIR, "resilience"))
+os.environ.setdefault("METRICS_DIR", os.path.join(_STATE_DIR, "metrics"))
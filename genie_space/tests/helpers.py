@@ -0,0 +1,13 @@
+###
+# TEST HELPERS
+#
+# Fakes shared by several test modules.
+###
+
+
+def sdk_retries_exhausted(error: Exception) -> TimeoutError:
+    # How the SDK raises the last error once its own retry window is exhausted.
+    try:
+        raise TimeoutError("Timed out after 0:00:05") from error
+    except TimeoutError as timeout:
+        return timeout
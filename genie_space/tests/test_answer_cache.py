@@ -0,0 +1,50 @@
+import time
+
+import pandas as pd
+import pytest
+
+from answer_cache import AnswerCache, normalize_question, permission_scope
+
+ANSWER = ("conversation-1", pd.DataFrame({"customer": ["a", "b"]}), "SELECT 1", "Top customers")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = AnswerCache(str(tmp_path), ttl_seconds=60, stale_seconds=60)
+    yield cache
+    cache.cache.close()
+
+
+def test_equivalent_questions_share_a_key():
+    assert normalize_question("Top 10  Customers?") == normalize_question("top 10 customers")
+    assert AnswerCache.key("space", "Top 10 customers?", "user:a") == AnswerCache.key("space", "top 10  CUSTOMERS", "user:a")
+    assert AnswerCache.key("space", "top 10 customers", "user:a") != AnswerCache.key("other", "top 10 customers", "user:a")
+
+
+def test_answers_are_scoped_to_the_caller(cache):
+    alice = permission_scope("Alice@example.com", "token-a")
+    bob = permission_scope(None, "token-b")
+    assert alice == "user:alice@example.com" and bob.startswith("token:") and "token-b" not in bob
+    assert permission_scope(None, None) is None
+
+    assert cache.put("space", "Top customers", alice, ANSWER, fetch_seconds=2.0)
+    assert cache.get("space", "top customers?", alice).answer[0] == "conversation-1"
+    assert cache.get("space", "top customers", bob) is None
+    assert cache.get("space", "top customers", None) is None
+    assert not cache.put("space", "Top customers", None, ANSWER, fetch_seconds=2.0)
+
+
+def test_only_query_answers_are_cached(cache):
+    assert not cache.put("space", "hi", "user:a", ("conversation-1", "Hello!", None, None), fetch_seconds=1.0)
+    assert not cache.put("space", "q", "user:a", (None, ANSWER[1], None, None), fetch_seconds=1.0)
+    assert not cache.put("space", "q", "user:a", ("conversation-1", pd.DataFrame(), None, None), fetch_seconds=1.0)
+
+
+def test_old_answers_are_served_stale(cache, monkeypatch):
+    cache.put("space", "q", "user:a", ANSWER, fetch_seconds=2.0)
+    assert not cache.get("space", "q", "user:a").stale
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 90)
+    assert cache.get("space", "q", "user:a").stale
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["stale_hits"] == 1 and stats["seconds_saved"] == 4.0
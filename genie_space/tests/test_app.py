@@ -0,0 +1,54 @@
+import importlib
+import os
+
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    # The app opens its caches and databases relative to the working
+    # directory when it is imported.
+    previous = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("app"))
+    try:
+        module = importlib.import_module("app")
+        yield module
+    finally:
+        os.chdir(previous)
+
+
+@pytest.fixture
+def genie(app, monkeypatch):
+    calls = []
+
+    def genie_query(question, token, space_id, conversation_id=None, **_):
+        calls.append(conversation_id)
+        # Only answers with a table are cached.
+        table = pd.DataFrame({"question": [question], "orders": [42]})
+        return conversation_id or f"conversation-{len(calls)}", table, "SELECT 42", None
+
+    monkeypatch.setattr(app, "genie_query", genie_query)
+    monkeypatch.setattr(app, "genie_circuit_open", lambda: False)
+    monkeypatch.setattr(app, "set_props", lambda *args, **kwargs: None)
+    return calls
+
+
+def _ask(app, question, conversation_id, session):
+    return app.get_model_response({"trigger": True, "message": question}, "space-1", conversation_id, "token",
+                                   {"current_session": session}, "client-1", {"email": "analyst@example.com"})
+
+
+def test_cached_first_answer_does_not_join_the_cached_conversation(app, genie):
+    first = _ask(app, "How many orders last week?", None, 0)
+    assert first[3] == "conversation-1"
+
+    # Another session of the same user asks the same first question.
+    cached = _ask(app, "How many orders last week?", None, 1)
+    assert genie == [None]
+    assert cached[3] is None
+
+    # Its follow-up starts a conversation of its own.
+    follow_up = _ask(app, "And the week before?", cached[3], 1)
+    assert genie == [None, None]
+    assert follow_up[3] == "conversation-2"
@@ -0,0 +1,38 @@
+import time
+
+from dash import html
+
+from conversation_store import ConversationStore
+
+
+def test_sessions_round_trip_their_messages(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations.db"))
+    session_id = store.create_session("client-1", "Sales")
+    store.append_messages("client-1", session_id, [html.Div("question", className="user-message")])
+    store.append_messages("client-1", session_id, [{"props": {"children": "answer"}, "type": "Div", "namespace": "dash_html_components"}])
+    store.set_conversation_id("client-1", session_id, "conversation-1")
+
+    assert store.get_session("client-1", session_id) == {"session_id": session_id, "title": "Sales",
+                                                         "conversation_id": "conversation-1"}
+    messages = store.get_messages("client-1", session_id)
+    assert [m["props"]["children"] for m in messages] == ["question", "answer"]
+    assert messages[0]["props"]["className"] == "user-message"
+
+
+def test_sessions_are_private_to_their_client(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations.db"))
+    session_id = store.create_session("client-1", "Sales")
+    store.append_messages("client-1", session_id, ["hello"])
+    assert store.get_session("client-2", session_id) is None
+    assert store.get_messages("client-2", session_id) == []
+
+
+def test_expired_sessions_are_pruned(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations.db"), retention_days=1)
+    old = store.create_session("client-1", "Old")
+    store.append_messages("client-1", old, ["hello"])
+    with store._connect() as conn:
+        conn.execute("UPDATE sessions SET updated = ? WHERE session_id = ?", (time.time() - 2 * 86400, old))
+    new = store.create_session("client-1", "New")
+    assert store.get_session("client-1", old) is None and store.get_messages("client-1", old) == []
+    assert store.get_session("client-1", new)["title"] == "New"
@@ -0,0 +1,92 @@
+import csv
+import gzip
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import full_export
+from full_export import DONE, FAILED, RUNNING, FullExporter
+
+SOURCE = {"conversation_id": "c", "message_id": "m", "attachment_id": "a"}
+
+
+def _stream(batches, total=None):
+    return {"schema": {"columns": [{"name": "id"}, {"name": "name"}]}, "total_row_count": total,
+            "batches": iter(batches)}
+
+
+def _wait(exporter, job_id, statuses=(DONE, FAILED), timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        state = exporter.status(job_id)
+        if state["status"] in statuses:
+            return state
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} is still {state['status']}")
+
+
+@pytest.fixture
+def exporter(tmp_path):
+    exporter = FullExporter(str(tmp_path))
+    exporter.register("table-1", "space-1", SOURCE)
+    yield exporter
+    exporter.cache.close()
+
+
+def test_export_writes_every_row(exporter):
+    job_id = exporter.start("table-1", lambda source: _stream([[[1, "a"], [2, "b"]], [[3, "c"]]], total=3))
+    state = _wait(exporter, job_id)
+    assert state["status"] == DONE and state["rows"] == 3 and state["total_rows"] == 3
+    with gzip.open(exporter.file_path(job_id), "rt", newline="") as f:
+        assert list(csv.reader(f)) == [["id", "name"], ["1", "a"], ["2", "b"], ["3", "c"]]
+    assert exporter.stats()["completed"] == 1
+
+
+def test_unknown_table_is_not_exported(exporter):
+    assert exporter.start("table-2", lambda source: _stream([])) is None
+
+
+def test_failed_query_fails_the_job(exporter):
+    def open_stream(source):
+        raise RuntimeError("warehouse stopped")
+
+    job_id = exporter.start("table-1", open_stream)
+    state = _wait(exporter, job_id)
+    assert state["status"] == FAILED and "warehouse stopped" in state["error"]
+    assert exporter.file_path(job_id) is None
+
+
+def test_heartbeat_runs_while_the_query_runs(exporter, monkeypatch):
+    monkeypatch.setattr(full_export, "FULL_EXPORT_HEARTBEAT_SECONDS", 0.05)
+    release = threading.Event()
+
+    def open_stream(source):
+        release.wait(10)
+        return _stream([[[1, "a"]]])
+
+    job_id = exporter.start("table-1", open_stream)
+    first = _wait(exporter, job_id, (RUNNING,))["heartbeat"]
+    time.sleep(0.3)
+    assert exporter.status(job_id)["heartbeat"] > first
+    release.set()
+    assert _wait(exporter, job_id)["status"] == DONE
+
+
+def test_job_of_a_dead_process_is_failed(exporter):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    exporter.cache.set("job:lost", {"status": RUNNING, "rows": 10, "pid": dead.pid, "heartbeat": time.time(),
+                                    "error": None, "finished": None})
+    state = exporter.status("lost")
+    assert state["status"] == FAILED and "stopped" in state["error"]
+    assert exporter.status("lost")["status"] == FAILED
+
+
+def test_job_without_heartbeat_is_failed(exporter):
+    exporter.cache.set("job:stuck", {"status": RUNNING, "rows": 0, "pid": os.getpid(), "error": None, "finished": None,
+                                     "heartbeat": time.time() - full_export.FULL_EXPORT_STALE_SECONDS - 1})
+    assert exporter.status("stuck")["status"] == FAILED
@@ -0,0 +1,88 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from databricks.sdk import errors
+
+import genie_room
+from genie_room import AsyncGenieClient, GenieClient, PollingPolicy, _parse_column
+from helpers import sdk_retries_exhausted
+
+
+def _client(get_message) -> AsyncGenieClient:
+    client = AsyncGenieClient.__new__(AsyncGenieClient)
+    client.host = "tests.invalid"
+    client.space_id = "tests-space"
+    client.token = None
+    client.client = SimpleNamespace(genie=SimpleNamespace(get_message=get_message))
+    return client
+
+
+def test_wait_for_message_completion_backs_off_on_wrapped_429(monkeypatch):
+    calls = []
+    throttles = []
+
+    def get_message(**_):
+        calls.append(1)
+        if len(calls) == 1:
+            raise sdk_retries_exhausted(errors.TooManyRequests("slow down", retry_after_secs=1))
+        return SimpleNamespace(as_dict=lambda: {"status": "COMPLETED"})
+
+    monkeypatch.setattr(genie_room, "_throttle_listeners", [throttles.append])
+    sleeps = []
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(genie_room.asyncio, "sleep", sleep)
+    message = asyncio.run(_client(get_message).wait_for_message_completion(
+        "conversation", "message", timeout=30, policy=PollingPolicy.fixed(0.1)))
+    assert message["status"] == "COMPLETED"
+    assert throttles == [1.0]
+    assert sleeps == [1.0]
+
+
+def test_wait_for_message_completion_bounds_a_stalled_poll():
+    def get_message(**_):
+        time.sleep(2)  # e.g. retrying inside the SDK
+        return SimpleNamespace(as_dict=lambda: {"status": "COMPLETED"})
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError, match="timed out"):
+        asyncio.run(_client(get_message).wait_for_message_completion(
+            "conversation", "message", deadline=time.monotonic() + 0.3))
+    assert time.monotonic() - start < 1.5
+
+
+def test_sync_result_streams_follow_every_chunk():
+    schema = {"columns": [{"name": "id", "type_name": "LONG"}]}
+    statement = SimpleNamespace(statement_id="statement-1",
+                                manifest=SimpleNamespace(schema=SimpleNamespace(as_dict=lambda: schema), total_row_count=3),
+                                result=SimpleNamespace(data_array=[["1"], ["2"]], next_chunk_index=1))
+    async_client = _client(None)
+    async_client.client = SimpleNamespace(
+        genie=SimpleNamespace(get_message_attachment_query_result=lambda **_: SimpleNamespace(statement_response=statement),
+                              execute_message_attachment_query=lambda **_: SimpleNamespace(statement_response=statement)),
+        statement_execution=SimpleNamespace(
+            get_statement_result_chunk_n=lambda **_: SimpleNamespace(data_array=[["3"]], next_chunk_index=None)))
+    client = GenieClient.__new__(GenieClient)
+    client.async_client = async_client
+
+    for stream in (client.get_query_result_stream("c", "m", "a"), client.execute_query_stream("c", "m", "a")):
+        assert stream["schema"] == schema and stream["total_row_count"] == 3
+        assert list(stream["batches"]) == [[["1"], ["2"]], [["3"]]]
+    assert list(client.get_query_result_stream("c", "m", "a", max_rows=1)["batches"]) == [[["1"]]]
+
+
+def test_nullable_bigint_above_2_53_is_exact():
+    values = pd.Series(["9007199254740993", None, "-9223372036854775807"], dtype=object)
+    parsed = _parse_column(values, {"name": "id", "type_name": "LONG"})
+    assert str(parsed.dtype) == "Int64"
+    assert parsed.tolist() == [9007199254740993, pd.NA, -9223372036854775807]
+
+
+def test_integer_cells_that_do_not_parse_become_null():
+    parsed = _parse_column(pd.Series(["12", "n/a", None, " 7 "], dtype=object), {"name": "qty", "type_name": "INT"})
+    assert parsed.tolist() == [12, pd.NA, pd.NA, 7]
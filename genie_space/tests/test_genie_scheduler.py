@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from genie_scheduler import PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, GenieScheduler, QueueTimeout
+
+
+def _scheduler(tmp_path, **limits) -> GenieScheduler:
+    limits.setdefault("max_wait_seconds", 0.3)
+    return GenieScheduler(str(tmp_path / "scheduler.db"), **limits)
+
+
+def _enqueue(scheduler, ticket, user="alice", space=None, priority=PRIORITY_INTERACTIVE, rate_limited=True,
+             pid=None, admitted=None):
+    with scheduler._transaction() as conn:
+        conn.execute(
+            "INSERT INTO tickets (id, user, space, priority, rate_limited, pid, enqueued, admitted) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (ticket, user, space, priority, int(rate_limited), pid or os.getpid(), time.time(), admitted)
+        )
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_admit_waits_for_a_free_slot(tmp_path):
+    scheduler = _scheduler(tmp_path, max_concurrent=1)
+    positions = []
+    with scheduler.admit("alice"):
+        with pytest.raises(QueueTimeout):
+            with scheduler.admit("bob", on_wait=positions.append):
+                pass
+        assert scheduler.stats()["running"]["interactive"] == 1
+    assert positions == [1]
+    with scheduler.admit("bob"):
+        pass
+    stats = scheduler.stats()
+    assert stats["queue_depth"] == 0 and stats["waits"] == 3 and stats["timeouts"] == 1
+
+
+def test_higher_priority_is_admitted_first(tmp_path):
+    scheduler = _scheduler(tmp_path, max_concurrent=1)
+    _enqueue(scheduler, "running", user="carol", admitted=time.time())
+    _enqueue(scheduler, "prefetch", priority=PRIORITY_PREFETCH)
+    _enqueue(scheduler, "interactive", user="bob")
+    assert scheduler._try_admit("prefetch") == 2
+    assert scheduler._try_admit("interactive") == 1
+    with scheduler._transaction() as conn:
+        conn.execute("DELETE FROM tickets WHERE id = 'running'")
+    # The free slot is kept for the interactive ticket.
+    assert scheduler._try_admit("prefetch") == 2
+    assert scheduler._try_admit("interactive") == 0
+
+
+def test_per_user_limit_lets_other_users_through(tmp_path):
+    scheduler = _scheduler(tmp_path, max_concurrent=10, max_per_user=1)
+    _enqueue(scheduler, "alice-1", admitted=time.time())
+    _enqueue(scheduler, "alice-2")
+    _enqueue(scheduler, "bob-1", user="bob")
+    assert scheduler._try_admit("alice-2") == 2
+    assert scheduler._try_admit("bob-1") == 0
+
+
+def test_throttle_pauses_rate_limited_work_only(tmp_path):
+    scheduler = _scheduler(tmp_path)
+    scheduler.throttle(5)
+    stats = scheduler.stats()
+    assert stats["throttled_for"] > 4 and stats["tokens"] < 1
+    _enqueue(scheduler, "question")
+    _enqueue(scheduler, "export", user="bob", rate_limited=False)
+    assert scheduler._try_admit("question") == 1
+    assert scheduler._try_admit("export") == 0
+
+
+def test_tickets_of_dead_processes_are_released(tmp_path):
+    scheduler = _scheduler(tmp_path, max_concurrent=1)
+    dead_pid = _dead_pid()
+    _enqueue(scheduler, "orphan", user="carol", pid=dead_pid, admitted=time.time())
+    _enqueue(scheduler, "queued")
+    assert scheduler._try_admit("queued") == 0
+    assert scheduler.stats()["running"]["interactive"] == 1
+    _enqueue(scheduler, "orphan-queued", pid=dead_pid)
+    with pytest.raises(QueueTimeout):
+        scheduler._try_admit("orphan-queued")
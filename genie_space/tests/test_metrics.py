@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from cache_maintenance import ManagedCache
+from metrics import MetricsRegistry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = MetricsRegistry(str(tmp_path))
+    yield registry
+    registry.cache.close()
+
+
+def test_render_counters_histograms_and_gauges(registry):
+    questions = registry.counter("questions", "Questions asked.", ["space"])
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(1, 5))
+    in_flight = registry.gauge("in_flight", "Work in progress.")
+    questions.inc(space="s1")
+    questions.inc(2, space="s1")
+    latency.observe(0.5)
+    latency.observe(3)
+    in_flight.inc()
+    text = registry.render()
+    assert 'questions_total{space="s1"} 3' in text
+    assert 'latency_seconds_bucket{le="1"} 1' in text
+    assert 'latency_seconds_bucket{le="5"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in text
+    assert "latency_seconds_sum 3.5" in text and "latency_seconds_count 2" in text
+    assert "\nin_flight 1\n" in text
+    with pytest.raises(ValueError):
+        questions.inc(region="x")
+
+
+def test_gauges_of_dead_processes_are_dropped(registry, monkeypatch):
+    in_flight = registry.gauge("in_flight", "Work in progress.")
+    in_flight.inc()
+    dead_pid = os.getpid() + 1_000_000
+    monkeypatch.setattr(os, "getpid", lambda: dead_pid)
+    in_flight.inc(5)
+    monkeypatch.undo()
+    assert "\nin_flight 1\n" in registry.render()
+    assert not any(key[3] == ("pid", dead_pid) for key in registry.cache.iterkeys())
+
+
+def test_samples_are_deferred_while_the_store_is_busy(registry, tmp_path):
+    questions = registry.counter("questions", "Questions asked.")
+    questions.inc()
+    other = ManagedCache(str(tmp_path), eviction_policy="none")
+    with other.transact():
+        questions.inc()
+        questions.inc()
+    other.close()
+    assert registry.cache.get(("metric", "questions", (), "total")) == 1
+    questions.inc()
+    assert registry.cache.get(("metric", "questions", (), "total")) == 4
+    assert registry.cache.get(("metric", "metrics_store_busy", (), "total")) == 2
+    assert "metrics_store_busy_total 2" in registry.render()
@@ -0,0 +1,133 @@
+import pickle
+import threading
+import time
+
+import pytest
+import requests
+from databricks.sdk import errors
+
+import resilience
+from cache_maintenance import ManagedCache
+from resilience import (BREAKER_FAILURE_THRESHOLD, CircuitOpenError, ErrorKind, Resilience, RetryBudget,
+                        TRANSIENT_KINDS, classify_error, is_throttled, retry_after)
+from helpers import sdk_retries_exhausted
+
+
+def _http_error(status: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(response=response)
+
+
+@pytest.mark.parametrize("error, kind", [
+    (errors.TooManyRequests("slow down", retry_after_secs=1), ErrorKind.THROTTLED),
+    (errors.ResourceExhausted("quota"), ErrorKind.THROTTLED),
+    # The SDK gives every 503 a Retry-After; it is still an outage.
+    (errors.TemporarilyUnavailable("down", retry_after_secs=1), ErrorKind.UNAVAILABLE),
+    (errors.TemporarilyUnavailable("down"), ErrorKind.UNAVAILABLE),
+    (errors.InternalError("boom"), ErrorKind.UNAVAILABLE),
+    (errors.DeadlineExceeded("slow"), ErrorKind.TIMEOUT),
+    (errors.BadRequest("bad"), ErrorKind.BAD_REQUEST),
+    (errors.NotFound("gone"), ErrorKind.NOT_FOUND),
+    (errors.PermissionDenied("no"), ErrorKind.PERMISSION),
+    (errors.Unauthenticated("Token expired"), ErrorKind.AUTH_EXPIRED),
+    (errors.DatabricksError("other", retry_after_secs=3), ErrorKind.THROTTLED),
+    (requests.ConnectionError("reset"), ErrorKind.UNAVAILABLE),
+    (requests.Timeout("slow"), ErrorKind.TIMEOUT),
+    (_http_error(429), ErrorKind.THROTTLED),
+    (_http_error(503), ErrorKind.UNAVAILABLE),
+    (_http_error(400), ErrorKind.BAD_REQUEST),
+    (TimeoutError("no cause"), ErrorKind.TIMEOUT),
+    (ValueError("other"), ErrorKind.UNKNOWN),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind
+
+
+@pytest.mark.parametrize("error", [
+    errors.TooManyRequests("slow down", retry_after_secs=1),
+    errors.TemporarilyUnavailable("down", retry_after_secs=1),
+    errors.InternalError("boom"),
+    errors.NotFound("gone"),
+    requests.ConnectionError("reset"),
+])
+def test_classify_error_unwraps_exhausted_sdk_retries(error):
+    assert classify_error(sdk_retries_exhausted(error)) == classify_error(error)
+
+
+def test_unavailable_backend_counts_against_breaker():
+    assert classify_error(errors.TemporarilyUnavailable("down", retry_after_secs=1)) in TRANSIENT_KINDS
+    assert classify_error(sdk_retries_exhausted(errors.TemporarilyUnavailable("down", retry_after_secs=1))) in TRANSIENT_KINDS
+
+
+def test_repeated_503s_open_the_breaker(tmp_path):
+    resilience = Resilience(str(tmp_path))
+
+    def unavailable():
+        raise sdk_retries_exhausted(errors.TemporarilyUnavailable("down", retry_after_secs=1))
+
+    for _ in range(BREAKER_FAILURE_THRESHOLD):
+        with pytest.raises(TimeoutError):
+            resilience.call("genie", unavailable, idempotent=False)
+    assert resilience.breaker("genie").is_open()
+    with pytest.raises(CircuitOpenError):
+        resilience.call("genie", unavailable, idempotent=False)
+
+
+@pytest.mark.parametrize("error, throttled, seconds", [
+    (errors.TooManyRequests("slow down", retry_after_secs=7), True, 7.0),
+    (sdk_retries_exhausted(errors.TooManyRequests("slow down", retry_after_secs=7)), True, 7.0),
+    (errors.TooManyRequests("slow down"), True, 0.0),
+    (sdk_retries_exhausted(errors.TemporarilyUnavailable("down", retry_after_secs=1)), False, 1.0),
+    (ValueError("other"), False, 0.0),
+])
+def test_is_throttled_and_retry_after(error, throttled, seconds):
+    assert is_throttled(error) == throttled
+    assert retry_after(error) == seconds
+
+
+def test_retry_budget_deposits_are_flushed_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_BUDGET_FLUSH_SECONDS", 3600)
+    budget = RetryBudget(ManagedCache(str(tmp_path)), ratio=0.5, min_per_second=0, max_tokens=10)
+    budget.store.set("retry_budget", (0.0, time.time()), expire=None)
+    for _ in range(3):
+        budget.deposit()
+    assert budget.store.get("retry_budget")[0] == 0.0
+    # A retry first adds the pending deposits, then spends from them.
+    assert budget.try_spend()
+    assert budget.try_spend() is False
+    assert budget.store.get("retry_budget")[0] == pytest.approx(0.5)
+
+    monkeypatch.setattr(resilience, "RETRY_BUDGET_FLUSH_SECONDS", 0)
+    budget.deposit()
+    assert budget.store.get("retry_budget")[0] == pytest.approx(1.0)
+
+
+def test_breaker_reads_do_not_wait_for_the_write_lock(tmp_path):
+    resilience = Resilience(str(tmp_path))
+    resilience.breaker("genie").record_failure(ErrorKind.UNAVAILABLE)
+    writer = ManagedCache(str(tmp_path), eviction_policy="none")
+    locked, release = threading.Event(), threading.Event()
+
+    def hold_write_lock():
+        with writer.transact():
+            writer.set("busy", True)
+            locked.set()
+            release.wait(10)
+
+    holder = threading.Thread(target=hold_write_lock)
+    holder.start()
+    locked.wait(5)
+    try:
+        reader = threading.Thread(target=resilience.breaker("genie").allow)
+        reader.start()
+        reader.join(2)
+        assert not reader.is_alive()
+    finally:
+        release.set()
+        holder.join()
+
+
+def test_store_keeps_its_eviction_policy_when_pickled(tmp_path):
+    store = pickle.loads(pickle.dumps(Resilience(str(tmp_path)).store))
+    assert store.eviction_policy == "none"
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from row_model import RowModel
+from table_store import TableStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TableStore(str(tmp_path))
+    store.put("orders", pd.DataFrame({"id": range(10), "amount": [5, 3, 9, 1, 7, 2, 8, 0, 6, 4],
+                                      "region": ["north", "south"] * 5}))
+    yield store
+    store.cache.close()
+
+
+def test_get_rows_sorts_and_filters(store):
+    model = RowModel(store)
+    rows = model.get_rows("orders", {"startRow": 0, "endRow": 3, "sortModel": [{"colId": "amount", "sort": "desc"}],
+                                     "filterModel": {"region": {"filterType": "text", "type": "equals", "filter": "north"}}})
+    assert rows["rowCount"] == 5
+    assert [row["amount"] for row in rows["rowData"]] == [9, 8, 7]
+    assert model.get_rows("orders", {"startRow": 8, "endRow": 20})["rowData"] == [
+        {"id": 8, "amount": 6, "region": "north"}, {"id": 9, "amount": 4, "region": "south"}]
+    assert model.get_rows("missing", {"startRow": 0, "endRow": 3}) is None
+
+
+def test_views_share_one_copy_of_the_table(store, monkeypatch):
+    model = RowModel(store)
+    reads = []
+    get_arrow = store.get_arrow
+    monkeypatch.setattr(store, "get_arrow", lambda key: reads.append(key) or get_arrow(key))
+    for column in ("id", "amount", "region"):
+        for direction in ("asc", "desc"):
+            model.get_rows("orders", {"startRow": 0, "endRow": 5, "sortModel": [{"colId": column, "sort": direction}]})
+    assert reads == ["orders"]
+    tables = [value for key, (value, _) in model._cache.items() if key[0] == "table"]
+    assert len(tables) == 1
+
+
+def test_cache_is_bounded_by_bytes(store):
+    model = RowModel(store, cache_bytes=1)
+    request = {"startRow": 0, "endRow": 2, "sortModel": [{"colId": "amount", "sort": "asc"}]}
+    assert [row["amount"] for row in model.get_rows("orders", request)["rowData"]] == [0, 1]
+    # Only the newest entry is kept once the cache is over its limit.
+    assert len(model._cache) == 1
+    assert [row["amount"] for row in model.get_rows("orders", request)["rowData"]] == [0, 1]
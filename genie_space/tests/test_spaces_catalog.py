@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from spaces_catalog import SpacesCatalog
+
+
+class _Client:
+    def __init__(self, titles):
+        self.spaces = [{"space_id": f"id-{i}", "title": title, "description": f"About {title.lower()}", "warehouse_id": "w"}
+                       for i, title in enumerate(titles)]
+        self.calls = 0
+
+    def list_spaces_page(self, page_size, page_token=None):
+        self.calls += 1
+        start = int(page_token or 0)
+        end = start + page_size
+        return self.spaces[start:end], (str(end) if end < len(self.spaces) else None)
+
+
+def _wait_complete(catalog, scope, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        entry = catalog.cache.get(scope)
+        if entry is not None and entry["complete"]:
+            return entry
+        time.sleep(0.02)
+    raise AssertionError("the catalog was not completed")
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = SpacesCatalog(str(tmp_path), first_page_size=2, page_size=2)
+    yield catalog
+    catalog.cache.close()
+
+
+def test_first_page_is_listed_now_and_the_rest_in_the_background(catalog):
+    client = _Client(["Sales", "finance", "Marketing", "Supply chain", "HR"])
+    first = catalog.first_page("user:a", client)
+    assert [s["title"] for s in first] == ["finance", "Sales"]
+    assert set(first[0]) == {"space_id", "title", "description"}
+    entry = _wait_complete(catalog, "user:a")
+    assert [s["title"] for s in entry["spaces"]] == ["finance", "HR", "Marketing", "Sales", "Supply chain"]
+    assert client.calls == 3
+    assert [s["title"] for s in catalog.first_page("user:a", client)] == ["finance", "HR"]
+    assert client.calls == 3
+
+
+def test_search_ranks_title_matches_first(catalog):
+    client = _Client(["Sales", "Regional sales", "Wholesale", "Finance"])
+    catalog.first_page("user:a", client)
+    _wait_complete(catalog, "user:a")
+    assert [s["title"] for s in catalog.search("user:a", "sale")] == ["Sales", "Regional sales", "Wholesale"]
+    assert [s["title"] for s in catalog.search("user:a", "about fin")] == ["Finance"]
+    assert len(catalog.search("user:a", "", limit=2)) == 2
+    assert catalog.search("user:b", "sales") == []
+    assert catalog.get_space("user:a", "id-3")["title"] == "Finance"
+    assert catalog.get_space("user:b", "id-3") is None
+
+
+def test_locks_and_counters_are_not_entries(tmp_path):
+    catalog = SpacesCatalog(str(tmp_path), ttl_seconds=0, stale_seconds=60, first_page_size=2, page_size=2)
+    catalog.first_page("user:a", _Client(["Sales", "Finance"]))
+    catalog.first_page("user:a", _Client(["Sales", "Finance"]))
+    assert catalog.cache.meta.add("__loading__:user:b", True)
+    stats = catalog.stats()
+    assert stats["entries"] == 1 and stats["hits"] == 1 and stats["misses"] == 1
+    catalog.cache.reset("size_limit", 0)
+    catalog.cache.cull()
+    assert catalog.stats()["entries"] == 0 and catalog.stats()["hits"] == 1
+    assert not catalog.cache.meta.add("__loading__:user:b", True)
+    catalog.cache.close()
@@ -0,0 +1,52 @@
+import gzip
+import io
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from table_export import TableExporter
+from table_store import TableStore
+
+ORDERS = pd.DataFrame({"id": [1, 2, 3], "region": ["north", "south", None]})
+
+
+@pytest.fixture
+def exporter(tmp_path):
+    store = TableStore(str(tmp_path / "tables"))
+    store.put("orders", ORDERS)
+    exporter = TableExporter(store, str(tmp_path / "exports"))
+    yield exporter
+    exporter.cache.close()
+    store.cache.close()
+
+
+@pytest.mark.parametrize("fmt", ["csv", "csv.gz", "parquet", "xlsx"])
+def test_streamed_export_is_cached(exporter, fmt):
+    assert exporter.cached_path("orders", fmt) is None
+    data = b"".join(exporter.stream("orders", fmt))
+    path = exporter.cached_path("orders", fmt)
+    with open(path, "rb") as f:
+        assert f.read() == data
+    if fmt == "csv.gz":
+        data = gzip.decompress(data)
+    if fmt.startswith("csv"):
+        assert data.decode().splitlines() == ['"id","region"', '1,"north"', '2,"south"', "3,"]
+    elif fmt == "parquet":
+        assert pq.read_table(io.BytesIO(data)).to_pandas().equals(ORDERS)
+    assert exporter.stats()["hits"] == 1 and exporter.stats()["misses"] == 1
+
+
+def test_abandoned_download_is_not_cached(exporter):
+    chunks = exporter.stream("orders", "csv")
+    next(chunks)
+    chunks.close()
+    assert exporter.cached_path("orders", "csv") is None
+
+
+def test_build_writes_the_file_once(exporter):
+    path = exporter.build("orders", "parquet")
+    assert path == exporter.build("orders", "parquet")
+    assert exporter.build("missing", "csv") is None
+    with pytest.raises(ValueError):
+        exporter.build("orders", "json")